@@ -0,0 +1,151 @@
+"""Import-time / cold-start benchmark for each Lambda handler bundle.
+
+Builds each function's bundle the same way the stacks do (lambda_bundles),
+then in fresh interpreters measures:
+
+- the `python -X importtime` breakdown of importing the handler,
+- init duration (handler import wall time) over several runs,
+- the cost of work the handlers defer to first use (boto3 clients).
+
+Usage:
+    python -m benchmarks.cold_start [--runs 5] [--top 12] [--json results.json]
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+from chat_ops_service_now_dev_ops_agent_integration.lambda_bundles import LAMBDA_DIR, handler_files
+
+HANDLERS = {
+    "receiver": "receiver_middleware_lambda",
+    "worker": "worker_middleware_lambda",
+    "middleware": "servicenow-devops-middleware",
+}
+
+# Clients each handler creates on its first real invocation
+DEFERRED_CLIENTS = {
+    "receiver": ["secretsmanager", "dynamodb", "sqs"],
+    "worker": ["secretsmanager", "dynamodb"],
+    "middleware": ["secretsmanager", "dynamodb"],
+}
+
+BENCH_ENV = {
+    "AWS_DEFAULT_REGION": "us-east-1",
+    "AWS_ACCESS_KEY_ID": "bench",
+    "AWS_SECRET_ACCESS_KEY": "bench",
+    "SECRET_ARN": "arn:aws:secretsmanager:us-east-1:000000000000:secret:bench",
+    "SQS_QUEUE_URL": "https://sqs.us-east-1.amazonaws.com/000000000000/bench",
+}
+
+
+def build_bundle(handler_module, dest):
+    for name in handler_files(handler_module):
+        shutil.copy(os.path.join(LAMBDA_DIR, name), dest)
+    return sorted(os.listdir(dest))
+
+
+def _run(bundle_dir, code, *flags):
+    env = dict(os.environ, PYTHONPATH=bundle_dir, PYTHONDONTWRITEBYTECODE="1", **BENCH_ENV)
+    return subprocess.run(
+        [sys.executable, *flags, "-c", code], cwd=bundle_dir, env=env, capture_output=True, text=True, check=True
+    )
+
+
+def importtime_breakdown(bundle_dir, module, top):
+    """Top-level imports by cumulative time (microseconds) from `python -X importtime`."""
+    result = _run(bundle_dir, f"import importlib; importlib.import_module({module!r})", "-X", "importtime")
+    top_level = []
+    for line in result.stderr.splitlines():
+        # "import time:   self |   cumulative | <two spaces per nesting level>name"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if len(name) - len(name.lstrip()) == 1:
+            top_level.append({"module": name.strip(), "self_us": int(self_us), "cumulative_us": int(cumulative_us)})
+    total = sum(row["cumulative_us"] for row in top_level)
+    return total, sorted(top_level, key=lambda row: row["cumulative_us"], reverse=True)[:top]
+
+
+def init_durations(bundle_dir, module, runs):
+    code = (
+        "import time, importlib; t = time.perf_counter(); "
+        f"importlib.import_module({module!r}); print((time.perf_counter() - t) * 1000)"
+    )
+    return [float(_run(bundle_dir, code).stdout.strip()) for _ in range(runs)]
+
+
+def deferred_client_cost(bundle_dir, services):
+    """Time to import boto3 and build each client the handler creates lazily (ms)."""
+    code = (
+        "import json, time; t = time.perf_counter(); import boto3\n"
+        "out = {'import boto3': (time.perf_counter() - t) * 1000}\n"
+        f"for name in {services!r}:\n"
+        "    t = time.perf_counter(); boto3.client(name); out[name] = (time.perf_counter() - t) * 1000\n"
+        "print(json.dumps(out))"
+    )
+    try:
+        return json.loads(_run(bundle_dir, code).stdout)
+    except subprocess.CalledProcessError:
+        return {"error": "boto3 not installed"}
+
+
+def benchmark(runs, top):
+    results = {}
+    for name, module in HANDLERS.items():
+        with tempfile.TemporaryDirectory() as bundle_dir:
+            files = build_bundle(module, bundle_dir)
+            size = sum(os.path.getsize(os.path.join(bundle_dir, f)) for f in files)
+            total_us, breakdown = importtime_breakdown(bundle_dir, module, top)
+            durations = init_durations(bundle_dir, module, runs)
+            results[name] = {
+                "handler": module,
+                "bundle_files": files,
+                "bundle_bytes": size,
+                "importtime_total_ms": round(total_us / 1000, 2),
+                "importtime_top": breakdown,
+                "init_ms": {
+                    "min": round(min(durations), 2),
+                    "median": round(statistics.median(durations), 2),
+                    "max": round(max(durations), 2),
+                },
+                "deferred_clients_ms": {
+                    k: round(v, 2) if isinstance(v, float) else v
+                    for k, v in deferred_client_cost(bundle_dir, DEFERRED_CLIENTS[name]).items()
+                },
+            }
+    return results
+
+
+def print_report(results):
+    for name, r in results.items():
+        print(f"\n== {name} ({r['handler']}) ==")
+        print(f"bundle: {len(r['bundle_files'])} files, {r['bundle_bytes']} bytes")
+        init = r["init_ms"]
+        print(f"init (handler import): median {init['median']} ms  [min {init['min']}, max {init['max']}]")
+        print(f"importtime total: {r['importtime_total_ms']} ms")
+        for row in r["importtime_top"]:
+            print(f"  {row['cumulative_us'] / 1000:8.2f} ms  {row['module']}")
+        print("deferred to first use: " + ", ".join(f"{k} {v} ms" for k, v in r["deferred_clients_ms"].items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per handler for init timing")
+    parser.add_argument("--top", type=int, default=12, help="imports to show in the breakdown")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args(argv)
+
+    results = benchmark(args.runs, args.top)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
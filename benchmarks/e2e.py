@@ -0,0 +1,626 @@
+"""End-to-end benchmark of the three handlers against local stand-ins.
+
+Scenarios:
+
+- slack: signed Slack slash commands (/ops-status, /ops-resolve) go through
+  receiver_middleware_lambda; queued ones are delivered in SQS batches to
+  worker_middleware_lambda, which answers on the Slack `response_url`.
+- events: ServiceNow Business Rule payloads are delivered in SQS batches to
+  servicenow-devops-middleware, which forwards them to the agent webhook.
+
+ServiceNow, Slack and the agent webhook are local HTTP stand-ins (see
+standins.py); Secrets Manager and SQS are in-memory stubs. Failed records are
+redelivered like SQS does, up to --max-receives.
+
+Reports throughput, p50/p95/p99 per stage and outbound call counts, and can
+save or compare a baseline:
+
+    python -m benchmarks.e2e --save-baseline default
+    python -m benchmarks.e2e --compare default --fail-on-regression
+    python -m benchmarks.e2e --fault servicenow:latency_ms=150,throttle_rate=0.05
+"""
+import argparse
+import hashlib
+import hmac
+import importlib
+import json
+import logging
+import math
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from benchmarks.standins import (
+    AgentStandIn, Faults, SecretsManagerStub, ServiceNowStandIn, SlackStandIn, SQSStub
+)
+from chat_ops_service_now_dev_ops_agent_integration.ingest_template import MESSAGE_ATTRIBUTES, EdgeFilter, route
+from chat_ops_service_now_dev_ops_agent_integration.lambda_bundles import LAMBDA_DIR, local_modules
+
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+
+SIGNING_SECRET = "bench-signing-secret"
+
+DEFAULT_FAULTS = {
+    "servicenow": "latency_ms=60,jitter_ms=40",
+    "slack": "latency_ms=20,jitter_ms=10",
+    "agent": "latency_ms=40,jitter_ms=20",
+}
+
+# Latency changes smaller than this (ms) are noise, whatever the relative change
+NOISE_FLOOR_MS = 5
+
+
+def parse_faults(spec, seed):
+    """"latency_ms=60,jitter_ms=40,throttle_rate=0.02" -> Faults(...)"""
+    options = {}
+    for item in filter(None, spec.split(",")):
+        name, value = item.split("=", 1)
+        options[name.strip()] = float(value)
+    return Faults(seed=seed, **options)
+
+
+def percentiles(values):
+    values = sorted(values)
+
+    def pick(pct):
+        return round(values[max(0, math.ceil(pct / 100 * len(values)) - 1)] * 1000, 1)
+
+    if not values:
+        return {"count": 0}
+    return {"count": len(values), "p50": pick(50), "p95": pick(95), "p99": pick(99), "max": pick(100)}
+
+
+class Harness:
+    """Stand-ins, stubs and freshly imported handlers for one scenario run."""
+
+    def __init__(self, args, seed_offset=0):
+        self.args = args
+        seed = args.seed + seed_offset
+        faults = dict(DEFAULT_FAULTS, **dict(spec.split(":", 1) for spec in args.fault))
+        self.servicenow = ServiceNowStandIn(faults=parse_faults(faults["servicenow"], seed))
+        self.slack = SlackStandIn(faults=parse_faults(faults["slack"], seed + 1))
+        self.agent = AgentStandIn(faults=parse_faults(faults["agent"], seed + 2))
+        self.random = random.Random(seed)
+        self.duplicates = random.Random(seed + 3)
+        self.poison = random.Random(seed + 5)
+        self.sqs = SQSStub()
+        # Business Rule events by lane; with --priority-lanes P1s get their own queue and pollers
+        # (--fifo: FIFO queues with content-based dedup, grouped by incident sys_id)
+        self.lanes = {"normal": SQSStub(fifo=True) if args.fifo else self.sqs}
+        if args.priority_lanes:
+            self.lanes["high"] = SQSStub(fifo=args.fifo)
+        self.secretsmanager = SecretsManagerStub({
+            "slack_signing_secret": SIGNING_SECRET,
+            "sn_instance": "bench", "sn_user": "bench", "sn_pass": "bench",
+            "webhook_url": f"{self.agent.url}/webhook",
+            "secret_string": "bench-webhook-secret",
+        })
+        self.stages = {}
+        # Per function: invocations, billed wall time and CPU time of the invoking thread (cost model input)
+        self.invocations = {}
+        self.results = {"failed_records": 0, "redelivered": 0, "dead_lettered": 0}
+        self.emf = {"lines": 0, "bytes": 0}
+        self.trace_logs = {"lines": 0, "bytes": 0}
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        for stand_in in (self.servicenow, self.slack, self.agent):
+            stand_in.__enter__()
+        self.handlers = self._import_handlers()
+        return self
+
+    def __exit__(self, *exc):
+        for stand_in in (self.servicenow, self.slack, self.agent):
+            stand_in.__exit__(*exc)
+
+    def _import_handlers(self):
+        # Fresh module state (caches, pools, secret cache) for every scenario: each starts cold
+        os.environ.update({
+            "SECRET_ARN": "arn:aws:secretsmanager:us-east-1:000000000000:secret:bench",
+            "SQS_QUEUE_URL": "https://sqs.us-east-1.amazonaws.com/000000000000/bench",
+            "SERVICENOW_BASE_URL": self.servicenow.url,
+            # Concurrent invocations share this one process, while on Lambda each has its
+            # own container: give the per-container concurrency limit their combined room
+            "CONCURRENCY_LIMIT_MAX": str(10 * max(self.args.lambda_concurrency, self.args.concurrency)),
+            "SN_RATE_LIMIT_PER_SECOND": str(self.args.sn_rate_limit),
+            "SN_RATE_LIMIT_BURST": str(2 * self.args.sn_rate_limit),
+            "AWS_LAMBDA_INITIALIZATION_TYPE": self.args.init or "on-demand",
+            "PREWARM_CONNECTIONS": str(self.args.prewarm).lower(),
+            "SLACK_PREWARM_URL": f"{self.slack.url}/",
+        })
+        for name in local_modules():
+            sys.modules.pop(name, None)
+        if LAMBDA_DIR not in sys.path:
+            sys.path.insert(0, LAMBDA_DIR)
+        aws_clients = importlib.import_module("aws_clients")
+        aws_clients._CLIENTS.update(secretsmanager=self.secretsmanager, sqs=self.sqs)
+        # EMF lines are counted (their volume is part of the cost) instead of printed
+        importlib.import_module("metrics").write_line = self.metric_line
+        logging.getLogger().setLevel(logging.INFO if self.args.verbose else logging.CRITICAL)
+        handlers = {}
+        for name, module in (("receiver", "receiver_middleware_lambda"), ("worker", "worker_middleware_lambda"),
+                             ("middleware", "servicenow-devops-middleware")):
+            started = time.perf_counter()
+            handlers[name] = importlib.import_module(module).lambda_handler
+            if self.args.init:
+                self.record(f"init {name}", time.perf_counter() - started)
+        if self.args.init == "snap-start":
+            # Snapshot, then restore: sockets and the secret are dropped and rebuilt before any traffic
+            warm_start = importlib.import_module("warm_start")
+            warm_start.run_before_snapshot()
+            started = time.perf_counter()
+            warm_start.run_after_restore()
+            self.record("restore", time.perf_counter() - started)
+        return handlers
+
+    def record(self, stage, seconds):
+        with self._lock:
+            self.stages.setdefault(stage, []).append(seconds)
+
+    def metric_line(self, line):
+        is_trace = line.startswith('{"trace":')
+        with self._lock:
+            logs = self.trace_logs if is_trace else self.emf
+            logs["lines"] += 1
+            logs["bytes"] += len(line) + 1
+        if is_trace:
+            # Per-request trace records (lambda/tracing.py): time spent in each hop
+            trace = json.loads(line)
+            if trace["outcome"] not in ("duplicate", "superseded", "postponed"):
+                for hop, ms in trace["hops"].items():
+                    self.record(f"{trace['trace']} {hop} hop", ms / 1000)
+
+    def invoke(self, handler_name, event):
+        """Call a handler like Lambda would, recording its duration and CPU time."""
+        with self._lock:
+            first = self.args.init and handler_name not in self.invocations
+            self.invocations.setdefault(handler_name, {"count": 0, "wall_s": 0.0, "cpu_s": 0.0})
+        started, cpu = time.perf_counter(), time.thread_time()
+        try:
+            return self.handlers[handler_name](event, None)
+        finally:
+            wall, cpu = time.perf_counter() - started, time.thread_time() - cpu
+            if first:
+                self.record(f"{handler_name} first", wall)
+            with self._lock:
+                totals = self.invocations[handler_name]
+                totals["count"] += 1
+                totals["wall_s"] += wall
+                totals["cpu_s"] += cpu
+
+    def count(self, result, n=1):
+        with self._lock:
+            self.results[result] = self.results.get(result, 0) + n
+
+    # --- SQS -> Lambda delivery ---
+
+    def invoke_batch(self, handler_name, batch, queue=None):
+        started = time.perf_counter()
+        try:
+            response = self.invoke(handler_name, {"Records": batch})
+            failed_ids = {f["itemIdentifier"] for f in (response or {}).get("batchItemFailures", [])}
+        except Exception:
+            failed_ids = {message["messageId"] for message in batch}
+        queue = self.sqs if queue is None else queue
+        self.record(f"{handler_name} batch", time.perf_counter() - started)
+        self.count("batches")
+        self.count("batched_records", len(batch))
+        for message in batch:
+            if message["messageId"] not in failed_ids:
+                if message["attributes"]["ApproximateReceiveCount"] == "1" and self._duplicate():
+                    # At-least-once delivery: a processed message comes back anyway
+                    self.count("duplicates")
+                    queue.redeliver(message, self.args.visibility_timeout_ms / 1000)
+                else:
+                    queue.delete_message(message)
+                continue
+            self.count("failed_records")
+            if int(message["attributes"]["ApproximateReceiveCount"]) >= self.args.max_receives:
+                self.count("dead_lettered")
+                queue.delete_message(message)
+            else:
+                self.count("redelivered")
+                delay = self.args.visibility_timeout_ms / 1000
+                postponed = self.sqs.postponed_for(message)
+                if postponed is not None:
+                    # Handler-requested visibility, compressed to benchmark time
+                    self.count("postponed")
+                    delay = postponed * self.args.postpone_scale
+                queue.redeliver(message, delay)
+
+    def _duplicate(self):
+        with self._lock:
+            return self.duplicates.random() < self.args.duplicate_rate
+
+    def poll(self, handler_name, producers_done, queue=None, concurrency=None, batch_size=None, batch_window_ms=None):
+        """Deliver queued messages in batches to handler_name until the producers are done and the queue drains.
+
+        Defaults to the main queue and the --lambda-concurrency/--batch-size/--batch-window-ms event source settings.
+        """
+        queue = self.sqs if queue is None else queue
+        concurrency = concurrency or self.args.lambda_concurrency
+        batch_size = batch_size or self.args.batch_size
+        window = (self.args.batch_window_ms if batch_window_ms is None else batch_window_ms) / 1000
+        in_flight = threading.Semaphore(concurrency)
+        pending = []
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            while True:
+                pending = [f for f in pending if not f.done()]
+                batch = queue.receive(batch_size, window)
+                if batch:
+                    in_flight.acquire()
+                    future = pool.submit(self.invoke_batch, handler_name, batch, queue)
+                    future.add_done_callback(lambda _: in_flight.release())
+                    pending.append(future)
+                elif producers_done.is_set() and not pending and not len(queue):
+                    return
+                else:
+                    time.sleep(0.002)
+
+    # --- Scenarios ---
+
+    def signed_command(self, command, ticket, user_id, response_url):
+        body = urlencode({
+            "command": command, "text": ticket, "user_id": user_id, "response_url": response_url,
+        })
+        timestamp = str(int(time.time()))
+        signature = "v0=" + hmac.new(
+            SIGNING_SECRET.encode('utf-8'), f"v0:{timestamp}:{body}".encode('utf-8'), hashlib.sha256
+        ).hexdigest()
+        return {
+            "headers": {"X-Slack-Request-Timestamp": timestamp, "X-Slack-Signature": signature},
+            "body": body,
+            "isBase64Encoded": False,
+        }
+
+    def run_slack(self):
+        args = self.args
+        tickets = [f"INC{n:07d}" for n in range(1, args.tickets + 1)]
+        for number in tickets:
+            self.servicenow.add(number, short_description=f"Bench incident {number}")
+        commands = [
+            ("/ops-status" if self.random.random() < args.status_ratio else "/ops-resolve",
+             self.random.choice(tickets), f"U{self.random.randrange(args.users):04d}")
+            for _ in range(args.commands)
+        ]
+        if args.bulk_ratio:
+            # Bulk commands name --bulk-size tickets in one command ("INC..., INC...")
+            bulk = random.Random(args.seed + 4)
+            commands = [
+                (command, ", ".join(bulk.sample(tickets, min(args.bulk_size, len(tickets)))), user_id)
+                if bulk.random() < args.bulk_ratio else (command, ticket, user_id)
+                for command, ticket, user_id in commands
+            ]
+        sent_at = {}
+
+        def send(i):
+            command, ticket, user_id = commands[i]
+            path = f"/response/{i}"
+            event = self.signed_command(command, ticket, user_id, f"{self.slack.url}{path}")
+            started = sent_at[path] = time.perf_counter()
+            response = self.invoke("receiver", event)
+            elapsed = time.perf_counter() - started
+            self.record("receiver", elapsed)
+            text = json.loads(response.get("body") or "{}").get("text", "")
+            if text.startswith("⏳"):
+                self.count("queued")
+            else:
+                self.count("inline")
+                self.record("end to end", elapsed)
+                sent_at.pop(path)
+
+        producers_done = threading.Event()
+        consumer = threading.Thread(target=self.poll, args=("worker", producers_done))
+        started = time.perf_counter()
+        consumer.start()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            list(pool.map(send, range(len(commands))))
+        producers_done.set()
+        consumer.join()
+        duration = time.perf_counter() - started
+
+        for path, sent in sent_at.items():
+            arrived = self.slack.arrivals.get(path)
+            if arrived is None:
+                self.count("unanswered")
+            else:
+                self.record("end to end", arrived - sent)
+        return len(commands), duration
+
+    def priority(self):
+        if self.args.p1_ratio is None:
+            return self.random.choice(["1", "2", "3", "4"])
+        return "1" if self.random.random() < self.args.p1_ratio else self.random.choice(["2", "3", "4"])
+
+    def run_events(self):
+        args = self.args
+        incidents = [
+            {"number": f"INC{n:07d}", "sys_id": f"{n:032x}", "priority": self.priority()}
+            for n in range(1, args.incidents + 1)
+        ]
+        revisions = {incident["number"]: 0 for incident in incidents}
+        # sys_mod_count as the Business Rule sends it: every update bumps it
+        updates = {incident["number"]: 0 for incident in incidents}
+        first_sent = {}
+
+        def event(i):
+            incident = self.random.choice(incidents)
+            number = incident["number"]
+            roll = self.random.random()
+            event_type = "incident_updated"
+            if roll < args.resolve_ratio:
+                event_type = "incident_resolved"
+            if roll >= args.resolve_ratio + args.noop_ratio or event_type == "incident_resolved":
+                revisions[number] += 1
+            updates[number] += 1
+            description = f"{number} revision {revisions[number]}"
+            return description, {
+                "event_type": event_type,
+                "incident": {**incident, "short_description": f"Bench incident {number}", "description": description,
+                             "sys_mod_count": str(updates[number])},
+            }
+
+        events = [event(i) for i in range(args.events)]
+        priorities = {description: body["incident"]["priority"] for description, body in events}
+        producers_done = threading.Event()
+        consumers = [threading.Thread(target=self.poll, args=("middleware", producers_done),
+                                      kwargs=dict(queue=self.lanes["normal"]))]
+        if "high" in self.lanes:
+            # Mirrors the stack's high-lane event source: small batches, no batching window
+            consumers.append(threading.Thread(target=self.poll, args=("middleware", producers_done), kwargs=dict(
+                queue=self.lanes["high"], concurrency=args.high_lane_concurrency, batch_size=5, batch_window_ms=0,
+            )))
+        started = time.perf_counter()
+        for consumer in consumers:
+            consumer.start()
+        interval = 1 / args.event_rate if args.event_rate else 0
+        edge_filter = EdgeFilter.from_context(args.edge_filter)
+        for i, (description, body) in enumerate(events):
+            # What the API Gateway request template does: filter, route, attach attributes
+            if edge_filter.drops(body):
+                self.count("dropped_at_edge")
+            else:
+                first_sent.setdefault(description, time.perf_counter())
+                lane = route(body, ["1"]) if "high" in self.lanes else "normal"
+                options = {"MessageAttributes": edge_attributes(body)}
+                if args.fifo:
+                    options["MessageGroupId"] = body["incident"]["sys_id"]
+                message_body = json.dumps(body)
+                if self.poison.random() < args.poison_rate:
+                    # A payload no retry can fix: the middleware should dead-letter it on first sight
+                    message_body = message_body[:-1]
+                    self.count("poisoned")
+                self.lanes[lane].send_message(QueueUrl="bench", MessageBody=message_body, **options)
+            if interval:
+                time.sleep(max(0.0, started + (i + 1) * interval - time.perf_counter()))
+        producers_done.set()
+        for consumer in consumers:
+            consumer.join()
+        duration = time.perf_counter() - started
+        if args.fifo:
+            self.count("deduplicated", sum(queue.deduplicated for queue in self.lanes.values()))
+
+        for description, sent in first_sent.items():
+            arrived = self.agent.arrivals.get(description)
+            if arrived is None:
+                self.count("not_forwarded")
+            else:
+                self.record("end to end", arrived - sent)
+                if priorities[description] == "1":
+                    self.record("end to end P1", arrived - sent)
+
+        # A newer revision of an incident reaching the agent before an older one
+        arrivals = {}
+        for description in first_sent:
+            number, _, revision = description.split(" ")
+            if description in self.agent.arrivals:
+                arrivals.setdefault(number, []).append((int(revision), self.agent.arrivals[description]))
+        out_of_order = sum(
+            1 for revisions in arrivals.values()
+            for (_, earlier), (_, later) in zip(sorted(revisions), sorted(revisions)[1:]) if later < earlier
+        )
+        self.count("out_of_order", out_of_order)
+        return len(events), duration
+
+    def report(self, scenario, total, duration):
+        # Permanent failures the handlers sent straight to a DLQ, without retries
+        self.count("isolated", len(self.sqs.dead_letters))
+        return {
+            "scenario": scenario,
+            "requests": total,
+            "duration_s": round(duration, 3),
+            "throughput_per_s": round(total / duration, 1) if duration else None,
+            "stages": {stage: percentiles(values) for stage, values in sorted(self.stages.items())},
+            "outbound": {
+                "servicenow": self.servicenow.outbound(),
+                "slack": self.slack.outbound(),
+                "agent": self.agent.outbound(),
+                "sqs send_message": sum(queue.sent for queue in self.lanes.values()),
+                "sqs change_message_visibility": self.sqs.visibility_changes,
+                "secretsmanager get_secret_value": self.secretsmanager.calls,
+                "emf": dict(self.emf),
+                "trace logs": dict(self.trace_logs),
+            },
+            "invocations": {
+                name: {
+                    "count": t["count"], "wall_ms": round(t["wall_s"] * 1000, 1), "cpu_ms": round(t["cpu_s"] * 1000, 1),
+                }
+                for name, t in sorted(self.invocations.items())
+            },
+            "results": dict(sorted(self.results.items())),
+        }
+
+
+def edge_attributes(body):
+    attributes = {
+        "correlation_id": {"DataType": "String", "StringValue": uuid.uuid4().hex},
+        "received_at": {"DataType": "Number", "StringValue": str(int(time.time() * 1000))},
+    }
+    for name, path in MESSAGE_ATTRIBUTES:
+        value = body
+        for part in path[2:].split("."):
+            value = value.get(part, {}) if isinstance(value, dict) else {}
+        if value not in ({}, "", None):
+            attributes[name] = {"DataType": "String", "StringValue": str(value)}
+    return attributes
+
+
+SCENARIOS = {"slack": Harness.run_slack, "events": Harness.run_events}
+
+
+def run(args):
+    results = {}
+    for offset, scenario in enumerate(args.scenario or list(SCENARIOS)):
+        with Harness(args, seed_offset=offset * 10) as harness:
+            total, duration = SCENARIOS[scenario](harness)
+            results[scenario] = harness.report(scenario, total, duration)
+    return results
+
+
+def print_report(results):
+    for result in results.values():
+        print(f"\n== {result['scenario']}: {result['requests']} requests in {result['duration_s']}s "
+              f"({result['throughput_per_s']}/s) ==")
+        print(f"{'stage':<36}{'count':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+        for stage, p in result["stages"].items():
+            print(f"{stage:<36}{p['count']:>7}{p.get('p50', '-'):>9}{p.get('p95', '-'):>9}"
+                  f"{p.get('p99', '-'):>9}{p.get('max', '-'):>9}")
+        print("outbound:")
+        for target, counts in result["outbound"].items():
+            print(f"  {target}: {counts}")
+        print(f"results: {result['results']}")
+
+
+def _outbound_totals(result):
+    totals = {}
+    for target, counts in result["outbound"].items():
+        if isinstance(counts, dict):
+            for call, n in counts.items():
+                totals[f"{target} {call}"] = n
+        else:
+            totals[target] = counts
+    return totals
+
+
+def compare(results, baseline, tolerance):
+    """Print current vs baseline; returns the list of regressions."""
+    regressions = []
+    for scenario, result in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            print(f"\n{scenario}: no baseline")
+            continue
+        print(f"\n== {scenario} vs baseline ==")
+        rows = [("throughput_per_s", base["throughput_per_s"], result["throughput_per_s"], "higher")]
+        for stage, p in result["stages"].items():
+            for pct in ("p50", "p95", "p99"):
+                # p99 of a few hundred samples is a handful of requests: shown, never flagged
+                better = "lower" if pct != "p99" else None
+                rows.append((f"{stage} {pct}", base["stages"].get(stage, {}).get(pct), p.get(pct), better))
+        base_calls, calls = _outbound_totals(base), _outbound_totals(result)
+        for call in sorted(set(base_calls) | set(calls)):
+            rows.append((call, base_calls.get(call, 0), calls.get(call, 0), "calls"))
+
+        for name, before, after, better in rows:
+            if before is None or after is None:
+                continue
+            delta = (after - before) / before * 100 if before else (100.0 if after else 0.0)
+            if better == "higher":
+                worse = after < before * (1 - tolerance)
+            elif better == "lower":
+                worse = after > before * (1 + tolerance) and after - before > NOISE_FLOOR_MS
+            elif better == "calls":
+                # Injected faults are inputs, not calls the handlers chose to make
+                worse = after > before * (1 + tolerance) and " injected " not in name
+            else:
+                worse = False
+            flag = "  REGRESSION" if worse else ""
+            print(f"  {name:<44}{before:>10}{after:>10}{delta:>+9.1f}%{flag}")
+            if worse:
+                regressions.append(f"{scenario}: {name} {before} -> {after}")
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", action="append", choices=sorted(SCENARIOS), help="default: all")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--commands", type=int, default=300, help="Slack commands (slack scenario)")
+    parser.add_argument("--tickets", type=int, default=40, help="distinct tickets the commands refer to")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--status-ratio", type=float, default=0.7, help="share of /ops-status commands")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent receiver invocations")
+    parser.add_argument("--bulk-ratio", type=float, default=0, help="share of commands naming several tickets")
+    parser.add_argument("--bulk-size", type=int, default=20, help="tickets per bulk command")
+    parser.add_argument("--events", type=int, default=500, help="Business Rule events (events scenario)")
+    parser.add_argument("--incidents", type=int, default=60)
+    parser.add_argument("--resolve-ratio", type=float, default=0.1)
+    parser.add_argument("--noop-ratio", type=float, default=0.3, help="share of updates with no agent-visible change")
+    parser.add_argument("--event-rate", type=float, default=200, help="events per second (0 = as fast as possible)")
+    parser.add_argument("--batch-size", type=int, default=10)
+    parser.add_argument("--batch-window-ms", type=float, default=20)
+    parser.add_argument("--lambda-concurrency", type=int, default=4, help="concurrent SQS-triggered invocations")
+    parser.add_argument("--edge-filter", metavar="JSON",
+                        help='events dropped at the API Gateway edge, e.g. \'{"drop_priorities": ["4"]}\'')
+    parser.add_argument("--fifo", action="store_true",
+                        help="events scenario: FIFO ingest queues (MessageGroupId = incident sys_id)")
+    parser.add_argument("--p1-ratio", type=float, help="share of P1 incidents (default: priorities 1-4 equally likely)")
+    parser.add_argument("--priority-lanes", action="store_true",
+                        help="events scenario: P1 incidents go to a separate high-priority queue")
+    parser.add_argument("--high-lane-concurrency", type=int, default=2,
+                        help="concurrent invocations for the high-priority queue")
+    parser.add_argument("--visibility-timeout-ms", type=float, default=200,
+                        help="delay before a failed record is redelivered")
+    parser.add_argument("--postpone-scale", type=float, default=0.01,
+                        help="benchmark seconds per second of visibility a handler postpones a record by")
+    parser.add_argument("--max-receives", type=int, default=3,
+                        help="deliveries before a record counts as dead-lettered")
+    parser.add_argument("--poison-rate", type=float, default=0,
+                        help="share of events sent as malformed JSON (events scenario)")
+    parser.add_argument("--duplicate-rate", type=float, default=0,
+                        help="share of processed messages SQS delivers a second time")
+    parser.add_argument("--sn-rate-limit", type=float, default=0,
+                        help="ServiceNow token bucket, requests per second (0 = off)")
+    parser.add_argument("--init", choices=["on-demand", "provisioned-concurrency", "snap-start"],
+                        help="Lambda init type the handlers see; reports init, restore and first-invocation latency")
+    parser.add_argument("--prewarm", action="store_true",
+                        help="PREWARM_CONNECTIONS=true: open ServiceNow/Slack connections during init or restore")
+    parser.add_argument("--fault", action="append", default=[], metavar="TARGET:OPTIONS",
+                        help="e.g. servicenow:latency_ms=60,jitter_ms=40,error_rate=0.01,throttle_rate=0.02")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--save-baseline", metavar="NAME", help=f"save results as {BASELINE_DIR}/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="compare against a saved baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="relative change tolerated before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="show handler logs")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    results = run(args)
+    print_report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.save_baseline:
+        os.makedirs(BASELINE_DIR, exist_ok=True)
+        with open(os.path.join(BASELINE_DIR, f"{args.save_baseline}.json"), "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False)
+            f.write("\n")
+    if args.compare:
+        with open(os.path.join(BASELINE_DIR, f"{args.compare}.json")) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions and args.fail_on_regression:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
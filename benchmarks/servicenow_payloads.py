@@ -0,0 +1,76 @@
+"""Bytes and parse time of a ServiceNow incident lookup: whole records vs the lean client.
+
+Queries the ServiceNow stand-in (wide, customized incident records) once the
+way the worker used to (every field, reference links, display values) and
+once with servicenow_client's projection, then times parsing each body:
+json.loads of the whole body vs servicenow_client.iter_results over chunks.
+
+Usage:
+    python -m benchmarks.servicenow_payloads [--tickets 10] [--runs 200]
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from urllib.parse import urlencode
+
+import urllib3
+
+from benchmarks.standins import ServiceNowStandIn
+from chat_ops_service_now_dev_ops_agent_integration.lambda_bundles import LAMBDA_DIR
+
+sys.path.insert(0, LAMBDA_DIR)
+from servicenow_client import INCIDENT_FIELDS, INCIDENT_PATH, STREAM_CHUNK_BYTES, iter_results  # noqa: E402
+
+
+def fetch(url, params):
+    return urllib3.PoolManager().request('GET', f"{url}{INCIDENT_PATH}?{urlencode(params)}").data
+
+
+def parse_ms(parse, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        parse()
+        timings.append((time.perf_counter() - started) * 1000)
+    return round(statistics.median(timings), 3)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--tickets", type=int, default=10, help="tickets per lookup (one worker batch)")
+    parser.add_argument("--runs", type=int, default=200)
+    args = parser.parse_args(argv)
+
+    numbers = [f"INC{n:07d}" for n in range(1, args.tickets + 1)]
+    with ServiceNowStandIn() as servicenow:
+        for number in numbers:
+            servicenow.add(number, short_description=f"Bench incident {number}")
+        query = {'sysparm_query': "numberIN" + ",".join(numbers), 'sysparm_limit': len(numbers)}
+        full = fetch(servicenow.url, dict(query, sysparm_display_value='true'))
+        lean = fetch(servicenow.url, dict(
+            query, sysparm_display_value='true', sysparm_fields=",".join(INCIDENT_FIELDS),
+            sysparm_exclude_reference_link='true', sysparm_no_count='true',
+        ))
+
+    def chunks(body):
+        return (body[i:i + STREAM_CHUNK_BYTES] for i in range(0, len(body), STREAM_CHUNK_BYTES))
+
+    def measure(body, parse):
+        return {"bytes": len(body), "parse_ms": parse_ms(parse, args.runs)}
+
+    results = {
+        "whole records": measure(full, lambda: json.loads(full.decode('utf-8'))),
+        "whole records, streamed": measure(full, lambda: list(iter_results(chunks(full)))),
+        "projected": measure(lean, lambda: json.loads(lean.decode('utf-8'))),
+        "projected, streamed": measure(lean, lambda: list(iter_results(chunks(lean)))),
+    }
+    print(f"{args.tickets} tickets per lookup")
+    for name, result in results.items():
+        print(f"  {name:<26}{result['bytes']:>10} bytes{result['parse_ms']:>10} ms")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,455 @@
+"""Local HTTP stand-ins and AWS client stubs for the end-to-end benchmark.
+
+- ServiceNowStandIn: Table API GET/PATCH on incident plus the Batch API, with
+  the wide records of a customized instance unless fields are projected.
+- SlackStandIn: any POST is a `response_url` reply (arrival time recorded per path).
+- AgentStandIn: the DevOps Agent webhook.
+
+Each stand-in can inject latency, server errors and 429s (with Retry-After),
+and counts every request it serves.
+"""
+import base64
+import collections
+import hashlib
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+class Faults:
+    """Latency / error / throttle injection, e.g. Faults(latency_ms=80, jitter_ms=40, throttle_rate=0.02).
+
+    connect_ms is paid once per new connection, like a TLS handshake.
+    """
+
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, throttle_rate=0.0, retry_after=1, connect_ms=0,
+                 seed=None):
+        self.latency_ms = latency_ms
+        self.connect_ms = connect_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def draw(self):
+        """Returns (delay seconds, injected status or None)."""
+        with self._lock:
+            delay = (self.latency_ms + self._random.uniform(0, self.jitter_ms)) / 1000
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return delay, 429
+        if roll < self.throttle_rate + self.error_rate:
+            return delay, 503
+        return delay, None
+
+
+class StandIn:
+    """A threaded HTTP server; subclasses implement handle(method, path, query, body)."""
+
+    name = "stand-in"
+    # Also count response bytes per request kind ("GET incident bytes")
+    count_bytes = False
+
+    def __init__(self, faults=None):
+        self.faults = faults or Faults()
+        self.counts = collections.Counter()
+        self.arrivals = {}
+        self._lock = threading.Lock()
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def setup(self):
+                super().setup()
+                if stand_in.faults.connect_ms:
+                    time.sleep(stand_in.faults.connect_ms / 1000)
+
+            def do_HEAD(self):
+                # Connection pre-warming: no body, no injected faults
+                stand_in.count("HEAD prewarm")
+                self.send_response(200)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def _serve(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length) if length else b''
+                stand_in._serve(self, body)
+
+            do_GET = do_POST = do_PATCH = _serve
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def count(self, key):
+        with self._lock:
+            self.counts[key] += 1
+
+    def _serve(self, request, body):
+        parts = urlsplit(request.path)
+        delay, injected = self.faults.draw()
+        if delay:
+            time.sleep(delay)
+        arrived = time.perf_counter()
+        kind = self.kind(request.command, parts.path)
+        self.count(f"{request.command} {kind}")
+        if injected:
+            self.count(f"injected {injected}")
+            headers = {'Retry-After': str(self.faults.retry_after)} if injected == 429 else {}
+            return self._send(request, injected, {"error": {"message": "injected"}}, headers)
+        key = self.arrival_key(parts.path, body)
+        if key is not None:
+            with self._lock:
+                self.arrivals.setdefault(key, arrived)
+        status, payload = self.handle(request.command, parts.path, parse_qs(parts.query), body, request.headers)
+        if self.count_bytes:
+            payload = json.dumps(payload).encode('utf-8') if not isinstance(payload, bytes) else payload
+            with self._lock:
+                self.counts[f"{request.command} {kind} bytes"] += len(payload)
+        self._send(request, status, payload)
+
+    @staticmethod
+    def _send(request, status, payload, headers=None):
+        data = json.dumps(payload).encode('utf-8') if not isinstance(payload, bytes) else payload
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        request.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            request.send_header(key, value)
+        request.end_headers()
+        request.wfile.write(data)
+
+    def kind(self, method, path):
+        return path
+
+    def arrival_key(self, path, body):
+        """Key under which the first (successful) arrival time is recorded, None to skip."""
+        return None
+
+    def handle(self, method, path, query, body, headers):
+        return 200, {}
+
+    def outbound(self):
+        with self._lock:
+            return dict(sorted(self.counts.items()))
+
+
+class ServiceNowStandIn(StandIn):
+    """ServiceNow incident table in memory; state changes are visible to later queries."""
+
+    name = "servicenow"
+    count_bytes = True
+    STATES = {"7": "Closed", "6": "Resolved", "2": "In Progress", "1": "New"}
+    # A customized incident table: every full record carries these too
+    CUSTOM_FIELDS = 120
+    REFERENCE_FIELDS = ("assigned_to", "assignment_group", "caller_id", "opened_by", "company", "location",
+                        "cmdb_ci", "business_service", "resolved_by", "closed_by", "sys_domain", "problem_id")
+
+    def __init__(self, incidents=(), faults=None):
+        super().__init__(faults)
+        self.incidents = {}
+        for incident in incidents:
+            self.add(**incident)
+
+    def add(self, number, state="New", short_description="", priority="3 - Moderate", sys_id=None, description=""):
+        sys_id = sys_id or uuid.uuid4().hex
+        self.incidents[number] = {
+            "number": number, "sys_id": sys_id, "state": state,
+            "short_description": short_description, "priority": priority, "description": description,
+        }
+        return self.incidents[number]
+
+    def kind(self, method, path):
+        if path.startswith("/api/now/v1/batch"):
+            return "batch"
+        return "incident/{sys_id}" if path.count("/") > 4 else "incident"
+
+    def handle(self, method, path, query, body, headers):
+        if method == "GET" and path == "/api/now/table/incident":
+            return 200, {"result": self._query(query)}
+        if method == "PATCH" and path.startswith("/api/now/table/incident/"):
+            return self._patch(path.rsplit("/", 1)[1], json.loads(body or b'{}'), query)
+        if method == "POST" and path == "/api/now/v1/batch":
+            return 200, self._batch(json.loads(body))
+        return 404, {"error": {"message": "not found"}}
+
+    def _record(self, incident, query):
+        """The incident as the Table API returns it for this query's sysparm_fields / reference links."""
+        fields = query.get('sysparm_fields', [''])[0]
+        if fields:
+            return {name: incident.get(name, "") for name in fields.split(",")}
+        record = dict(incident)
+        links = query.get('sysparm_exclude_reference_link', ['false'])[0] != 'true'
+        for name in self.REFERENCE_FIELDS:
+            value = uuid.UUID(int=hash((incident["sys_id"], name)) & (2 ** 128 - 1)).hex
+            record[name] = {"link": f"{self.url}/api/now/table/sys_user/{value}", "value": value} if links else value
+        for i in range(self.CUSTOM_FIELDS):
+            record[f"u_custom_field_{i}"] = f"Custom value {i} of {incident['number']}: " + "x" * 60
+        return record
+
+    # Encoded query conditions, longest operator first
+    OPERATORS = (
+        ("!=", str.__ne__), (">=", str.__ge__), ("<=", str.__le__),
+        ("IN", lambda value, values: value in values.split(",")),
+        ("=", str.__eq__), (">", str.__gt__), ("<", str.__lt__),
+    )
+
+    def _condition(self, text):
+        for symbol, compare in self.OPERATORS:
+            field, found, value = text.partition(symbol)
+            if found and field.isidentifier():
+                return lambda incident: compare(self._value(incident, field), value)
+        raise ValueError(f"Unsupported condition: {text}")
+
+    def _value(self, incident, field):
+        if field == "active":
+            return "false" if incident["state"] in ("Resolved", "Closed") else "true"
+        return str(incident.get(field, ""))
+
+    def _query(self, query):
+        """Supports what the handlers and the backfill CLI send: `numberIN...`, or conditions
+        (=, !=, >, >=, <, <=, IN) joined by ^ with an optional ORDERBY."""
+        text = query.get('sysparm_query', [''])[0]
+        limit = int(query.get('sysparm_limit', ['10000'])[0])
+        offset = int(query.get('sysparm_offset', ['0'])[0])
+        if text.startswith("numberIN"):
+            with self._lock:
+                found = [dict(self.incidents[n]) for n in text[len("numberIN"):].split(",") if n in self.incidents]
+        else:
+            conditions, order_by = [], None
+            for part in filter(None, text.split("^")):
+                if part.startswith("ORDERBY"):
+                    order_by = part[len("ORDERBY"):]
+                else:
+                    conditions.append(self._condition(part))
+            with self._lock:
+                found = [dict(i) for i in self.incidents.values() if all(c(i) for c in conditions)]
+            if order_by:
+                found.sort(key=lambda incident: self._value(incident, order_by))
+        return [self._record(incident, query) for incident in found[offset:offset + limit]]
+
+    def _patch(self, sys_id, fields, query=None):
+        with self._lock:
+            for incident in self.incidents.values():
+                if incident["sys_id"] == sys_id:
+                    if "state" in fields:
+                        incident["state"] = self.STATES.get(str(fields["state"]), fields["state"])
+                    updated = dict(incident)
+                    break
+            else:
+                return 404, {"error": {"message": "No Record found"}}
+        return 200, {"result": self._record(updated, query or {})}
+
+    def _batch(self, request):
+        served = []
+        for sub in request.get("rest_requests", []):
+            parts = urlsplit(sub["url"])
+            fields = json.loads(base64.b64decode(sub.get("body") or b'e30='))
+            status, payload = self._patch(parts.path.rsplit("/", 1)[1], fields, parse_qs(parts.query))
+            served.append({
+                "id": sub["id"], "status_code": status,
+                "body": base64.b64encode(json.dumps(payload).encode('utf-8')).decode('ascii'),
+            })
+        return {"batch_request_id": request.get("batch_request_id"), "serviced_requests": served}
+
+
+class SlackStandIn(StandIn):
+    """Slack `response_url` endpoint: records the first arrival per path (one path per command)."""
+
+    name = "slack"
+
+    def kind(self, method, path):
+        return "response_url"
+
+    def arrival_key(self, path, body):
+        return path
+
+    def handle(self, method, path, query, body, headers):
+        return 200, b"ok"
+
+
+class AgentStandIn(StandIn):
+    """DevOps Agent webhook; arrival is recorded per distinct event description."""
+
+    name = "agent"
+
+    def kind(self, method, path):
+        return "webhook"
+
+    def arrival_key(self, path, body):
+        return json.loads(body).get("description")
+
+    def handle(self, method, path, query, body, headers):
+        return 200, {"status": "accepted"}
+
+
+class SecretsManagerStub:
+    def __init__(self, secrets):
+        self.secrets = secrets
+        self.calls = 0
+
+    def get_secret_value(self, SecretId):
+        self.calls += 1
+        return {"SecretString": json.dumps(self.secrets)}
+
+
+class SQSStub:
+    """In-memory queue handing out messages in the shape SQS delivers them to Lambda.
+
+    With fifo=True it behaves like a FIFO queue with content-based deduplication:
+    messages need a MessageGroupId, a group is not delivered again while any of
+    its messages is in flight, and a body sent twice within the dedup window is
+    accepted but not queued again.
+    """
+
+    DEDUP_WINDOW_SECONDS = 300
+
+    def __init__(self, fifo=False):
+        self.fifo = fifo
+        self.sent = 0
+        self.deduplicated = 0
+        self._queue = collections.deque()  # (enqueued at, message)
+        self._invisible = 0
+        self._sequence = 0
+        self._groups_in_flight = collections.Counter()
+        self._dedup = {}  # body hash -> (sent at, message id)
+        self.visibility_changes = 0
+        self.postponed = {}
+        # Sent by the handlers to a dead-letter queue (`<queue>-DLQ` URL): kept, never delivered
+        self.dead_letters = []
+        self._lock = threading.Lock()
+
+    def send_message(self, QueueUrl, MessageBody, **kwargs):
+        if QueueUrl.removesuffix(".fifo").endswith("-DLQ"):
+            with self._lock:
+                self.dead_letters.append({"body": MessageBody, "attributes": kwargs.get("MessageAttributes", {})})
+            return {"MessageId": str(uuid.uuid4())}
+        message_id = str(uuid.uuid4())
+        attributes = {"SentTimestamp": str(int(time.time() * 1000)), "ApproximateReceiveCount": "0"}
+        with self._lock:
+            self.sent += 1
+            if self.fifo:
+                digest = hashlib.sha256(MessageBody.encode("utf-8")).hexdigest()
+                sent_at, previous_id = self._dedup.get(digest, (0.0, None))
+                if time.monotonic() - sent_at < self.DEDUP_WINDOW_SECONDS:
+                    self.deduplicated += 1
+                    return {"MessageId": previous_id}
+                self._dedup[digest] = (time.monotonic(), message_id)
+                self._sequence += 1
+                attributes.update(MessageGroupId=kwargs["MessageGroupId"], SequenceNumber=str(self._sequence))
+            trace_header = kwargs.get("MessageSystemAttributes", {}).get("AWSTraceHeader")
+            if trace_header:
+                attributes["AWSTraceHeader"] = trace_header["StringValue"]
+            message = {
+                "messageId": message_id,
+                "receiptHandle": message_id,
+                "body": MessageBody,
+                "attributes": attributes,
+                # boto3 shape in, Lambda event shape out
+                "messageAttributes": {
+                    name: {"stringValue": value.get("StringValue"), "dataType": value.get("DataType", "String")}
+                    for name, value in kwargs.get("MessageAttributes", {}).items()
+                },
+                "eventSourceARN": "arn:aws:sqs:us-east-1:000000000000:bench" + (".fifo" if self.fifo else ""),
+            }
+            self._queue.append((time.perf_counter(), message))
+        return {"MessageId": message_id}
+
+    def _group(self, message):
+        return message["attributes"].get("MessageGroupId")
+
+    def receive(self, max_messages, window):
+        """A batch once max_messages are queued or the oldest has waited `window` seconds (Lambda batching window)."""
+        with self._lock:
+            if not self._queue:
+                return []
+            if len(self._queue) < max_messages and time.perf_counter() - self._queue[0][0] < window:
+                return []
+            if self.fifo:
+                # Oldest first, skipping groups another batch holds; a group's messages stay in order
+                batch, blocked = [], set(self._groups_in_flight)
+                for _, message in list(self._queue):
+                    if len(batch) == max_messages:
+                        break
+                    if self._group(message) not in blocked:
+                        batch.append(message)
+                for message in batch:
+                    self._queue.remove(next(item for item in self._queue if item[1] is message))
+                    self._groups_in_flight[self._group(message)] += 1
+            else:
+                batch = [self._queue.popleft()[1] for _ in range(min(max_messages, len(self._queue)))]
+        received_at = str(int(time.time() * 1000))
+        for message in batch:
+            attributes = message["attributes"]
+            attributes["ApproximateReceiveCount"] = str(int(attributes["ApproximateReceiveCount"]) + 1)
+            attributes.setdefault("ApproximateFirstReceiveTimestamp", received_at)
+        return batch
+
+    def _release(self, message):
+        if self.fifo:
+            group = self._group(message)
+            self._groups_in_flight[group] -= 1
+            if not self._groups_in_flight[group]:
+                del self._groups_in_flight[group]
+
+    def delete_message(self, message):
+        """The handler processed the message (Lambda deletes it)."""
+        with self._lock:
+            self._release(message)
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        with self._lock:
+            self.visibility_changes += 1
+            self.postponed[ReceiptHandle] = VisibilityTimeout
+        return {}
+
+    def postponed_for(self, message):
+        """Visibility timeout the handler asked for (seconds), if it postponed the message."""
+        with self._lock:
+            return self.postponed.pop(message["receiptHandle"], None)
+
+    def redeliver(self, message, visibility_timeout=0.0):
+        """Put a failed message back once its visibility timeout expires (FIFO: back in sequence order)."""
+        def requeue():
+            with self._lock:
+                self._invisible -= 1
+                self._release(message)
+                item = (time.perf_counter(), message)
+                if self.fifo:
+                    sequence = int(message["attributes"]["SequenceNumber"])
+                    for i, (_, queued) in enumerate(self._queue):
+                        if int(queued["attributes"]["SequenceNumber"]) > sequence:
+                            self._queue.insert(i, item)
+                            return
+                self._queue.append(item)
+
+        with self._lock:
+            self._invisible += 1
+        timer = threading.Timer(visibility_timeout, requeue)
+        timer.daemon = True
+        timer.start()
+
+    def __len__(self):
+        """Queued plus in-flight-invisible messages."""
+        with self._lock:
+            return len(self._queue) + self._invisible
@@ -0,0 +1,174 @@
+"""Sweep Lambda memory and SQS event source settings and write a tuning profile.
+
+For each queue-triggered function (worker: slack scenario, middleware:
+events scenario) every batch size / batching window / max concurrency
+combination is replayed through the e2e harness. Memory is not replayed:
+Lambda CPU scales with memory (a full vCPU at 1769 MB), so each run's
+measured CPU time is scaled per candidate memory size, and the rest of the
+invocation (waiting on ServiceNow, Slack, the agent) is kept as measured.
+The receiver is tuned for memory only.
+
+Each candidate gets a modeled end-to-end p95 and a cost per million
+requests (Lambda GB-seconds + requests, SQS requests). The objective picks
+one per function:
+
+- latency: the cheapest candidate within --latency-tolerance of the best p95;
+- cost: the cheapest candidate, within --max-p95-ms if given.
+
+The profile goes to tuning_profiles/NAME.json, which the stacks read with
+`cdk deploy -c tuning_profile=NAME`. Arguments after `--` go to the e2e
+harness and set the load to tune for:
+
+    python -m benchmarks.tune --profile prod --objective cost --max-p95-ms 800 -- --event-rate 50
+
+The CPU time is that of the invoking thread, so work a handler spreads over
+its own thread pool is undercounted; --cpu-factor scales it (e.g. 2 if a
+Lambda vCPU is half as fast as this machine). Cold starts and SQS empty
+receives are not in the model.
+"""
+import argparse
+import datetime
+import itertools
+import json
+import os
+import sys
+
+from benchmarks import e2e
+from chat_ops_service_now_dev_ops_agent_integration.tuning_profile import DEFAULTS, PROFILE_DIR
+
+# Memory at which a function gets one full vCPU
+FULL_VCPU_MB = 1769
+
+# us-east-1, x86, USD
+PRICES = {
+    "lambda_gb_second": 0.0000166667,
+    "lambda_request": 0.20 / 1e6,
+    "sqs_request": 0.40 / 1e6,
+    "sqs_fifo_request": 0.50 / 1e6,
+}
+
+# queue-triggered function -> the e2e scenario that invokes it
+FUNCTIONS = {"worker": "slack", "middleware": "events"}
+
+
+def _ints(text):
+    return [int(v) for v in text.split(",")]
+
+
+def modeled_invocation_ms(invocations, memory, cpu_factor=1.0):
+    """Average billed duration of one invocation at `memory` MB."""
+    count = invocations["count"] or 1
+    wall, cpu = invocations["wall_ms"] / count, invocations["cpu_ms"] / count
+    return (wall - cpu) + cpu * cpu_factor * FULL_VCPU_MB / min(memory, FULL_VCPU_MB)
+
+
+def estimate(result, function, memory, cpu_factor=1.0, fifo=False):
+    """Modeled p95 (ms) and cost per million scenario requests (USD) for one function at one memory size."""
+    invocations = result["invocations"][function]
+    duration_ms = modeled_invocation_ms(invocations, memory, cpu_factor)
+    # The end-to-end p95 moves by how much slower (or faster) each invocation gets
+    p95 = result["stages"]["end to end"]["p95"] + duration_ms - invocations["wall_ms"] / (invocations["count"] or 1)
+    cost = invocations["count"] * (
+        duration_ms / 1000 * memory / 1024 * PRICES["lambda_gb_second"] + PRICES["lambda_request"]
+    )
+    if function in FUNCTIONS:
+        # SendMessage per message, then one ReceiveMessage and one DeleteMessageBatch per batch
+        sqs_requests = result["outbound"]["sqs send_message"] + 2 * invocations["count"]
+        cost += sqs_requests * PRICES["sqs_fifo_request" if fifo else "sqs_request"]
+    return round(p95, 1), round(cost / result["requests"] * 1e6, 4)
+
+
+def pick(candidates, objective, latency_tolerance, max_p95_ms):
+    if max_p95_ms is not None:
+        candidates = [c for c in candidates if c["p95_ms"] <= max_p95_ms] or candidates
+    if objective == "latency":
+        best = min(c["p95_ms"] for c in candidates)
+        candidates = [c for c in candidates if c["p95_ms"] <= best * (1 + latency_tolerance)]
+    return min(candidates, key=lambda c: (c["cost_per_million_usd"], c["p95_ms"]))
+
+
+def sweep(args, harness_argv):
+    """Candidates per function: settings, modeled p95 and cost."""
+    candidates = {"receiver": []}
+    for function, scenario in FUNCTIONS.items():
+        candidates[function] = []
+        grid = itertools.product(args.batch_size, args.batch_window_s, args.max_concurrency)
+        for batch_size, window, concurrency in grid:
+            if (batch_size == 1 and window) or (batch_size > 10 and not window):
+                continue  # a window does nothing for single messages; SQS needs one above 10
+            run_args = e2e.parse_args([
+                *harness_argv, "--scenario", scenario, "--batch-size", str(batch_size),
+                "--batch-window-ms", str(window * 1000), "--lambda-concurrency", str(concurrency),
+            ])
+            result = e2e.run(run_args)[scenario]
+            lost = result["results"].get("dead_lettered", 0) + result["results"].get("unanswered", 0)
+            settings = {"batch_size": batch_size, "max_batching_window_s": window, "max_concurrency": concurrency}
+            print(f"{function}: {settings} -> {result['throughput_per_s']}/s, "
+                  f"p95 {result['stages']['end to end']['p95']}ms, lost {lost}", file=sys.stderr)
+            if lost:
+                continue
+            for memory in args.memory:
+                p95, cost = estimate(result, function, memory, args.cpu_factor, run_args.fifo)
+                candidates[function].append(dict(settings, memory_size=memory, p95_ms=p95, cost_per_million_usd=cost))
+            if function == "worker" and not candidates["receiver"]:
+                # The receiver does not depend on the worker's event source: tune it on one run
+                for memory in args.memory:
+                    p95, cost = estimate(result, "receiver", memory, args.cpu_factor)
+                    candidates["receiver"].append(dict(memory_size=memory, p95_ms=p95, cost_per_million_usd=cost))
+    return candidates
+
+
+def build_profile(candidates, args, harness_argv):
+    functions, estimates = {}, {}
+    for function, options in candidates.items():
+        if not options:
+            print(f"{function}: no candidate processed every request, keeping defaults", file=sys.stderr)
+            continue
+        chosen = pick(options, args.objective, args.latency_tolerance, args.max_p95_ms)
+        functions[function] = {k: chosen[k] for k in DEFAULTS[function]}
+        estimates[function] = {"p95_ms": chosen["p95_ms"], "cost_per_million_usd": chosen["cost_per_million_usd"]}
+    return {
+        "objective": args.objective,
+        "generated_at": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "load": harness_argv,
+        "prices": PRICES,
+        "functions": functions,
+        "estimates": estimates,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", required=True, help=f"write {PROFILE_DIR}/PROFILE.json")
+    parser.add_argument("--objective", choices=["latency", "cost"], default="latency")
+    parser.add_argument("--memory", type=_ints, default=[128, 256, 512, 1024], help="MB, comma-separated")
+    parser.add_argument("--batch-size", type=_ints, default=[1, 5, 10])
+    parser.add_argument("--batch-window-s", type=_ints, default=[0, 1], help="whole seconds, like the event source")
+    parser.add_argument("--max-concurrency", type=_ints, default=[2, 4, 8])
+    parser.add_argument("--latency-tolerance", type=float, default=0.1,
+                        help="latency objective: p95 above the best tolerated for a cheaper candidate")
+    parser.add_argument("--max-p95-ms", type=float, help="drop candidates with a slower end-to-end p95")
+    parser.add_argument("--cpu-factor", type=float, default=1.0,
+                        help="Lambda CPU time per CPU millisecond measured here, at a full vCPU")
+    if argv is None:
+        argv = sys.argv[1:]
+    harness_argv = argv[argv.index("--") + 1:] if "--" in argv else []
+    args = parser.parse_args(argv[:argv.index("--")] if "--" in argv else argv)
+    return args, harness_argv
+
+
+def main(argv=None):
+    args, harness_argv = parse_args(argv)
+    profile = build_profile(sweep(args, harness_argv), args, harness_argv)
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"{args.profile}.json")
+    with open(path, "w") as f:
+        json.dump(profile, f, indent=2)
+        f.write("\n")
+    print(json.dumps(profile["functions"], indent=2))
+    print(f"wrote {path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
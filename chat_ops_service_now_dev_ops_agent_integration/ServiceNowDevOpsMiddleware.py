@@ -1,9 +1,10 @@
 import json
 from aws_cdk import (
-    # Duration,
+    Duration,
     CfnOutput,
     RemovalPolicy,
     Stack,
+    aws_dynamodb as dynamodb,
     aws_iam as iam,
     aws_lambda as _lambda,
     aws_lambda_event_sources as lambda_event_sources,
@@ -13,12 +14,35 @@ from aws_cdk import (
     aws_logs as logs
 )
 from constructs import Construct
+from chat_ops_service_now_dev_ops_agent_integration.ingest_template import EdgeFilter, request_template
+from chat_ops_service_now_dev_ops_agent_integration.lambda_bundles import bundle_excludes
+from chat_ops_service_now_dev_ops_agent_integration.SlackToServiceNowBot_Lambda import SLACK_STATE_TABLE_NAME
+from chat_ops_service_now_dev_ops_agent_integration.tuning_profile import MAX_RECEIVE_COUNT, load_profile
+
+NORMAL_QUEUE_NAME = "ServiceNow-DevOps-SQSQueue"
+HIGH_PRIORITY_QUEUE_NAME = "ServiceNow-DevOps-SQSQueue-High"
+DLQ_SUFFIX = "-DLQ"
+# One webhook POST at worst: 3 attempts of 1 s connect + 2 s read, plus backoff or
+# Retry-After waits (up to 1 s each). A degraded webhook drops the AIMD limit to 1,
+# so the records of a batch are sent one after another.
+WEBHOOK_CALL_SECONDS = 11
+# Secrets, idempotency, fingerprint and ticket cache round trips around the calls
+MIDDLEWARE_OVERHEAD_SECONDS = 10
+HIGH_PRIORITY_BATCH_SIZE = 5
+
 
 class ServiceNowMiddlewareStack(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        ## memory and event source settings (`cdk deploy -c tuning_profile=prod`, see benchmarks/tune.py)
+        profile = load_profile(self.node.try_get_context("tuning_profile"))
+
+        ## `-c trace_export=xray`: the middleware sends each event's per-hop trace record
+        ## (lambda/tracing.py) to X-Ray as subsegments of the API Gateway trace
+        xray = self.node.try_get_context("trace_export") == "xray"
+
         ## Phase 1: Create IAM Role for API Gateway
         api_gateway_role = iam.Role(
             self, "ApiGatewayToSQSRole",
@@ -49,14 +73,59 @@ class ServiceNowMiddlewareStack(Stack):
             cloud_watch_role_arn=api_gateway_log_role.role_arn
         )
 
-        ## Phase 2: Create SQS Queue
-        queue = sqs.Queue(
-            self, "ServiceNowDevOpsSQSQueue",
-            queue_name="ServiceNow-DevOps-SQSQueue"
-        )
+        ## Phase 2: Create SQS Queues
+        ## priority lanes: P1 incidents (`cdk deploy -c high_priorities=1,2` to widen) get their
+        ## own queue and consumer, so a flood of low-priority updates cannot delay them
+        high_priorities = [p.strip() for p in str(self.node.try_get_context("high_priorities") or "1").split(",")]
+        ## optional FIFO mode (`cdk deploy -c fifo_ingest=true`): events of one incident are delivered
+        ## in order (message group = sys_id) while different incidents still run in parallel;
+        ## content-based dedup drops identical Business Rule POSTs sent within 5 minutes.
+        ## Replaces the queues (FIFO names end in .fifo); an incident whose priority crosses
+        ## lanes is only ordered within each lane.
+        fifo = str(self.node.try_get_context("fifo_ingest") or "false").lower() == "true"
+        suffix = ".fifo" if fifo else ""
+        ## timeout: every record of the largest batch sent one at a time (Lambda allows 900 s at most);
+        ## the queues keep a batch hidden for 6x that, so it is not redelivered while still running
+        middleware_batch_size = profile["middleware"]["batch_size"]
+        if fifo:
+            # FIFO queues take at most 10 per batch
+            middleware_batch_size = min(middleware_batch_size, 10)
+        largest_batch = max(middleware_batch_size, HIGH_PRIORITY_BATCH_SIZE)
+        middleware_timeout = min(900, MIDDLEWARE_OVERHEAD_SECONDS + WEBHOOK_CALL_SECONDS * largest_batch)
+        ## dead-letter queue per lane: after `-c max_receive_count=N` (default 60) failed deliveries SQS
+        ## moves an event there; events that can never be delivered go at once (lambda/dead_letter.py,
+        ## which finds it by the <queue>-DLQ name). `python main.py redrive` replays them after a fix.
+        max_receive_count = int(self.node.try_get_context("max_receive_count") or MAX_RECEIVE_COUNT)
+        dead_letter_queues = {}
+
+        def lane_queue(construct_id, name):
+            dead_letter_queues[name] = sqs.Queue(
+                self, f"{construct_id}DeadLetterQueue",
+                queue_name=name + DLQ_SUFFIX + suffix,
+                fifo=fifo or None,
+                retention_period=Duration.days(14),
+            )
+            return sqs.Queue(
+                self, construct_id,
+                queue_name=name + suffix,
+                fifo=fifo or None,
+                content_based_deduplication=fifo or None,
+                visibility_timeout=Duration.seconds(6 * middleware_timeout),
+                dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=max_receive_count,
+                                                      queue=dead_letter_queues[name]),
+            )
 
-        # Grant API Gateway role permission to send messages to the queue
+        queue = lane_queue("ServiceNowDevOpsSQSQueue", NORMAL_QUEUE_NAME)
+        high_priority_queue = lane_queue("ServiceNowDevOpsHighPrioritySQSQueue", HIGH_PRIORITY_QUEUE_NAME)
+
+        # Grant API Gateway role permission to send messages to the queues
         queue.grant_send_messages(api_gateway_role)
+        high_priority_queue.grant_send_messages(api_gateway_role)
+
+        ## edge filter (`-c edge_filter='{"drop_priorities": ["5"]}'`, see ingest_template.EdgeFilter):
+        ## events the middleware would never forward are answered 200 by API Gateway and not queued
+        ## (they become a GetQueueAttributes call, already covered by grant_send_messages)
+        edge_filter = EdgeFilter.from_context(self.node.try_get_context("edge_filter"))
 
         ## secrets manager
         secret = secretsmanager.Secret(
@@ -71,6 +140,17 @@ class ServiceNowMiddlewareStack(Stack):
             )
         )
 
+        ## shared state for the middleware (last forwarded fingerprint per incident)
+        ## items expire through the `expires_at` TTL attribute
+        state_table = dynamodb.Table(
+            self, "ServiceNowDevOpsStateTable",
+            table_name="ServiceNow-DevOps-State",
+            partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
         ## add logs for lambda
         middleware_log_group = logs.LogGroup(
             self, "ServiceNowDevOpsmiddlewareLogGroup",
@@ -86,9 +166,19 @@ class ServiceNowMiddlewareStack(Stack):
             function_name="servicenow_devops_middleware_lambda",
             runtime=_lambda.Runtime.PYTHON_3_14,
             handler="servicenow-devops-middleware.lambda_handler",
-            code=_lambda.Code.from_asset("lambda"),
+            # only this handler and the helpers it imports (smaller bundle, faster cold start)
+            code=_lambda.Code.from_asset("lambda", exclude=bundle_excludes("servicenow-devops-middleware")),
+            memory_size=profile["middleware"]["memory_size"],
+            timeout=Duration.seconds(middleware_timeout),
+            tracing=_lambda.Tracing.ACTIVE if xray else None,
             environment={
-                "SECRET_ARN": secret.secret_arn
+                "SECRET_ARN": secret.secret_arn,
+                # concurrent records per invocation: the SQS batch size below, at most 10
+                "MAX_WORKERS": str(min(profile["middleware"]["batch_size"], 10)),
+                "STATE_TABLE_NAME": state_table.table_name,
+                # ticket cache of the Slack stack, invalidated on incident_resolved
+                "TICKET_CACHE_TABLE": SLACK_STATE_TABLE_NAME,
+                **({"TRACE_EXPORT": "xray"} if xray else {}),
             },
             logging_format=_lambda.LoggingFormat.JSON,
             log_group=middleware_log_group,
@@ -96,6 +186,10 @@ class ServiceNowMiddlewareStack(Stack):
             application_log_level_v2=_lambda.ApplicationLogLevel.INFO,
         )
         secret.grant_read(servicenow_devops_middleware_lambda)
+        state_table.grant_read_write_data(servicenow_devops_middleware_lambda)
+        dynamodb.Table.from_table_name(
+            self, "SlackTicketCacheTable", SLACK_STATE_TABLE_NAME
+        ).grant_write_data(servicenow_devops_middleware_lambda)
 
 
         ## Trigger lambda function using API Gateway when HTTP request is received
@@ -126,17 +220,21 @@ class ServiceNowMiddlewareStack(Stack):
         api.node.add_dependency(api_gateway_account)
 
         ## Phase 3: Update API Gateway to integrate with SQS (Producer)
+        ## the queue is a path parameter: normal lane by default, the template overrides it for high priorities
         integration = apigateway.AwsIntegration(
             service="sqs",
-            path="{}/{}".format(Stack.of(self).account, queue.queue_name),
+            path="{}/{{queue}}".format(Stack.of(self).account),
             integration_http_method="POST",
             options=apigateway.IntegrationOptions(
                 credentials_role=api_gateway_role,
                 request_parameters={
-                    "integration.request.header.Content-Type": "'application/x-www-form-urlencoded'"
+                    "integration.request.header.Content-Type": "'application/x-www-form-urlencoded'",
+                    "integration.request.path.queue": f"'{NORMAL_QUEUE_NAME + suffix}'",
                 },
                 request_templates={
-                    "application/json": "Action=SendMessage&MessageBody=$input.body"
+                    "application/json": request_template(
+                        high_priorities, HIGH_PRIORITY_QUEUE_NAME + suffix, edge_filter, fifo
+                    )
                 },
                 integration_responses=[
                     apigateway.IntegrationResponse(status_code="200")
@@ -157,7 +255,32 @@ class ServiceNowMiddlewareStack(Stack):
         )
 
         ## Phase 3: Configure Lambda to trigger from SQS (Consumer)
-        servicenow_devops_middleware_lambda.add_event_source(lambda_event_sources.SqsEventSource(queue, batch_size=10))
+        ## report_batch_item_failures: only the failed records of a batch are retried
+        ## max_concurrency (optional, `cdk deploy -c middleware_max_concurrency=5`, overrides the profile): caps
+        ## concurrent invocations so an event storm cannot scale calls to the agent webhook without bound
+        middleware_max_concurrency = (
+            self.node.try_get_context("middleware_max_concurrency") or profile["middleware"]["max_concurrency"]
+        )
+        middleware_window = profile["middleware"]["max_batching_window_s"]
+        servicenow_devops_middleware_lambda.add_event_source(lambda_event_sources.SqsEventSource(
+            queue,
+            # FIFO queues take no batching window
+            batch_size=middleware_batch_size,
+            max_batching_window=Duration.seconds(middleware_window) if middleware_window and not fifo else None,
+            report_batch_item_failures=True,
+            max_concurrency=int(middleware_max_concurrency) if middleware_max_concurrency else None,
+        ))
+        ## high lane: small batches, no batching window, and its own concurrency
+        ## (`-c high_priority_max_concurrency=N`) so it never waits behind the normal lane's pollers
+        high_priority_max_concurrency = self.node.try_get_context("high_priority_max_concurrency")
+        servicenow_devops_middleware_lambda.add_event_source(lambda_event_sources.SqsEventSource(
+            high_priority_queue,
+            batch_size=HIGH_PRIORITY_BATCH_SIZE,
+            # FIFO event sources take no batching window
+            max_batching_window=None if fifo else Duration.seconds(0),
+            report_batch_item_failures=True,
+            max_concurrency=int(high_priority_max_concurrency) if high_priority_max_concurrency else None,
+        ))
 
         full_api_url = api.url + "servicenow_devops_middleware_lambda"
 
@@ -192,7 +315,10 @@ class ServiceNowMiddlewareStack(Stack):
                 "description": (current.description || "").toString(),
                 "priority": current.priority.toString(),
                 "state": current.getValue('state'), // Send raw state value (e.g. "1", "7")
-                "state_display": current.getDisplayValue('state') // Send readable name (e.g. "Resolved")
+                "state_display": current.getDisplayValue('state'), // Send readable name (e.g. "Resolved")
+                // Unique per update: lets the middleware tell a repeated send from a repeated transition
+                "sys_mod_count": current.getValue('sys_mod_count'),
+                "sys_updated_on": current.getValue('sys_updated_on')
             }}
         }};
         
@@ -212,6 +338,14 @@ class ServiceNowMiddlewareStack(Stack):
 }})(current, previous);
 =================================================="""
 
+        for name, dead_letter_queue in dead_letter_queues.items():
+            dead_letter_queue.grant_send_messages(servicenow_devops_middleware_lambda)
+            CfnOutput(
+                self, f"{name.replace('-', '')}DeadLetterQueueURL",
+                value=dead_letter_queue.queue_url,
+                description=f"Events of {name} that failed for good: python main.py redrive --queue <url>",
+            )
+
         CfnOutput(self, "ServiceNowBusinessRule", 
             value=sn_script,
             description="Copy this script into your ServiceNow Business Rule")
\ No newline at end of file
@@ -1,9 +1,10 @@
 import json
 from aws_cdk import (
-    # Duration,
+    Duration,
     CfnOutput,
     RemovalPolicy,
     Stack,
+    aws_dynamodb as dynamodb,
     aws_iam as iam,
     aws_lambda as _lambda,
     aws_lambda_event_sources as lambda_event_sources,
@@ -13,12 +14,53 @@ from aws_cdk import (
     aws_logs as logs
 )
 from constructs import Construct
+from chat_ops_service_now_dev_ops_agent_integration.lambda_bundles import bundle_excludes
+from chat_ops_service_now_dev_ops_agent_integration.tuning_profile import MAX_RECEIVE_COUNT, load_profile
+
+# Fixed name: the ServiceNow middleware stack invalidates ticket cache entries in this table
+SLACK_STATE_TABLE_NAME = "SlackToServiceNow-State"
+# Worker batch budget: the single-flight wait (2 s), a rate-limit wait (1 s) and three
+# calls in a row (ServiceNow query, update, Slack reply), each up to 3 attempts of
+# 1 s connect + 2 s read plus backoff
+WORKER_TIMEOUT_SECONDS = 40
 
 class slack_to_servicenow_devops_agent_integration(Stack):
 
     def __init__(self, scope: Construct, construct_id: str, **kwargs) -> None:
         super().__init__(scope, construct_id, **kwargs)
 
+        ## memory and event source settings (`cdk deploy -c tuning_profile=prod`, see benchmarks/tune.py)
+        profile = load_profile(self.node.try_get_context("tuning_profile"))
+
+        ## SnapStart / provisioned concurrency for the Slack path (opt-in, see lambda/warm_start.py):
+        ## `-c snapstart=true` restores receiver and worker from a snapshot taken after init, and
+        ## `-c receiver_provisioned_concurrency=N` / `-c worker_provisioned_concurrency=N` keep N
+        ## environments initialized. Either way init runs before traffic, so the handlers build their
+        ## clients and fetch the secret there; `-c prewarm_connections=true` also opens the ServiceNow
+        ## and Slack connections. Traffic then goes through a "live" alias of the published version.
+        snapstart = str(self.node.try_get_context("snapstart") or "false").lower() == "true"
+        prewarm_connections = str(self.node.try_get_context("prewarm_connections") or "false").lower() == "true"
+        provisioned = {
+            name: int(self.node.try_get_context(f"{name}_provisioned_concurrency") or 0)
+            for name in ("receiver", "worker")
+        }
+        ## `-c trace_export=xray`: active tracing on receiver and worker, and the worker sends each
+        ## command's per-hop trace record (lambda/tracing.py) to X-Ray as subsegments of its trace
+        xray = self.node.try_get_context("trace_export") == "xray"
+        tracing = _lambda.Tracing.ACTIVE if xray else None
+        if snapstart and any(provisioned.values()):
+            raise ValueError("snapstart cannot be combined with provisioned concurrency on the same function version")
+
+        def live(function, name):
+            if not (snapstart or provisioned[name]):
+                return function
+            return _lambda.Alias(
+                self, f"{name.capitalize()}LiveAlias",
+                alias_name="live",
+                version=function.current_version,
+                provisioned_concurrent_executions=provisioned[name] or None,
+            )
+
         ## Phase 1: Create IAM Role for API Gateway
         api_gateway_role = iam.Role(
             self, "ApiGatewayToSQSRole",
@@ -91,19 +133,24 @@ class slack_to_servicenow_devops_agent_integration(Stack):
             function_name="SlackToSNOW_ApiGW_to_Receiver_Lambda",
             runtime=_lambda.Runtime.PYTHON_3_14,
             handler="receiver_middleware_lambda.lambda_handler",
-            code=_lambda.Code.from_asset("lambda"),
-            memory_size=128,
+            # only this handler and the helpers it imports (smaller bundle, faster cold start)
+            code=_lambda.Code.from_asset("lambda", exclude=bundle_excludes("receiver_middleware_lambda")),
+            memory_size=profile["receiver"]["memory_size"],
+            tracing=tracing,
+            snap_start=_lambda.SnapStartConf.ON_PUBLISHED_VERSIONS if snapstart else None,
             log_group=receiver_log_group,
             environment={
                 "SECRET_ARN": secret.secret_arn
             }
         )
         secret.grant_read(receiver_lambda)
+        if prewarm_connections:
+            receiver_lambda.add_environment("PREWARM_CONNECTIONS", "true")
 
         ## intergration between api gateway and receiver lambda. api_gateway -> receiver_lambda
         ## api gateway will send the request to receiver lambda
         apigw_lambda_integration = apigateway.LambdaIntegration(
-            receiver_lambda,
+            live(receiver_lambda, "receiver"),
             proxy=True
         )
 
@@ -119,16 +166,42 @@ class slack_to_servicenow_devops_agent_integration(Stack):
             method_responses=[apigateway.MethodResponse(status_code="200")]
         )
 
-        ## create sqs queue
+        ## dead-letter queue: after `-c max_receive_count=N` (default 60) failed deliveries SQS moves a
+        ## command here; commands that can never succeed go at once (lambda/dead_letter.py, which
+        ## finds it by the <queue>-DLQ name). `python main.py redrive` replays them after a fix.
+        max_receive_count = int(self.node.try_get_context("max_receive_count") or MAX_RECEIVE_COUNT)
+        dead_letter_queue = sqs.Queue(
+            self, "SlackToServiceNowIntegrationDeadLetterQueue",
+            queue_name="SlackToServiceNowIntegrationQueue-DLQ",
+            retention_period=Duration.days(14),
+        )
+
+        ## create sqs queue; the visibility timeout stays at 6x the worker timeout (Lambda's guidance
+        ## for SQS event sources), so a batch still running is not handed to a second worker
         queue = sqs.Queue(
             self, "SlackToServiceNowDevOpsAgentIntegrationQueue",
             queue_name="SlackToServiceNowIntegrationQueue",
+            visibility_timeout=Duration.seconds(6 * WORKER_TIMEOUT_SECONDS),
+            dead_letter_queue=sqs.DeadLetterQueue(max_receive_count=max_receive_count, queue=dead_letter_queue),
         )
 
         # Grant lambda premission to send to SQS and pass the URL
         queue.grant_send_messages(receiver_lambda)
         receiver_lambda.add_environment("SQS_QUEUE_URL", queue.queue_url)
 
+        ## shared state for the Slack lambdas (ticket cache), items expire via `expires_at`
+        state_table = dynamodb.Table(
+            self, "SlackToServiceNowStateTable",
+            table_name=SLACK_STATE_TABLE_NAME,
+            partition_key=dynamodb.Attribute(name="pk", type=dynamodb.AttributeType.STRING),
+            billing_mode=dynamodb.BillingMode.PAY_PER_REQUEST,
+            time_to_live_attribute="expires_at",
+            removal_policy=RemovalPolicy.DESTROY
+        )
+
+        ## the receiver answers /ops-status inline from the shared ticket cache when it can
+        receiver_lambda.add_environment("STATE_TABLE_NAME", state_table.table_name)
+        state_table.grant_read_write_data(receiver_lambda)
 
         ## Log Group for Worker Lambda
         worker_log_group = logs.LogGroup(
@@ -144,19 +217,44 @@ class slack_to_servicenow_devops_agent_integration(Stack):
             function_name="SlackToSNOW_SQS_To_Worker_Lambda",
             runtime=_lambda.Runtime.PYTHON_3_14,
             handler="worker_middleware_lambda.lambda_handler",
-            code=_lambda.Code.from_asset("lambda"),
-            memory_size=128,
+            code=_lambda.Code.from_asset("lambda", exclude=bundle_excludes("worker_middleware_lambda")),
+            memory_size=profile["worker"]["memory_size"],
+            timeout=Duration.seconds(WORKER_TIMEOUT_SECONDS),
+            tracing=tracing,
+            snap_start=_lambda.SnapStartConf.ON_PUBLISHED_VERSIONS if snapstart else None,
             log_group=worker_log_group,
             environment={
-                "SECRET_ARN": secret.secret_arn
+                "SECRET_ARN": secret.secret_arn,
+                # concurrent tickets per invocation: the SQS batch size below, at most 10
+                "MAX_WORKERS": str(min(profile["worker"]["batch_size"], 10)),
+                "STATE_TABLE_NAME": state_table.table_name,
             }
         )
         secret.grant_read(worker_lambda)
+        state_table.grant_read_write_data(worker_lambda)
+        dead_letter_queue.grant_send_messages(worker_lambda)
+        if prewarm_connections:
+            worker_lambda.add_environment("PREWARM_CONNECTIONS", "true")
+        if xray:
+            worker_lambda.add_environment("TRACE_EXPORT", "xray")
 
 
         ## add SQS as event source for worker lambda
-        worker_lambda.add_event_source(
-            lambda_event_sources.SqsEventSource(queue)
+        ## report_batch_item_failures: only the failed (and same-ticket later) records are retried
+        ## max_concurrency (optional, `cdk deploy -c worker_max_concurrency=5`, overrides the profile): caps
+        ## concurrent worker invocations so a command backlog cannot overload the ServiceNow instance
+        worker_max_concurrency = (
+            self.node.try_get_context("worker_max_concurrency") or profile["worker"]["max_concurrency"]
+        )
+        worker_window = profile["worker"]["max_batching_window_s"]
+        live(worker_lambda, "worker").add_event_source(
+            lambda_event_sources.SqsEventSource(
+                queue,
+                batch_size=profile["worker"]["batch_size"],
+                max_batching_window=Duration.seconds(worker_window) if worker_window else None,
+                report_batch_item_failures=True,
+                max_concurrency=int(worker_max_concurrency) if worker_max_concurrency else None,
+            )
         )
 
         ## outputs
@@ -164,4 +262,9 @@ class slack_to_servicenow_devops_agent_integration(Stack):
             self, "APIGatewayURL",
             value=api.url,
             description="API Gateway URL to receive Slack events",
+        )
+        CfnOutput(
+            self, "DeadLetterQueueURL",
+            value=dead_letter_queue.queue_url,
+            description="Slack commands that failed for good: python main.py redrive --queue <url>",
         )
\ No newline at end of file
@@ -0,0 +1,135 @@
+"""API Gateway -> SQS request template for the ServiceNow ingest API.
+
+The template is generated from Python config (`EdgeFilter`, the high
+priorities, FIFO mode) and does at the edge what would otherwise cost a
+Lambda invocation:
+
+- drops events the middleware never forwards (by event type, raw state or
+  priority). Dropped events become a harmless GetQueueAttributes call, so
+  ServiceNow still gets a 200 and nothing is queued;
+- routes high priorities to the high-priority queue;
+- attaches event_type, priority and sys_id as SQS message attributes, so
+  consumers can route without parsing the body.
+
+`EdgeFilter.drops` and `route` mirror the template in Python, so the tests
+and the local benchmark route events the way API Gateway does.
+"""
+import json
+import re
+
+MESSAGE_ATTRIBUTES = (
+    ("event_type", "$.event_type"), ("priority", "$.incident.priority"), ("sys_id", "$.incident.sys_id"),
+)
+
+_SAFE_VALUE = re.compile(r'^[\w\- ]+$')
+
+
+def _priority_pattern(priorities):
+    # "1" matches "1" and "1 - Critical"
+    return f"^({'|'.join(priorities)})(\\D.*)?$"
+
+
+def _checked(values, what):
+    values = tuple(str(v).strip() for v in values)
+    for value in values:
+        if not _SAFE_VALUE.match(value):
+            raise ValueError(f"Invalid {what} in edge filter: {value!r}")
+    return values
+
+
+class EdgeFilter:
+    """Events dropped at the API Gateway edge. Empty (drops nothing) by default.
+
+    From CDK context, e.g. `cdk deploy -c edge_filter='{"drop_priorities": ["5"], "drop_states": ["8"]}'`.
+    """
+
+    def __init__(self, drop_event_types=(), drop_states=(), drop_priorities=()):
+        self.drop_event_types = _checked(drop_event_types, "event type")
+        self.drop_states = _checked(drop_states, "state")
+        self.drop_priorities = _checked(drop_priorities, "priority")
+
+    @classmethod
+    def from_context(cls, value):
+        if not value:
+            return cls()
+        config = json.loads(value) if isinstance(value, str) else dict(value)
+        return cls(**config)
+
+    def __bool__(self):
+        return bool(self.drop_event_types or self.drop_states or self.drop_priorities)
+
+    def drops(self, body):
+        incident = body.get('incident', body)
+        priority = str(incident.get('priority', ''))
+        return (
+            str(body.get('event_type', '')) in self.drop_event_types
+            or str(incident.get('state', '')) in self.drop_states
+            or bool(self.drop_priorities and re.match(_priority_pattern(self.drop_priorities), priority))
+        )
+
+    def vtl_condition(self):
+        conditions = [f'$eventType == "{v}"' for v in self.drop_event_types]
+        conditions += [f'$state == "{v}"' for v in self.drop_states]
+        if self.drop_priorities:
+            conditions.append(f"$priority.matches('{_priority_pattern(self.drop_priorities)}')")
+        return " || ".join(conditions)
+
+
+def route(body, high_priorities):
+    """"high" or "normal": the queue the template sends an event to."""
+    priority = str(body.get('incident', body).get('priority', ''))
+    return "high" if re.match(_priority_pattern(high_priorities), priority) else "normal"
+
+
+def request_template(high_priorities, high_queue_name, edge_filter=None, fifo=False):
+    """VTL for the SQS integration. The integration path holds the normal queue;
+    high priorities override it with `high_queue_name`.
+
+    For FIFO queues every incident is its own message group (sys_id, falling
+    back to number), so its events are delivered in order.
+    """
+    high_priorities = _checked(high_priorities, "priority")
+    lines = [
+        "#set($eventType = \"$input.path('$.event_type')\")",
+        "#set($state = \"$input.path('$.incident.state')\")",
+        "#set($priority = \"$input.path('$.incident.priority')\")",
+    ]
+    send = []
+    if fifo:
+        send += [
+            "#set($group = \"$input.path('$.incident.sys_id')\")",
+            "#if($group == \"\")#set($group = \"$input.path('$.incident.number')\")#end",
+        ]
+    send += [
+        f"#if($priority.matches('{_priority_pattern(high_priorities)}'))",
+        f"#set($context.requestOverride.path.queue = \"{high_queue_name}\")",
+        "#end",
+        # Correlation for the consumer's trace record (lambda/tracing.py); the X-Ray
+        # trace header reaches SQS as the AWSTraceHeader system attribute by itself
+        "#set($attributes = \"&MessageAttribute.1.Name=correlation_id"
+        "&MessageAttribute.1.Value.DataType=String&MessageAttribute.1.Value.StringValue=$context.requestId"
+        "&MessageAttribute.2.Name=received_at"
+        "&MessageAttribute.2.Value.DataType=Number&MessageAttribute.2.Value.StringValue=$context.requestTimeEpoch\")",
+        "#set($n = 2)",
+    ]
+    for name, path in MESSAGE_ATTRIBUTES:
+        # SQS rejects empty attribute values: only attach the ones the event has
+        send += [
+            f"#set($value = \"$input.path('{path}')\")",
+            "#if($value != \"\")#set($n = $n + 1)"
+            f"#set($attributes = \"${{attributes}}&MessageAttribute.${{n}}.Name={name}"
+            "&MessageAttribute.${n}.Value.DataType=String"
+            "&MessageAttribute.${n}.Value.StringValue=$util.urlEncode($value)\")#end",
+        ]
+    group = "&MessageGroupId=$util.urlEncode($group)" if fifo else ""
+    send.append(f"Action=SendMessage{group}$attributes&MessageBody=$input.body")
+
+    if not edge_filter:
+        return "\n".join(lines + send)
+    return "\n".join(lines + [
+        f"#if({edge_filter.vtl_condition()})",
+        "Action=GetQueueAttributes&AttributeName.1=QueueArn",
+        "#else",
+        *send,
+        "#end",
+    ])
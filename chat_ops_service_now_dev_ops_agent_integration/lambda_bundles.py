@@ -0,0 +1,51 @@
+"""Per-function Lambda bundles built from the shared `lambda/` directory.
+
+Each function ships its handler plus only the helper modules it imports
+(directly or transitively), found by parsing the imports. Kept free of
+aws_cdk imports so local tooling (benchmarks) can use it too.
+"""
+import ast
+import os
+
+LAMBDA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "lambda")
+
+
+def local_modules(lambda_dir=LAMBDA_DIR):
+    return {name[:-3] for name in os.listdir(lambda_dir) if name.endswith(".py")}
+
+
+def _imported_names(path):
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=path)
+    names = set()
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names.update(alias.name.split(".")[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module.split(".")[0])
+    return names
+
+
+def handler_modules(handler_module, lambda_dir=LAMBDA_DIR):
+    """The handler module and every local module it needs, e.g. {"worker_middleware_lambda", "secret_cache", ...}."""
+    available = local_modules(lambda_dir)
+    needed = set()
+    pending = [handler_module]
+    while pending:
+        module = pending.pop()
+        if module in needed:
+            continue
+        needed.add(module)
+        pending.extend(_imported_names(os.path.join(lambda_dir, f"{module}.py")) & available)
+    return needed
+
+
+def handler_files(handler_module, lambda_dir=LAMBDA_DIR):
+    return sorted(f"{module}.py" for module in handler_modules(handler_module, lambda_dir))
+
+
+def bundle_excludes(handler_module, lambda_dir=LAMBDA_DIR):
+    """Asset exclude patterns that leave only this handler's files in the bundle."""
+    keep = set(handler_files(handler_module, lambda_dir))
+    others = {name for name in os.listdir(lambda_dir) if name not in keep}
+    return sorted(others | {"__pycache__", "*.pyc"})
@@ -0,0 +1,64 @@
+"""Lambda memory and SQS event source settings per function, read by the stacks at synth time.
+
+`cdk deploy -c tuning_profile=prod` loads tuning_profiles/prod.json (or a
+path), as written by `python -m benchmarks.tune`; the tuner and the unit
+tests load it too. Without a profile the stacks keep DEFAULTS.
+
+    {"functions": {"worker": {"memory_size": 256, "batch_size": 10,
+                              "max_batching_window_s": 1, "max_concurrency": 4}, ...}}
+"""
+import json
+import os
+
+PROFILE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "tuning_profiles")
+
+# What the stacks shipped with before profiles existed
+DEFAULTS = {
+    "receiver": {"memory_size": 128},
+    "worker": {"memory_size": 128, "batch_size": 10, "max_batching_window_s": 0, "max_concurrency": None},
+    "middleware": {"memory_size": 128, "batch_size": 10, "max_batching_window_s": 0, "max_concurrency": None},
+}
+
+# Deliveries before SQS dead-letters a message (`-c max_receive_count=N` overrides it). A
+# postponed message (lambda/backpressure.py) is received once per circuit-open period, and
+# each receive counts: 60 rides out an agent or ServiceNow outage of at least 4 hours.
+MAX_RECEIVE_COUNT = 60
+
+
+def _check(function, settings):
+    memory = settings["memory_size"]
+    if not 128 <= memory <= 10240:
+        raise ValueError(f"{function}: memory_size must be 128-10240 MB, got {memory}")
+    if "batch_size" not in settings:
+        return
+    batch_size, window = settings["batch_size"], settings["max_batching_window_s"]
+    concurrency = settings["max_concurrency"]
+    if not 1 <= batch_size <= 10000:
+        raise ValueError(f"{function}: batch_size must be 1-10000, got {batch_size}")
+    # SQS event source rules: whole seconds, and batches above 10 need a window
+    if not (isinstance(window, int) and 0 <= window <= 300):
+        raise ValueError(f"{function}: max_batching_window_s must be whole seconds 0-300, got {window}")
+    if batch_size > 10 and not window:
+        raise ValueError(f"{function}: batch_size {batch_size} needs max_batching_window_s >= 1")
+    if concurrency is not None and not 2 <= concurrency <= 1000:
+        raise ValueError(f"{function}: max_concurrency must be 2-1000, got {concurrency}")
+
+
+def load_profile(name=None):
+    """Settings per function ("receiver", "worker", "middleware"): the profile over DEFAULTS."""
+    functions = {}
+    if name:
+        path = name if name.endswith(".json") or os.sep in name else os.path.join(PROFILE_DIR, f"{name}.json")
+        if not os.path.exists(path):
+            raise ValueError(f"Tuning profile not found: {path}")
+        with open(path, encoding="utf-8") as f:
+            functions = json.load(f).get("functions", {})
+        unknown = set(functions) - set(DEFAULTS)
+        if unknown:
+            raise ValueError(f"Unknown functions in tuning profile {path}: {sorted(unknown)}")
+    profile = {}
+    for function, defaults in DEFAULTS.items():
+        settings = dict(defaults, **{k: v for k, v in functions.get(function, {}).items() if k in defaults})
+        _check(function, settings)
+        profile[function] = settings
+    return profile
@@ -0,0 +1,100 @@
+import base64
+import datetime
+import hashlib
+import hmac
+import json
+
+# Fields of the agent payload that the DevOps Agent actually acts on. Two events
+# with the same values here are the same event as far as the agent is concerned.
+AGENT_VISIBLE_FIELDS = ("incidentId", "title", "action", "priority", "description")
+
+
+def incident_data(body):
+    return body.get('incident', body)
+
+
+def incident_key(body):
+    """Stable identity of the incident an event refers to (sys_id, falling back to number)."""
+    inc_data = incident_data(body)
+    return inc_data.get('sys_id') or inc_data.get('number')
+
+
+def event_content_key(record):
+    """Idempotency content key of an SQS record carrying a Business Rule event.
+
+    A body identifies one update only if it carries sys_mod_count or
+    sys_updated_on: without them, resolve -> reopen -> resolve sends the same
+    body twice. Those records get None and are deduplicated on messageId only.
+    """
+    try:
+        inc_data = incident_data(json.loads(record['body']))
+        versioned = inc_data.get('sys_mod_count') or inc_data.get('sys_updated_on')
+    except (ValueError, AttributeError, TypeError):
+        return None
+    return hashlib.sha256(record['body'].encode('utf-8')).hexdigest() if versioned else None
+
+
+def agent_action(body):
+    event_type = body.get('event_type', 'incident_created')
+    if "resolve" in event_type or "close" in event_type:
+        return "resolved"
+    return "created"
+
+
+def agent_priority(inc_data):
+    p_val = str(inc_data.get('priority', '3'))
+    if '1' in p_val:
+        return 'CRITICAL'
+    if '2' in p_val:
+        return 'HIGH'
+    return 'MEDIUM'
+
+
+def incident_priority(body):
+    """ServiceNow priority as a number ("1 - Critical" -> 1); unknown priorities sort last."""
+    p_val = str(incident_data(body).get('priority', '')).strip()
+    digits = p_val[:len(p_val) - len(p_val.lstrip('0123456789'))]
+    return int(digits) if digits else 5
+
+
+def utc_timestamp():
+    return datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def build_agent_payload(body, timestamp=None):
+    """Map a ServiceNow Business Rule payload to a DevOps Agent incident event."""
+    inc_data = incident_data(body)
+    inc_id = inc_data.get('number', 'UNKNOWN')
+    return {
+        "eventType": "incident",
+        "incidentId": str(inc_id),
+        "title": f"[{inc_id}] {inc_data.get('short_description', '')}",
+        "action": agent_action(body),
+        "priority": agent_priority(inc_data),
+        "description": inc_data.get('description', ''),
+        "timestamp": timestamp or utc_timestamp()
+    }
+
+
+def sign_agent_payload(agent_payload, secret_string):
+    """Serialize and HMAC-sign an agent payload; returns (body, headers) for the webhook POST."""
+    timestamp = agent_payload['timestamp']
+    payload_str = json.dumps(agent_payload, separators=(',', ':'))
+    string_to_sign = f"{timestamp}:{payload_str}"
+
+    signature_bytes = hmac.new(secret_string.encode('utf-8'), string_to_sign.encode('utf-8'), hashlib.sha256).digest()
+    signature_b64 = base64.b64encode(signature_bytes).decode('utf-8')
+
+    headers = {
+        "Content-Type": "application/json",
+        "x-amzn-event-signature": signature_b64,
+        "x-amzn-event-timestamp": timestamp
+    }
+    return payload_str, headers
+
+
+def agent_fingerprint(body):
+    """Hash of the agent-visible fields of the event body (timestamp excluded)."""
+    agent_payload = build_agent_payload(body, timestamp="-")
+    visible = [agent_payload[field] for field in AGENT_VISIBLE_FIELDS]
+    return hashlib.sha256(json.dumps(visible, separators=(',', ':')).encode('utf-8')).hexdigest()
@@ -0,0 +1,31 @@
+import threading
+
+# boto3 is imported and each client built on first use only, so a handler never
+# pays for a client (or for boto3 itself) on a path that does not need it.
+_CLIENTS = {}
+_LOCK = threading.Lock()
+
+
+def get_client(service_name):
+    client = _CLIENTS.get(service_name)
+    if client is None:
+        with _LOCK:
+            client = _CLIENTS.get(service_name)
+            if client is None:
+                import boto3
+                client = _CLIENTS[service_name] = boto3.client(service_name)
+    return client
+
+
+def warm(*service_names):
+    """Build clients ahead of first use (init with SnapStart / provisioned concurrency)."""
+    for service_name in service_names:
+        get_client(service_name)
+
+
+def close_all():
+    """Close every client's pooled connections; the clients reconnect on their next call."""
+    for client in list(_CLIENTS.values()):
+        close = getattr(client, 'close', None)
+        if close is not None:
+            close()
@@ -0,0 +1,237 @@
+import logging
+import os
+import random
+import threading
+import time
+
+from aws_clients import get_client
+from batch_processing import MAX_WORKERS
+
+logger = logging.getLogger()
+
+# Consecutive overload failures (429/5xx/connection errors) that open the circuit
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))
+# First open period; doubles every time a half-open probe fails, up to the max
+BREAKER_OPEN_SECONDS = float(os.environ.get('BREAKER_OPEN_SECONDS', '10'))
+BREAKER_MAX_OPEN_SECONDS = float(os.environ.get('BREAKER_MAX_OPEN_SECONDS', '300'))
+# AIMD: concurrent calls per destination start at (and grow back to) the
+# handler's concurrency, halve on every overload signal, never below the minimum
+LIMIT_MIN = int(os.environ.get('CONCURRENCY_LIMIT_MIN', '1'))
+LIMIT_MAX = int(os.environ.get('CONCURRENCY_LIMIT_MAX', str(MAX_WORKERS)))
+# A throttled-but-closed destination still postpones its messages a little
+POSTPONE_BASE_SECONDS = float(os.environ.get('POSTPONE_BASE_SECONDS', '2'))
+SQS_MAX_VISIBILITY_SECONDS = 43200
+
+
+class Backpressure(Exception):
+    """A destination is overloaded; retry the work in `retry_in` seconds."""
+
+    def __init__(self, message, destination, retry_in, status=None):
+        super().__init__(message)
+        self.destination = destination
+        self.retry_in = retry_in
+        self.status = status
+
+
+class CircuitOpen(Backpressure):
+    pass
+
+
+class Overloaded(Backpressure):
+    pass
+
+
+def is_overload(status):
+    return status == 429 or status >= 500
+
+
+class CircuitBreaker:
+    """closed -> open after `threshold` consecutive failures -> half-open (one probe) after the open period."""
+
+    def __init__(self, threshold=BREAKER_FAILURE_THRESHOLD, open_seconds=BREAKER_OPEN_SECONDS,
+                 max_open_seconds=BREAKER_MAX_OPEN_SECONDS, clock=time.monotonic):
+        self.threshold = threshold
+        self.base_open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.open_seconds = open_seconds
+        self.opened_at = 0.0
+        self._probing = False
+
+    def retry_in(self):
+        """Seconds until the circuit lets calls through again (0 when closed)."""
+        with self._lock:
+            if self.state == "closed":
+                return 0.0
+            return max(0.0, self.opened_at + self.open_seconds - self._clock())
+
+    def allow(self):
+        """True if a call may go out now; half-open admits a single probe."""
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self._clock() < self.opened_at + self.open_seconds or self._probing:
+                return False
+            self.state = "half_open"
+            self._probing = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != "closed":
+                logger.info("Circuit closed")
+            self.state = "closed"
+            self.failures = 0
+            self.open_seconds = self.base_open_seconds
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open":
+                # The probe failed: stay away for longer
+                self.open_seconds = min(self.open_seconds * 2, self.max_open_seconds)
+                self._open()
+            elif self.state == "closed" and self.failures >= self.threshold:
+                self._open()
+
+    def _open(self):
+        logger.warning(f"Circuit open for {self.open_seconds:.0f}s after {self.failures} failures")
+        self.state = "open"
+        self.opened_at = self._clock()
+        self._probing = False
+
+
+class AIMDLimiter:
+    """Adaptive concurrency limit: +1 per limit successes (additive), halved on overload (multiplicative)."""
+
+    def __init__(self, initial=LIMIT_MAX, minimum=LIMIT_MIN, maximum=LIMIT_MAX):
+        self.minimum = minimum
+        self.maximum = max(minimum, maximum)
+        self.limit = float(min(max(initial, minimum), self.maximum))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+
+    def release(self, overloaded=False):
+        with self._cond:
+            self.in_flight -= 1
+            if overloaded:
+                self.limit = max(self.minimum, self.limit / 2)
+            else:
+                self.limit = min(self.maximum, self.limit + 1 / self.limit)
+            self._cond.notify_all()
+
+
+class Destination:
+    """Circuit breaker + AIMD limiter in front of one downstream endpoint.
+
+    State is per container: each concurrent Lambda environment learns about
+    an overloaded endpoint on its own, within a few calls.
+    """
+
+    def __init__(self, name, breaker=None, limiter=None):
+        self.name = name
+        self.breaker = breaker or CircuitBreaker()
+        self.limiter = limiter or AIMDLimiter()
+
+    def postpone_seconds(self, retry_after=None):
+        """How long to hide a message that failed against this destination."""
+        if self.breaker.state != "closed":
+            seconds = self.breaker.retry_in() or self.breaker.open_seconds
+        else:
+            seconds = POSTPONE_BASE_SECONDS * (2 ** min(self.breaker.failures, 8))
+        seconds = max(seconds, retry_after or 0)
+        # Jitter so postponed messages do not all come back in the same second
+        return int(min(SQS_MAX_VISIBILITY_SECONDS, seconds * random.uniform(1.0, 1.5))) + 1
+
+    def call(self, fn):
+        """Run fn() -> HTTP response through the breaker and limiter.
+
+        Raises CircuitOpen without calling fn while the circuit is open, and
+        Overloaded for 429/5xx responses; other responses are returned as is.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpen(f"{self.name} circuit open", self.name, self.postpone_seconds())
+        self.limiter.acquire()
+        overloaded = True
+        try:
+            response = fn()
+            overloaded = is_overload(response.status)
+        except Exception:
+            self.breaker.record_failure()
+            raise
+        finally:
+            self.limiter.release(overloaded)
+        if overloaded:
+            self.breaker.record_failure()
+            retry_after = _retry_after(response)
+            raise Overloaded(f"{self.name} returned {response.status}", self.name,
+                             self.postpone_seconds(retry_after), response.status)
+        self.breaker.record_success()
+        return response
+
+    def wrap(self, http):
+        """An http-like object whose requests go through this destination."""
+        return _GuardedHttp(http, self)
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+
+class _GuardedHttp:
+    def __init__(self, http, destination):
+        self.http = http
+        self.destination = destination
+
+    def request(self, *args, **kwargs):
+        return self.destination.call(lambda: self.http.request(*args, **kwargs))
+
+
+_DESTINATIONS = {}
+_LOCK = threading.Lock()
+
+
+def get_destination(name):
+    with _LOCK:
+        if name not in _DESTINATIONS:
+            _DESTINATIONS[name] = Destination(name)
+        return _DESTINATIONS[name]
+
+
+def queue_url_from_arn(arn):
+    # arn:aws:sqs:<region>:<account>:<name>
+    _, partition, _, region, account, name = arn.split(':', 5)
+    domain = "amazonaws.com.cn" if partition == "aws-cn" else "amazonaws.com"
+    return f"https://sqs.{region}.{domain}/{account}/{name}"
+
+
+def postpone(record, seconds):
+    """Hide an SQS record for `seconds` instead of letting it come straight back."""
+    try:
+        get_client('sqs').change_message_visibility(
+            QueueUrl=queue_url_from_arn(record['eventSourceARN']),
+            ReceiptHandle=record['receiptHandle'],
+            VisibilityTimeout=int(seconds),
+        )
+        logger.info(f"Postponed {record.get('messageId')} by {int(seconds)}s")
+    except Exception as e:
+        logger.warning(f"Could not postpone {record.get('messageId')}: {str(e)}")
+
+
+def postpone_on_backpressure(record, error):
+    """process_batch on_error hook: failed records of an overloaded destination come back later."""
+    if isinstance(error, Backpressure):
+        postpone(record, error.retry_in)
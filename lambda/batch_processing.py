@@ -0,0 +1,83 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+logger = logging.getLogger()
+
+# Upper bound on concurrent records per invocation. Matches the SQS batch size
+# by default; the urllib3 pool should be sized to the same value.
+MAX_WORKERS = int(os.environ.get('MAX_WORKERS', '10'))
+
+
+def message_attribute(record, name):
+    """String value of an SQS message attribute on a Lambda record, or None."""
+    attribute = (record.get('messageAttributes') or {}).get(name) or {}
+    return attribute.get('stringValue')
+
+
+def group_records(records, key=None):
+    """Split records into ordered groups; records sharing key(record) stay together in arrival order."""
+    if key is None:
+        return [[record] for record in records]
+    groups = {}
+    ungrouped = []
+    for record in records:
+        k = key(record)
+        if k is None:
+            ungrouped.append([record])
+        else:
+            groups.setdefault(k, []).append(record)
+    return list(groups.values()) + ungrouped
+
+
+def _run_group(group, handler, on_error=None, dead_letter=None):
+    # Records in a group run strictly in order. Once one fails, the rest of the
+    # group is not attempted and is reported as failed too, so the retry replays
+    # them in the original order instead of letting later commands overtake it.
+    # A record dead_letter() takes out of the queue does not hold the group back.
+    for i, record in enumerate(group):
+        try:
+            handler(record)
+        except Exception as e:
+            if dead_letter is not None and dead_letter(record, e):
+                continue
+            logger.error(f"Record {record.get('messageId')} failed: {str(e)}")
+            skipped = group[i + 1:]
+            if skipped:
+                logger.warning(f"Deferring {len(skipped)} later record(s) queued behind {record.get('messageId')}")
+            if on_error is not None:
+                for failed in group[i:]:
+                    on_error(failed, e)
+            return [r['messageId'] for r in group[i:]]
+    return []
+
+
+def process_batch(records, handler, max_workers=MAX_WORKERS, key=None, on_error=None, priority=None,
+                  dead_letter=None):
+    """Run handler(record) for every SQS record on a bounded thread pool.
+
+    With `key`, records that share key(record) are processed sequentially in
+    arrival order while different keys still run concurrently. `on_error(record, exc)`
+    is called for every record reported as failed (e.g. to postpone it).
+    `dead_letter(record, exc)` is asked first: when it returns True the record
+    was moved to a dead-letter queue and counts as processed.
+    With `priority`, groups holding the most urgent record (lowest
+    priority(record)) are started first; order within a group is unchanged.
+
+    Returns an SQS partial batch response so only the failed records are
+    redelivered (requires ReportBatchItemFailures on the event source).
+    """
+    failures = []
+    groups = group_records(records, key)
+    if priority is not None:
+        groups.sort(key=lambda group: min(priority(record) for record in group))
+    if not groups:
+        return {"batchItemFailures": failures}
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as pool:
+        futures = [pool.submit(_run_group, group, handler, on_error, dead_letter) for group in groups]
+        for future in as_completed(futures):
+            failures.extend({"itemIdentifier": message_id} for message_id in future.result())
+
+    logger.info(f"Batch done: {len(records) - len(failures)} ok, {len(failures)} failed")
+    return {"batchItemFailures": failures}
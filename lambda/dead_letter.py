@@ -0,0 +1,108 @@
+"""Poison-message isolation for the SQS consumers.
+
+Each consumer queue has a dead-letter queue named after it (`<queue>-DLQ`,
+`<queue>-DLQ.fifo` for FIFO queues) that SQS moves a message to after the
+queue's maxReceiveCount. That is right for transient failures (timeouts,
+throttling, an unavailable webhook), but a message that can never succeed
+(malformed JSON, an event the agent rejects with a 4xx) would still be retried
+maxReceiveCount times, holding back the records queued behind it.
+
+Only errors that say so are permanent: PermanentError, raised where a payload
+is parsed (load_payload) or rejected with a 4xx, and errors carrying one of
+PERMANENT_STATUSES. A KeyError or TypeError from a bug in a handler is left
+to the normal retries, so a bad deploy cannot dead-letter valid traffic.
+
+process_batch(..., dead_letter=DEAD_LETTERS.isolate) sends such a record to
+the DLQ at once, with the reason as message attributes, and reports it as
+processed; the rest of its group carries on. `python main.py redrive` replays
+dead-lettered messages once the fix has shipped.
+"""
+import json
+import logging
+import time
+
+from aws_clients import get_client
+from backpressure import Backpressure, queue_url_from_arn
+
+logger = logging.getLogger()
+
+DLQ_SUFFIX = "-DLQ"
+# Responses meaning the request itself is wrong: sending it again gets the same answer
+PERMANENT_STATUSES = frozenset({400, 404, 405, 410, 413, 415, 422})
+# Attributes added to a dead-lettered message (SQS allows 10 per message)
+REASON_ATTRIBUTES = ("dead_letter_error", "dead_letter_reason", "dead_letter_failed_at")
+
+
+class PermanentError(Exception):
+    """A failure that retrying the same message cannot fix."""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def is_permanent(error):
+    if isinstance(error, Backpressure):
+        return False
+    if isinstance(error, PermanentError):
+        return True
+    return getattr(error, 'status', None) in PERMANENT_STATUSES
+
+
+def load_payload(record, required=None):
+    """The JSON object in an SQS record's body.
+
+    Raises PermanentError when the body is not one, or when required(payload)
+    is false (wrong shape): those fail the same way on every delivery.
+    """
+    try:
+        payload = json.loads(record['body'])
+    except (KeyError, TypeError, ValueError) as e:
+        raise PermanentError(f"Malformed message body: {str(e)}") from e
+    if not isinstance(payload, dict) or (required is not None and not required(payload)):
+        raise PermanentError("Message body does not have the expected shape")
+    return payload
+
+
+def dead_letter_queue_url(source_arn):
+    url = queue_url_from_arn(source_arn)
+    if url.endswith(".fifo"):
+        return url[:-len(".fifo")] + DLQ_SUFFIX + ".fifo"
+    return url + DLQ_SUFFIX
+
+
+class DeadLetterQueue:
+    def __init__(self, metrics=None):
+        self.metrics = metrics
+
+    def isolate(self, record, error):
+        """process_batch dead_letter hook: True if the record was moved to its DLQ (permanent failures only)."""
+        if not is_permanent(error) or not record.get('eventSourceARN'):
+            return False
+        attributes = {
+            name: {'DataType': value.get('dataType', 'String'), 'StringValue': value['stringValue']}
+            for name, value in (record.get('messageAttributes') or {}).items()
+            if value.get('stringValue') is not None and name not in REASON_ATTRIBUTES
+        }
+        attributes.update({
+            "dead_letter_error": {'DataType': 'String', 'StringValue': type(error).__name__},
+            "dead_letter_reason": {'DataType': 'String', 'StringValue': str(error)[:1024] or "-"},
+            "dead_letter_failed_at": {'DataType': 'Number', 'StringValue': str(int(time.time() * 1000))},
+        })
+        options = {}
+        group = record.get('attributes', {}).get('MessageGroupId')
+        if group:
+            options = {'MessageGroupId': group, 'MessageDeduplicationId': record['messageId']}
+        try:
+            get_client('sqs').send_message(
+                QueueUrl=dead_letter_queue_url(record['eventSourceARN']),
+                MessageBody=record['body'], MessageAttributes=attributes, **options
+            )
+        except Exception as e:
+            # Left to the normal retries, and to SQS's own redrive after maxReceiveCount
+            logger.error(f"Could not dead-letter {record.get('messageId')}: {str(e)}")
+            return False
+        logger.warning(f"Dead-lettered {record.get('messageId')} ({type(error).__name__}): {str(error)}")
+        if self.metrics is not None:
+            self.metrics.increment("dead_lettered")
+        return True
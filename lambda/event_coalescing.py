@@ -0,0 +1,77 @@
+import json
+import logging
+import os
+
+from agent_events import agent_action, agent_fingerprint, incident_key
+from state_store import build_store
+
+logger = logging.getLogger()
+
+# How long we remember what was last forwarded for an incident.
+FINGERPRINT_TTL_SECONDS = int(os.environ.get('FINGERPRINT_TTL_SECONDS', str(7 * 24 * 3600)))
+
+
+def _send_order(record):
+    # FIFO records also carry a SequenceNumber, which orders sends within the same millisecond
+    attributes = record.get('attributes', {})
+    return int(attributes.get('SentTimestamp', 0)), int(attributes.get('SequenceNumber', 0))
+
+
+def coalesce_records(records):
+    """Collapse a batch to the latest event per incident and agent action.
+
+    Consecutive events for the same incident that map to the same agent action
+    (e.g. created, updated, updated) are replaced by the latest one. A change of
+    action (created -> resolved) is kept so the agent never sees a resolve for an
+    incident it was not told about. Records that cannot be parsed are kept as-is
+    and fail in the handler.
+
+    Returns (kept, superseded), kept in send order.
+    """
+    kept = []
+    superseded = []
+    last_for_incident = {}
+
+    for record in sorted(records, key=_send_order):
+        try:
+            body = json.loads(record['body'])
+            key = incident_key(body)
+            action = agent_action(body)
+        except (ValueError, AttributeError, TypeError):
+            kept.append(record)
+            continue
+        if not key:
+            kept.append(record)
+            continue
+
+        previous = last_for_incident.get(key)
+        if previous is not None and previous[1] == action:
+            index = kept.index(previous[0])
+            superseded.append(kept[index])
+            kept[index] = record
+        else:
+            kept.append(record)
+        last_for_incident[key] = (record, action)
+
+    if superseded:
+        logger.info(f"Coalesced {len(superseded)} superseded event(s) out of {len(records)}")
+    return sorted(kept, key=_send_order), superseded
+
+
+class FingerprintStore:
+    """Remembers the agent-visible fingerprint last forwarded for each incident."""
+
+    def __init__(self, store=None, ttl=FINGERPRINT_TTL_SECONDS):
+        self.store = store if store is not None else build_store()
+        self.ttl = ttl
+
+    def is_unchanged(self, body):
+        key = incident_key(body)
+        if not key:
+            return False
+        return self.store.get(f"fp#{key}") == agent_fingerprint(body)
+
+    def remember(self, body):
+        key = incident_key(body)
+        if key:
+            self.store.put(f"fp#{key}", agent_fingerprint(body), self.ttl)
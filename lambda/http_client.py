@@ -0,0 +1,169 @@
+import json
+import logging
+import os
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import urllib3
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger()
+
+# Defaults sized for the functions' short Lambda timeouts: a hung endpoint
+# costs at most connect + read per attempt instead of the whole invocation.
+CONNECT_TIMEOUT_SECONDS = float(os.environ.get('HTTP_CONNECT_TIMEOUT_SECONDS', '1.0'))
+READ_TIMEOUT_SECONDS = float(os.environ.get('HTTP_READ_TIMEOUT_SECONDS', '2.0'))
+# Per-host overrides, matched on the host name suffix: {"service-now.com": [1.0, 5.0]}
+HOST_TIMEOUTS = json.loads(os.environ.get('HTTP_HOST_TIMEOUTS', '{}'))
+MAX_RETRIES = int(os.environ.get('HTTP_MAX_RETRIES', '2'))
+BACKOFF_BASE_SECONDS = float(os.environ.get('HTTP_BACKOFF_BASE_SECONDS', '0.1'))
+BACKOFF_MAX_SECONDS = float(os.environ.get('HTTP_BACKOFF_MAX_SECONDS', '1.0'))
+# Retry-After is honoured up to this long in-process; longer waits belong to the SQS retry
+RETRY_AFTER_MAX_SECONDS = float(os.environ.get('HTTP_RETRY_AFTER_MAX_SECONDS', '1.0'))
+
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class JitteredRetry(Retry):
+    """urllib3 Retry with full-jitter exponential backoff and a capped Retry-After.
+
+    429 is retried for every method: the server refused the request without
+    processing it, so even a non-idempotent POST is safe to send again.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429 and self.total:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_backoff_time(self):
+        retries = len(self.history)
+        if retries == 0:
+            return 0
+        return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * (2 ** (retries - 1))))
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        if retry_after is None:
+            return None
+        return min(retry_after, RETRY_AFTER_MAX_SECONDS)
+
+
+def retry_policy(method, idempotent=None, total=MAX_RETRIES):
+    """Retries for one request.
+
+    Idempotent requests (GET etc., or callers passing idempotent=True for a
+    PATCH/POST that sets fixed values) are retried on connection errors,
+    read errors and 429/5xx. Other requests only when they cannot have been
+    processed: connection failures and 429.
+    """
+    method = method.upper()
+    if idempotent is None:
+        idempotent = method in IDEMPOTENT_METHODS
+    return JitteredRetry(
+        total=total,
+        allowed_methods=IDEMPOTENT_METHODS | {method} if idempotent else IDEMPOTENT_METHODS,
+        status_forcelist=RETRY_STATUSES if idempotent else None,
+        raise_on_status=False,
+        respect_retry_after_header=True,
+    )
+
+
+def host_timeout(url):
+    host = urlsplit(url).hostname or ''
+    for suffix, (connect, read) in HOST_TIMEOUTS.items():
+        if host == suffix or host.endswith('.' + suffix):
+            return urllib3.Timeout(connect=connect, read=read)
+    return urllib3.Timeout(connect=CONNECT_TIMEOUT_SECONDS, read=READ_TIMEOUT_SECONDS)
+
+
+class HttpClient:
+    """Shared urllib3 client: one pool per host sized to the handler's concurrency,
+    per-host timeouts, safe retries and gzip.
+
+    Counts requests, retries, errors (no response after retries) and new
+    connections (requests - new connections = reused) in `stats()` and, when
+    given a Metrics instance, as EMF counts.
+    """
+
+    def __init__(self, maxsize=1, metrics=None):
+        self.metrics = metrics
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "retries": 0, "errors": 0, "new_connections": 0}
+        self.pool = urllib3.PoolManager(maxsize=maxsize)
+        self.pool.pool_classes_by_scheme = {
+            'http': self._counting(HTTPConnectionPool),
+            'https': self._counting(HTTPSConnectionPool),
+        }
+
+    def _counting(self, pool_class):
+        client = self
+
+        class CountingPool(pool_class):
+            def _new_conn(self):
+                client._count("new_connections")
+                return super()._new_conn()
+
+        return CountingPool
+
+    def _count(self, name, n=1):
+        if not n:
+            return
+        with self._lock:
+            self._stats[name] += n
+        if self.metrics is not None:
+            self.metrics.increment(f"http_{name}", n)
+
+    def request(self, method, url, body=None, headers=None, idempotent=None, timeout=None, retries=None,
+                preload_content=True):
+        """urllib3-compatible request(); `timeout`/`retries` override the per-host defaults.
+
+        With preload_content=False the body is read by the caller (response.stream()),
+        who must release_conn() afterwards.
+        """
+        headers = dict(headers or {})
+        headers.setdefault('Accept-Encoding', 'gzip')
+        self._count("requests")
+        try:
+            response = self.pool.request(
+                method, url, body=body, headers=headers,
+                timeout=timeout if timeout is not None else host_timeout(url),
+                retries=retries if retries is not None else retry_policy(method, idempotent),
+                preload_content=preload_content,
+            )
+        except urllib3.exceptions.HTTPError:
+            self._count("errors")
+            raise
+        if response.retries is not None and response.retries.history:
+            self._count("retries", len(response.retries.history))
+            logger.info(f"{method} {urlsplit(url).hostname} returned {response.status} "
+                        f"after {len(response.retries.history)} retries")
+        return response
+
+    def prewarm(self, urls, connections=1):
+        """Open `connections` pooled connections (TCP + TLS) to each URL's host with a HEAD request.
+
+        Best effort: a host that cannot be reached is logged and left to the first real request.
+        """
+        def head(url):
+            try:
+                self.pool.request('HEAD', url, timeout=host_timeout(url), retries=False)
+            except urllib3.exceptions.HTTPError as e:
+                logger.warning(f"Pre-warming {urlsplit(url).hostname} failed: {str(e)}")
+
+        # Concurrent, so each request needs its own connection
+        targets = [url for url in urls for _ in range(connections)]
+        with ThreadPoolExecutor(max_workers=max(1, len(targets))) as pool:
+            list(pool.map(head, targets))
+
+    def close(self):
+        """Drop every pooled connection (before a SnapStart snapshot: sockets do not survive restore)."""
+        self.pool.clear()
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
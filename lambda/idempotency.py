@@ -0,0 +1,78 @@
+import hashlib
+import logging
+import os
+
+from state_store import build_store
+
+logger = logging.getLogger()
+
+# How long a completion is remembered. Should cover the queue's retention
+# period and the window in which Slack retries a slash command.
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', str(24 * 3600)))
+
+
+def content_hash(body):
+    if isinstance(body, str):
+        body = body.encode('utf-8')
+    return hashlib.sha256(body).hexdigest()
+
+
+def body_hash(record):
+    return content_hash(record['body'])
+
+
+class IdempotencyStore:
+    """Completion records for SQS records (and Slack commands) that must not be processed twice.
+
+    A record is done once its SQS messageId (a redelivery) or its content key (the
+    same message sent twice) has been completed. content_key(record) returns None
+    for bodies that do not identify one request (a later, equal body is a new
+    request): those are keyed on messageId only. Records live in the shared
+    state table when configured, otherwise only in this container.
+    """
+
+    def __init__(self, namespace, store=None, ttl=IDEMPOTENCY_TTL_SECONDS, content_key=body_hash):
+        self.namespace = namespace
+        self.store = store if store is not None else build_store()
+        self.ttl = ttl
+        self.content_key = content_key
+
+    def keys(self, record):
+        keys = [f"idem#{self.namespace}#msg#{record['messageId']}"]
+        content = self.content_key(record)
+        if content:
+            keys.append(f"idem#{self.namespace}#sha#{content}")
+        return keys
+
+    def split(self, records):
+        """One lookup for the whole batch; returns (pending, duplicates).
+
+        A record whose body already appeared earlier in the same batch is a
+        duplicate too: the earlier one does the work (and is retried if it fails).
+        """
+        keys = {record['messageId']: self.keys(record) for record in records}
+        done = self.store.get_many([key for record_keys in keys.values() for key in record_keys])
+        pending, duplicates = [], []
+        seen = set()
+        for record in records:
+            record_keys = keys[record['messageId']]
+            if seen.intersection(record_keys[1:]) or any(key in done for key in record_keys):
+                duplicates.append(record)
+            else:
+                pending.append(record)
+                seen.update(record_keys[1:])
+        if duplicates:
+            logger.info(f"Idempotency: skipping {len(duplicates)} already processed record(s)")
+        return pending, duplicates
+
+    def complete(self, record):
+        self.store.put_many({key: True for key in self.keys(record)}, self.ttl)
+
+    def claim(self, key):
+        """First caller for key gets True; later callers (retries) get False."""
+        stored, _ = self.store.put_if_absent(f"idem#{self.namespace}#{key}", True, self.ttl)
+        return stored
+
+    def release(self, key):
+        """Undo a claim whose work failed, so a retry can do it."""
+        self.store.delete(f"idem#{self.namespace}#{key}")
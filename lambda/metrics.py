@@ -0,0 +1,153 @@
+import functools
+import json
+import os
+import random
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# Stage timings are written to stdout as CloudWatch Embedded Metric Format (EMF)
+# lines; CloudWatch Logs turns them into metrics, no API calls from the handler.
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'ChatOps')
+# Share of invocations whose timings are emitted; "error" outcomes are always emitted
+METRICS_SAMPLE_RATE = float(os.environ.get('METRICS_SAMPLE_RATE', '1.0'))
+# EMF accepts at most 100 values per metric per line
+MAX_VALUES_PER_LINE = 100
+
+DIMENSION_SETS = [
+    ["Function", "Stage", "Outcome"],
+    ["Function", "Stage", "Action", "Outcome", "Status"],
+    ["Function", "Stage", "ColdStart"],
+    ["Function", "Stage", "BatchSize"],
+]
+
+_cold_start = True
+
+
+def write_line(line):
+    sys.stdout.write(line + "\n")
+
+
+class Stage:
+    """One timed stage; set `outcome`, `status` or `action` before it ends."""
+
+    def __init__(self, name, action="-", outcome="ok", status="-"):
+        self.name = name
+        self.action = action
+        self.outcome = outcome
+        self.status = status
+
+
+class Metrics:
+    """Per-stage durations for one handler, emitted once per invocation as EMF.
+
+    Durations of the same stage/action/outcome/status are grouped into one
+    line (EMF value arrays), so the log volume grows with the number of
+    distinct outcomes, not with the batch size. Lambda runs one invocation at
+    a time per container, so the current invocation is kept on the instance
+    and shared by the batch worker threads.
+    """
+
+    def __init__(self, function_name, namespace=METRICS_NAMESPACE, sample_rate=METRICS_SAMPLE_RATE,
+                 enabled=METRICS_ENABLED):
+        self.function_name = function_name
+        self.namespace = namespace
+        self.sample_rate = sample_rate
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._records = {}
+        self._counts = {}
+        self._dimensions = {}
+        self._sampled = True
+
+    def start(self, batch_size=1):
+        global _cold_start
+        with self._lock:
+            self._records = {}
+            self._counts = {}
+            self._dimensions = {"ColdStart": str(_cold_start).lower(), "BatchSize": str(batch_size)}
+            self._sampled = random.random() < self.sample_rate
+            _cold_start = False
+
+    def handler(self, fn):
+        """Decorator for a lambda_handler: times the whole invocation and flushes the metrics."""
+        @functools.wraps(fn)
+        def wrapper(event, context):
+            self.start(batch_size=len(event.get('Records') or [event]))
+            try:
+                with self.stage("invocation"):
+                    return fn(event, context)
+            finally:
+                self.flush()
+        return wrapper
+
+    @contextmanager
+    def stage(self, name, action="-", status="-"):
+        stage = Stage(name, action, status=status)
+        started = time.perf_counter()
+        try:
+            yield stage
+        except BaseException as e:
+            stage.outcome = "error"
+            stage.status = getattr(e, 'status', None) or stage.status
+            raise
+        finally:
+            self.record(stage, (time.perf_counter() - started) * 1000)
+
+    def record(self, stage, duration_ms):
+        key = (stage.name, str(stage.action), str(stage.outcome), str(stage.status))
+        with self._lock:
+            self._records.setdefault(key, []).append(round(duration_ms, 2))
+
+    def increment(self, name, n=1):
+        """Add to a per-invocation counter (emitted as a Count metric, e.g. http_retries)."""
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def flush(self):
+        with self._lock:
+            records, self._records = self._records, {}
+            counts, self._counts = self._counts, {}
+            dimensions, sampled = self._dimensions, self._sampled
+        if not self.enabled:
+            return
+        timestamp = int(time.time() * 1000)
+        if counts and sampled:
+            write_line(json.dumps({
+                "_aws": {
+                    "Timestamp": timestamp,
+                    "CloudWatchMetrics": [{
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Function"], ["Function", "ColdStart"]],
+                        "Metrics": [{"Name": name, "Unit": "Count"} for name in sorted(counts)],
+                    }],
+                },
+                "Function": self.function_name,
+                **dimensions,
+                "SampleRate": self.sample_rate,
+                **counts,
+            }, separators=(',', ':')))
+        for (name, action, outcome, status), values in records.items():
+            if not sampled and outcome != "error":
+                continue
+            for i in range(0, len(values), MAX_VALUES_PER_LINE):
+                write_line(json.dumps({
+                    "_aws": {
+                        "Timestamp": timestamp,
+                        "CloudWatchMetrics": [{
+                            "Namespace": self.namespace,
+                            "Dimensions": DIMENSION_SETS,
+                            "Metrics": [{"Name": "Duration", "Unit": "Milliseconds"}],
+                        }],
+                    },
+                    "Function": self.function_name,
+                    "Stage": name,
+                    "Action": action,
+                    "Outcome": outcome,
+                    "Status": status,
+                    **dimensions,
+                    "SampleRate": self.sample_rate,
+                    "Duration": values[i:i + MAX_VALUES_PER_LINE],
+                }, separators=(',', ':')))
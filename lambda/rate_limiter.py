@@ -0,0 +1,228 @@
+import logging
+import math
+import os
+import threading
+import time
+
+from aws_clients import get_client
+from backpressure import Backpressure
+from state_store import STATE_TABLE_NAME
+
+logger = logging.getLogger()
+
+# ServiceNow REST rate limit budget for one integration user on one instance,
+# shared by every concurrent Lambda (0 disables the limiter)
+RATE_LIMIT_PER_SECOND = float(os.environ.get('SN_RATE_LIMIT_PER_SECOND', '20'))
+RATE_LIMIT_BURST = float(os.environ.get('SN_RATE_LIMIT_BURST', '40'))
+# Share of the bucket that writes (PATCH / Batch API) may not use, kept for reads
+READ_RESERVE_FRACTION = float(os.environ.get('SN_RATE_LIMIT_READ_RESERVE', '0.25'))
+# How long a call may wait for a token before the work is handed back to SQS
+MAX_WAIT_SECONDS = float(os.environ.get('SN_RATE_LIMIT_MAX_WAIT_SECONDS', '1.0'))
+# Tokens taken from the shared bucket per round trip, and how long unused ones stay valid
+LEASE_SIZE = int(os.environ.get('SN_RATE_LIMIT_LEASE_SIZE', '5'))
+LEASE_TTL_SECONDS = 1.0
+
+READ_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+
+class RateLimited(Backpressure):
+    pass
+
+
+def _refill(tokens, updated_at, now, rate, capacity):
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+def _grant(tokens, n, reserve, rate):
+    """Tokens granted from a bucket holding `tokens`, and the wait for one more if none."""
+    available = tokens - reserve
+    granted = int(min(n, math.floor(available))) if available >= 1 else 0
+    wait = 0.0 if granted else (1 - available) / rate
+    return granted, wait
+
+
+class MemoryBucketBackend:
+    """Token buckets in process memory: the single-container backend, and a stand-in for the shared one."""
+
+    def __init__(self, clock=time.time):
+        self._clock = clock
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key, n, rate, capacity, reserve=0.0):
+        """Take up to n tokens while leaving `reserve`; returns (granted, seconds until one is available)."""
+        now = self._clock()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = _refill(tokens, updated_at, now, rate, capacity)
+            granted, wait = _grant(tokens, n, reserve, rate)
+            self._buckets[key] = (tokens - granted, now)
+        return granted, wait
+
+
+class DynamoBucketBackend:
+    """Token buckets shared through the state table (`pk` = "rate#<key>").
+
+    Optimistic concurrency: read the bucket, refill it for the elapsed time,
+    and write it back only if nobody else updated it in between.
+    """
+
+    ATTEMPTS = 5
+
+    def __init__(self, table_name, client=None, clock=time.time):
+        self.table_name = table_name
+        self._client = client
+        self._clock = clock
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client('dynamodb')
+        return self._client
+
+    def take(self, key, n, rate, capacity, reserve=0.0):
+        pk = {'S': f"rate#{key}"}
+        for _ in range(self.ATTEMPTS):
+            item = self.client.get_item(TableName=self.table_name, Key={'pk': pk}, ConsistentRead=True).get('Item')
+            now = self._clock()
+            if item:
+                previous = item['updated_at']['N']
+                tokens = _refill(float(item['tokens']['N']), float(previous), now, rate, capacity)
+            else:
+                previous, tokens = None, capacity
+            granted, wait = _grant(tokens, n, reserve, rate)
+            if not granted and item:
+                return 0, wait
+            condition = 'attribute_not_exists(pk)' if previous is None else 'updated_at = :previous'
+            values = {} if previous is None else {'ExpressionAttributeValues': {':previous': {'N': previous}}}
+            try:
+                self.client.put_item(
+                    TableName=self.table_name,
+                    Item={
+                        'pk': pk,
+                        'tokens': {'N': repr(tokens - granted)},
+                        'updated_at': {'N': repr(now)},
+                        'expires_at': {'N': str(int(now + 3600))},
+                    },
+                    ConditionExpression=condition,
+                    **values,
+                )
+                return granted, wait
+            except self.client.exceptions.ConditionalCheckFailedException:
+                continue
+        # Heavy contention: treat as empty for now rather than spin
+        return 0, 1 / rate
+
+
+class RateLimiter:
+    """Token bucket for one ServiceNow instance + user.
+
+    Calls spend tokens leased from the backend in small batches (one shared
+    round trip per LEASE_SIZE calls). Reads are prioritized over writes: writes
+    cannot use the last READ_RESERVE_FRACTION of the bucket, and while a read
+    is waiting for a token, writes wait behind it.
+
+    Shared backend errors fall back to an in-process bucket (per container
+    limit only) so a DynamoDB problem never blocks ServiceNow calls.
+    """
+
+    def __init__(self, key, rate=RATE_LIMIT_PER_SECOND, capacity=RATE_LIMIT_BURST, backend=None,
+                 lease_size=LEASE_SIZE, read_reserve=READ_RESERVE_FRACTION, max_wait=MAX_WAIT_SECONDS,
+                 clock=time.monotonic):
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self.backend = backend or MemoryBucketBackend()
+        self.lease_size = lease_size if not isinstance(self.backend, MemoryBucketBackend) else 1
+        self.reserve = capacity * read_reserve
+        self.max_wait = max_wait
+        self._clock = clock
+        self._fallback = MemoryBucketBackend()
+        self._cond = threading.Condition()
+        self._leased = 0
+        self._leased_at = 0.0
+        self._waiting_reads = 0
+        self.waits = 0
+
+    def _take_from_backend(self, write):
+        reserve = self.reserve if write else 0.0
+        try:
+            return self.backend.take(self.key, self.lease_size, self.rate, self.capacity, reserve)
+        except Exception as e:
+            logger.warning(f"Shared rate limit unavailable, limiting this container only: {str(e)}")
+            return self._fallback.take(self.key, 1, self.rate, self.capacity, reserve)
+
+    def acquire(self, write=False, max_wait=None):
+        """Wait (up to max_wait) for a token; raises RateLimited when none comes in time."""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = self._clock() + max_wait
+        with self._cond:
+            if not write:
+                self._waiting_reads += 1
+            try:
+                while True:
+                    now = self._clock()
+                    if now - self._leased_at > LEASE_TTL_SECONDS:
+                        self._leased = 0
+                    if self._leased and (not write or not self._waiting_reads):
+                        self._leased -= 1
+                        return
+                    wait = 0.0
+                    if not write or not self._waiting_reads:
+                        granted, wait = self._take_from_backend(write)
+                        if granted:
+                            self._leased, self._leased_at = granted - 1, now
+                            return
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        raise RateLimited(
+                            f"ServiceNow rate limit for {self.key}: no token within {max_wait}s",
+                            "servicenow", max(1, math.ceil(wait or 1 / self.rate)), 429,
+                        )
+                    self.waits += 1
+                    self._cond.wait(min(remaining, max(wait, 0.01)))
+            finally:
+                if not write:
+                    self._waiting_reads -= 1
+                    self._cond.notify_all()
+
+    def wrap(self, http, max_wait=None):
+        """An http-like object that takes a token before every request (GET = read, anything else = write)."""
+        return _RateLimitedHttp(http, self, max_wait)
+
+
+class _RateLimitedHttp:
+    def __init__(self, http, limiter, max_wait=None):
+        self.http = http
+        self.limiter = limiter
+        self.max_wait = max_wait
+
+    def request(self, method, *args, **kwargs):
+        self.limiter.acquire(write=method.upper() not in READ_METHODS, max_wait=self.max_wait)
+        return self.http.request(method, *args, **kwargs)
+
+
+_LIMITERS = {}
+_LOCK = threading.Lock()
+
+
+def get_rate_limiter(instance, user, table_name=None):
+    """Shared limiter for instance + user; None when rate limiting is disabled."""
+    if RATE_LIMIT_PER_SECOND <= 0:
+        return None
+    key = f"{instance}#{user}"
+    with _LOCK:
+        if key not in _LIMITERS:
+            table_name = STATE_TABLE_NAME if table_name is None else table_name
+            backend = DynamoBucketBackend(table_name) if table_name else None
+            _LIMITERS[key] = RateLimiter(key, backend=backend)
+        return _LIMITERS[key]
+
+
+def rate_limited(http, instance, user, max_wait=None):
+    """http wrapped with the limiter for instance + user (unchanged when disabled).
+
+    max_wait overrides how long a request waits for a token (0: fail at once).
+    """
+    limiter = get_rate_limiter(instance, user)
+    return limiter.wrap(http, max_wait) if limiter else http
@@ -1,21 +1,55 @@
 import json
 import hmac
 import hashlib
-import urllib3
 import time
 import base64
 import logging
 from urllib.parse import parse_qs
-import boto3
 import os
+from aws_clients import get_client
+from backpressure import get_destination
+from http_client import HttpClient
+from idempotency import IdempotencyStore, content_hash
+from metrics import Metrics
+from rate_limiter import rate_limited
+from secret_cache import get_secret_cache
+from servicenow_client import ServiceNowClient, base_url
+from single_flight import SingleFlight, wait_for
+from slack_messages import not_found, status_report
+from ticket_cache import TicketCache
+from ticket_numbers import parse_ticket_numbers
+from tracing import correlation_id, message_attributes, now_ms
+from warm_start import init
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-http = urllib3.PoolManager()
 
-# Initialize Clients Globally
-SECRETS_CLIENT = boto3.client('secretsmanager')
-SQS_CLIENT = boto3.client('sqs')
+# Clients are created on first use (aws_clients): an /ops-status answered from
+# the cache never loads the SQS client. Read straight from the shared tier, without
+# local copies: a resolve by the worker must show in the next status reply.
+TICKET_CACHE = TicketCache(local_ttl=0)
+FLIGHTS = SingleFlight()
+# Slack retries a command it got no answer for within 3s: enqueue each command once
+IDEMPOTENCY = IdempotencyStore("slack-trigger")
+# Per-stage timings, emitted as CloudWatch EMF once per invocation
+METRICS = Metrics("receiver")
+# One request at a time per invocation (the fast-path ServiceNow query)
+http = HttpClient(maxsize=1, metrics=METRICS)
+# While ServiceNow is overloaded the fast path is skipped (circuit open) and commands go to the worker
+SERVICENOW = get_destination("servicenow")
+
+# /ops-status is answered inline when it can be done within this budget (measured
+# from the start of the invocation), safely below Slack's 3 second deadline.
+STATUS_FAST_PATH = os.environ.get('STATUS_FAST_PATH', 'true').lower() == 'true'
+STATUS_FAST_PATH_BUDGET_SECONDS = float(os.environ.get('STATUS_FAST_PATH_BUDGET_MS', '1500')) / 1000
+
+# SnapStart / provisioned concurrency: clients, secret and the fast path's ServiceNow
+# connection are ready before the first command (no-op on on-demand cold starts)
+init(
+    ["secretsmanager", "sqs"] + (["dynamodb"] if os.environ.get('STATE_TABLE_NAME') else []),
+    http, lambda secrets: [base_url(secrets['sn_instance']) + "/"],
+)
+
 
 def verify_slack_signature(headers, body, secret):
     timestamp = headers.get('x-slack-request-timestamp', '')
@@ -26,12 +60,71 @@ def verify_slack_signature(headers, body, secret):
     my_signature = "v0=" + hmac.new(secret.encode('utf-8'), sig_basestring, hashlib.sha256).hexdigest()
     return hmac.compare_digest(my_signature, signature)
 
+
+def slack_reply(text, response_type="ephemeral"):
+    return {
+        'statusCode': 200,
+        'headers': {'Content-Type': 'application/json'},
+        'body': json.dumps({"text": text, "response_type": response_type})
+    }
+
+
+def status_fast_path(ticket_number, secrets, started):
+    """Answer /ops-status inline from the ticket cache or a time-boxed ServiceNow query.
+
+    Returns the reply text, or None to fall back to the SQS worker path.
+    """
+    # Without the shared tier this container never sees the worker's resolves
+    incident = TICKET_CACHE.get(ticket_number) if TICKET_CACHE.shared else None
+    if incident:
+        logger.info(f"Status fast path: cache hit for {ticket_number}")
+        return status_report(ticket_number, incident)
+
+    def remaining():
+        return STATUS_FAST_PATH_BUDGET_SECONDS - (time.monotonic() - started)
+
+    if remaining() <= 0.1:
+        return None
+
+    # Someone else is already querying this ticket: share their result instead
+    if FLIGHTS.acquire('/ops-status', ticket_number, owner="receiver") is not None:
+        incident = wait_for(lambda: TICKET_CACHE.get(ticket_number), max(0.0, remaining()))
+        return status_report(ticket_number, incident) if incident else None
+
+    try:
+        # No waiting for a rate limit token: without one the worker answers instead
+        client = ServiceNowClient(
+            secrets['sn_instance'], secrets['sn_user'], secrets['sn_pass'],
+            rate_limited(SERVICENOW.wrap(http), secrets['sn_instance'], secrets['sn_user'], max_wait=0),
+        )
+        timeout = remaining()
+        if timeout <= 0.1:
+            return None
+        with METRICS.stage("servicenow_query", action='/ops-status') as stage:
+            incident = client.query_incidents([ticket_number], timeout=timeout).get(ticket_number)
+            stage.status = 200
+    except Exception as e:
+        logger.warning(f"Status fast path fell back to the worker: {str(e)}")
+        return None
+    finally:
+        FLIGHTS.release('/ops-status', ticket_number)
+    if not incident:
+        return not_found(ticket_number)
+    TICKET_CACHE.put(incident)
+    logger.info(f"Status fast path: answered {ticket_number} inline")
+    return status_report(ticket_number, incident)
+
+
+@METRICS.handler
 def lambda_handler(event, context):
+    started = time.monotonic()
+    # Follows the command through the queue to the worker's trace record
+    correlation, received_at = correlation_id(event), now_ms()
     try:
-        # Retrieve secrets
-        secret_arn = os.environ['SECRET_ARN']
-        response = SECRETS_CLIENT.get_secret_value(SecretId=secret_arn)
-        secrets = json.loads(response['SecretString'])
+        # Retrieve secrets (cached across warm invocations)
+        secret_cache = get_secret_cache()
+        with METRICS.stage("secrets"):
+            secrets = secret_cache.get()
         SLACK_SIGNING_SECRET = secrets['slack_signing_secret']
 
         # 1. Parse Slack Input
@@ -41,9 +134,17 @@ def lambda_handler(event, context):
             raw_body = base64.b64decode(raw_body).decode('utf-8')
 
         # 2. Verify Signature
-        if not verify_slack_signature(headers, raw_body, SLACK_SIGNING_SECRET):
-            logger.error("Signature verification failed")
-            return {'statusCode': 401, 'body': "Invalid Signature"}
+        with METRICS.stage("verify") as stage:
+            if not verify_slack_signature(headers, raw_body, SLACK_SIGNING_SECRET):
+                # The signing secret may have been rotated since we cached it
+                secrets = secret_cache.get(force_refresh=True)
+                SLACK_SIGNING_SECRET = secrets['slack_signing_secret']
+                if not verify_slack_signature(headers, raw_body, SLACK_SIGNING_SECRET):
+                    logger.error("Signature verification failed")
+                    stage.outcome = "invalid"
+                    stage.status = 401
+                    return {'statusCode': 401, 'body': "Invalid Signature"}
+        logger.info(f"Secret cache stats: {secret_cache.stats()}")
 
         # 3. Extract Command & Ticket
         params = parse_qs(raw_body)
@@ -52,24 +153,64 @@ def lambda_handler(event, context):
         user_id = params.get('user_id', [''])[0]
         command_name = params.get('command', [''])[0] # Extract /ops-status or /ops-resolve
 
-        logger.info(f"Received {command_name} for: {ticket_text}")
+        logger.info(f"Received {command_name} for: {ticket_text} (correlation {correlation})")
         
-        if not ticket_text.startswith("INC"):
-            return {'statusCode': 200, 'headers': {'Content-Type': 'application/json'}, 'body': json.dumps({"text": "❌ Invalid Ticket Number. Use format INC000..."})}
+        # One ticket, or a list/ranges for bulk commands ("INC0010001, INC0010005-INC0010009")
+        try:
+            ticket_numbers = parse_ticket_numbers(ticket_text)
+        except ValueError as e:
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({"text": str(e)})
+            }
+        ticket_text = ticket_numbers[0] if len(ticket_numbers) == 1 else f"{len(ticket_numbers)} tickets"
 
-        # 4. SEND TO SQS (Pass the action type)
+        # 4. FAST PATH: read-only status checks are answered in this same request
+        if STATUS_FAST_PATH and command_name == '/ops-status' and len(ticket_numbers) == 1:
+            with METRICS.stage("status_fast_path", action=command_name) as stage:
+                text = status_fast_path(ticket_text, secrets, started)
+                stage.outcome = "inline" if text else "fallback"
+            if text:
+                return slack_reply(text, response_type="in_channel")
+
+        # 5. SEND TO SQS (Pass the action type)
         queue_url = os.environ['SQS_QUEUE_URL']
         
         message_payload = {
             "action": command_name,  # <--- NEW FIELD
-            "ticket_number": ticket_text,
             "response_url": response_url,
             "user_id": user_id
         }
+        if len(ticket_numbers) == 1:
+            message_payload["ticket_number"] = ticket_text
+        else:
+            # Bulk: one message for all tickets, answered with one aggregated reply
+            message_payload["ticket_numbers"] = ticket_numbers
         
-        SQS_CLIENT.send_message(QueueUrl=queue_url, MessageBody=json.dumps(message_payload))
+        # trigger_id is unique per command invocation and kept on retries (X-Slack-Retry-Num)
+        command_key = params.get('trigger_id', [''])[0] or content_hash(raw_body)
+        with METRICS.stage("idempotency") as stage:
+            first = IDEMPOTENCY.claim(command_key)
+            stage.outcome = "new" if first else "duplicate"
+        if not first:
+            retry = headers.get('x-slack-retry-num', '-')
+            logger.info(f"Already enqueued {command_name} {ticket_text} (retry {retry})")
+            return {
+                'statusCode': 200,
+                'headers': {'Content-Type': 'application/json'},
+                'body': json.dumps({"text": f"⏳ Checking {ticket_text}..."})
+            }
+
+        try:
+            with METRICS.stage("enqueue", action=command_name):
+                get_client('sqs').send_message(QueueUrl=queue_url, MessageBody=json.dumps(message_payload),
+                                               **message_attributes(correlation, received_at))
+        except Exception:
+            IDEMPOTENCY.release(command_key)
+            raise
 
-        # 5. Immediate Response
+        # 6. Immediate Response
         return {
             'statusCode': 200, 
             'headers': {'Content-Type': 'application/json'}, 
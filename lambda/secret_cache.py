@@ -0,0 +1,136 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from aws_clients import get_client
+
+logger = logging.getLogger()
+
+# How long a fetched secret is served from memory, and how early (before expiry)
+# a background refresh is started so warm invocations never wait on Secrets Manager.
+DEFAULT_TTL_SECONDS = float(os.environ.get('SECRET_CACHE_TTL_SECONDS', '300'))
+DEFAULT_REFRESH_AHEAD_SECONDS = float(os.environ.get('SECRET_REFRESH_AHEAD_SECONDS', '60'))
+# Forced refreshes (after an auth failure) are throttled so a stream of bad
+# Slack signatures cannot burn through the Secrets Manager API quota.
+MIN_FORCED_REFRESH_INTERVAL_SECONDS = float(os.environ.get('SECRET_MIN_FORCED_REFRESH_SECONDS', '30'))
+
+
+class CredentialsRejected(Exception):
+    """Raised when a downstream call fails auth (401/403) and the secret may have rotated."""
+
+
+class SecretCache:
+    """In-process cache for one Secrets Manager JSON secret.
+
+    Serves the parsed secret for `ttl` seconds, refreshes it in a background
+    thread once it is within `refresh_ahead` seconds of expiry, and can be
+    forced to re-fetch when a credential is rejected.
+    """
+
+    def __init__(self, secret_id, ttl=DEFAULT_TTL_SECONDS, refresh_ahead=DEFAULT_REFRESH_AHEAD_SECONDS,
+                 client=None, clock=time.monotonic):
+        self.secret_id = secret_id
+        self.ttl = ttl
+        self.refresh_ahead = min(refresh_ahead, ttl)
+        self._client = client
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._value = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.forced_refreshes = 0
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client('secretsmanager')
+        return self._client
+
+    def _fetch(self):
+        response = self.client.get_secret_value(SecretId=self.secret_id)
+        return json.loads(response['SecretString'])
+
+    def _store(self, value):
+        with self._lock:
+            self._value = value
+            self._fetched_at = self._clock()
+
+    def get(self, force_refresh=False):
+        now = self._clock()
+        with self._lock:
+            value = self._value
+            age = now - self._fetched_at
+
+        if force_refresh and value is not None:
+            if age < MIN_FORCED_REFRESH_INTERVAL_SECONDS:
+                logger.warning("Forced secret refresh skipped, secret was fetched %.0fs ago", age)
+                self.hits += 1
+                return value
+            self.forced_refreshes += 1
+            logger.info("Forcing secret refresh (credential rejected)")
+        elif value is not None and age < self.ttl:
+            self.hits += 1
+            if age >= self.ttl - self.refresh_ahead:
+                self._refresh_in_background()
+            return value
+
+        self.misses += 1
+        value = self._fetch()
+        self._store(value)
+        return value
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        threading.Thread(target=self._background_refresh, daemon=True).start()
+
+    def _background_refresh(self):
+        try:
+            self._store(self._fetch())
+            self.refreshes += 1
+        except Exception as e:
+            # Keep serving the old value; the next get() past TTL fetches synchronously.
+            logger.warning(f"Background secret refresh failed: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def invalidate(self):
+        with self._lock:
+            self._value = None
+            self._fetched_at = 0.0
+
+    def call_with_refresh(self, fn):
+        """Call fn(secrets); if it raises CredentialsRejected, refresh the secret and retry once."""
+        try:
+            return fn(self.get())
+        except CredentialsRejected as e:
+            logger.warning(f"Credentials rejected ({str(e)}), refreshing secret and retrying")
+            return fn(self.get(force_refresh=True))
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "refreshes": self.refreshes,
+            "forced_refreshes": self.forced_refreshes,
+        }
+
+
+_CACHES = {}
+
+
+def get_secret_cache(secret_id=None):
+    """Return the shared cache for secret_id (defaults to the SECRET_ARN env var)."""
+    secret_id = secret_id or os.environ['SECRET_ARN']
+    cache = _CACHES.get(secret_id)
+    if cache is None:
+        cache = _CACHES.setdefault(secret_id, SecretCache(secret_id))
+    return cache
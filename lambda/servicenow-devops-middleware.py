@@ -1,31 +1,59 @@
 import json
-import hmac
-import hashlib
-import datetime
-import urllib3
-import base64
-import logging
-import boto3
 import os
+import logging
+from agent_events import (
+    agent_action, build_agent_payload, event_content_key, incident_data, incident_key, incident_priority,
+    sign_agent_payload
+)
+from backpressure import get_destination, postpone_on_backpressure
+from batch_processing import MAX_WORKERS, message_attribute, process_batch
+from dead_letter import PERMANENT_STATUSES, DeadLetterQueue, PermanentError, load_payload
+from event_coalescing import FingerprintStore, coalesce_records
+from http_client import HttpClient
+from idempotency import IdempotencyStore
+from metrics import Metrics
+from secret_cache import CredentialsRejected, get_secret_cache
+from single_flight import SingleFlight
+from state_store import build_store
+from ticket_cache import TICKET_CACHE_TABLE, TicketCache
+from tracing import Tracer
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-http = urllib3.PoolManager()
 
-# --- OPTIMIZATION 1: Initialize Client Globally (Warm Starts) ---
-# This makes subsequent executions faster
-SECRETS_CLIENT = boto3.client('secretsmanager')
+# Last forwarded agent-visible fingerprint per incident (memory, then DynamoDB if configured)
+FINGERPRINTS = FingerprintStore()
+# Records already forwarded (SQS redelivery, duplicate sends) are not sent to the agent again
+IDEMPOTENCY = IdempotencyStore("agent-event", content_key=event_content_key)
+# The Slack worker's ticket cache, so resolves made in ServiceNow are not served stale in Slack
+TICKET_CACHE = TicketCache() if os.environ.get('TICKET_CACHE_TABLE') else None
+# The Slack worker's resolve leases ("already resolved by"), cleared when a ticket is reopened
+RESOLVE_LEASES = (
+    SingleFlight(build_store(max_items=100, table_name=TICKET_CACHE_TABLE, local_ttl=0)) if TICKET_CACHE else None
+)
+# Per-stage timings, emitted as CloudWatch EMF once per invocation
+METRICS = Metrics("servicenow-middleware")
+# One trace record per event: API Gateway -> queue -> this function -> agent
+TRACES = Tracer("servicenow-middleware")
+# Events that can never be delivered (malformed, rejected by the agent) skip the retries
+DEAD_LETTERS = DeadLetterQueue(METRICS)
+# One pool shared by all batch workers, sized so concurrent webhook calls reuse connections.
+# Webhook POSTs are not idempotent: only retried when refused (429) or never sent.
+http = HttpClient(maxsize=MAX_WORKERS, metrics=METRICS)
+# Circuit breaker + adaptive concurrency limit for the webhook; while it is
+# overloaded, failed records are postponed (SQS visibility) instead of retried at once
+AGENT = get_destination("agent")
+
 
+@METRICS.handler
 def lambda_handler(event, context):
+    TRACES.start()
     try:
-        # Retrieve secrets
-        secret_arn = os.environ['SECRET_ARN']
-        
-        # Using global client
-        response = SECRETS_CLIENT.get_secret_value(SecretId=secret_arn)
-        secrets = json.loads(response['SecretString'])
-        WEBHOOK_URL = secrets['webhook_url']
-        SECRET_STRING = secrets['secret_string']
+        # --- OPTIMIZATION 1: Secrets are cached globally (Warm Starts) ---
+        # Served from memory until the TTL expires, refreshed ahead in the background
+        secret_cache = get_secret_cache()
+        with METRICS.stage("secrets"):
+            secret_cache.get()
 
         # Security Note: Don't log the full URL if it contains sensitive IDs
         logger.info("Configuration loaded successfully.")
@@ -37,75 +65,114 @@ def lambda_handler(event, context):
     # --- HANDLE INVOCATION ---
     if 'Records' in event:
         # CASE A: SQS Trigger (Production)
-        for record in event['Records']:
-            # --- CRITICAL FIX 2: No Try/Except here ---
-            # We want the Lambda to CRASH if processing fails.
-            # This signals SQS to keep the message and retry later.
-            payload = json.loads(record['body'])
-            process_incident(payload, WEBHOOK_URL, SECRET_STRING)
-            
-        return {'statusCode': 200, 'body': "Batch processed"}
+        # --- CRITICAL FIX 2: Partial batch failures ---
+        # Records are sent concurrently. A failing record is reported back in
+        # batchItemFailures so SQS retries only that one, instead of crashing and
+        # re-sending the records that already reached the agent.
+        # --- OPTIMIZATION 3: Coalescing ---
+        # The Business Rule sends every update. Keep only the latest event per
+        # incident in this batch, and skip events the agent has already seen.
+        with METRICS.stage("idempotency"):
+            pending, duplicates = IDEMPOTENCY.split(event['Records'])
+        METRICS.increment("duplicates_skipped", len(duplicates))
+        records, superseded = coalesce_records(pending)
+        TRACES.skipped(duplicates, "duplicate")
+        TRACES.skipped(superseded, "superseded")
+
+        def handle_record(record):
+            payload = load_payload(record, required=lambda body: isinstance(incident_data(body), dict))
+            number = incident_data(payload).get('number')
+            if TICKET_CACHE and number:
+                TICKET_CACHE.invalidate(number)
+                if agent_action(payload) != "resolved":
+                    # Reopened in ServiceNow: a later Slack resolve must PATCH it again
+                    RESOLVE_LEASES.release('/ops-resolve', number)
+            with TRACES.request(record, action=agent_action(payload)) as trace, \
+                    METRICS.stage("event", action=agent_action(payload)) as stage:
+                if FINGERPRINTS.is_unchanged(payload):
+                    logger.info(f"Skipping {incident_key(payload)}: no agent-visible change")
+                    stage.outcome = trace.outcome = "unchanged"
+                else:
+                    send_with_refresh(secret_cache, payload)
+                    FINGERPRINTS.remember(payload)
+            IDEMPOTENCY.complete(record)
+
+        # P1s normally arrive on their own high-priority queue; inside any batch they still go first
+        result = process_batch(records, handle_record, key=record_incident_key,
+                               on_error=postpone_on_backpressure, priority=record_priority,
+                               dead_letter=DEAD_LETTERS.isolate)
+        logger.info(f"Secret cache stats: {secret_cache.stats()}")
+        return result
     else:
         # CASE B: Direct Invocation (Test/API Gateway Direct)
         try:
             body = json.loads(event['body']) if 'body' in event and isinstance(event['body'], str) else event.get('body', event)
-            process_incident(body, WEBHOOK_URL, SECRET_STRING)
+            send_with_refresh(secret_cache, body)
             return {'statusCode': 200, 'body': "Success"}
         except Exception as e:
             logger.error(f"Error: {str(e)}")
             return {'statusCode': 500, 'body': str(e)}
 
+
+def record_incident_key(record):
+    # The FIFO message group or the sys_id attribute (both set by the API Gateway template)
+    # also keep records that cannot be parsed in order with the rest of their incident
+    group = record.get('attributes', {}).get('MessageGroupId') or message_attribute(record, 'sys_id')
+    if group:
+        return group
+    try:
+        return incident_key(json.loads(record['body']))
+    except (ValueError, AttributeError, TypeError):
+        return None
+
+
+def record_priority(record):
+    # Set by the API Gateway template, so routing needs no JSON parse
+    priority = message_attribute(record, 'priority')
+    if priority is not None:
+        return incident_priority({'priority': priority})
+    try:
+        return incident_priority(json.loads(record['body']))
+    except (ValueError, AttributeError, TypeError):
+        return 5
+
+
+def send_with_refresh(secret_cache, body):
+    # A 401/403 from the webhook usually means the HMAC secret was rotated:
+    # refresh it and retry once before letting SQS retry the message.
+    return secret_cache.call_with_refresh(
+        lambda secrets: process_incident(body, secrets['webhook_url'], secrets['secret_string'])
+    )
+
+
 def process_incident(body, WEBHOOK_URL, SECRET_STRING):
-    # (This logic is perfect, no changes needed)
     try:
-        inc_data = body.get('incident', body)
-        inc_id = inc_data.get('number', 'UNKNOWN')
-        
+        inc_id = body.get('incident', body).get('number', 'UNKNOWN')
+
         # --- SMART LOGIC ---
-        event_type = body.get('event_type', 'incident_created')
-        
-        aws_action = "created" 
-        if "resolve" in event_type or "close" in event_type:
-            aws_action = "resolved"
+        # Action/priority mapping lives in agent_events (shared with coalescing)
+        agent_payload = build_agent_payload(body)
+        if agent_payload['action'] == "resolved":
             logger.info(f"Resolving Incident: {inc_id}")
-        
-        # Priority Mapping
-        p_val = str(inc_data.get('priority', '3'))
-        if '1' in p_val: priority = 'CRITICAL'
-        elif '2' in p_val: priority = 'HIGH'
-        else: priority = 'MEDIUM'
-
-        # Payload
-        timestamp = datetime.datetime.now(datetime.timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
-        
-        agent_payload = {
-            "eventType": "incident",
-            "incidentId": str(inc_id),
-            "title": f"[{inc_id}] {inc_data.get('short_description', '')}",
-            "action": aws_action,
-            "priority": priority,
-            "description": inc_data.get('description', ''),
-            "timestamp": timestamp
-        }
 
         # Sign & Send
-        payload_str = json.dumps(agent_payload, separators=(',', ':'))
-        string_to_sign = f"{timestamp}:{payload_str}"
-        
-        signature_bytes = hmac.new(SECRET_STRING.encode('utf-8'), string_to_sign.encode('utf-8'), hashlib.sha256).digest()
-        signature_b64 = base64.b64encode(signature_bytes).decode('utf-8')
+        payload_str, headers = sign_agent_payload(agent_payload, SECRET_STRING)
 
-        headers = {
-            "Content-Type": "application/json",
-            "x-amzn-event-signature": signature_b64,
-            "x-amzn-event-timestamp": timestamp
-        }
+        with METRICS.stage("agent_webhook", action=agent_payload['action']) as stage:
+            response = AGENT.call(lambda: http.request('POST', WEBHOOK_URL, body=payload_str, headers=headers))
+            stage.status = response.status
 
-        response = http.request('POST', WEBHOOK_URL, body=payload_str, headers=headers)
-        
-        if response.status < 200 or response.status >= 300:
-            # Raising this exception ensures SQS retries the message!
-            raise Exception(f"AWS Webhook returned error: {response.status} - {response.data.decode('utf-8')}")
+            if response.status in (401, 403):
+                raise CredentialsRejected(f"AWS Webhook returned {response.status}")
+            if response.status in PERMANENT_STATUSES:
+                # The agent rejected this event itself: sending it again cannot succeed
+                raise PermanentError(
+                    f"AWS Webhook rejected the event: {response.status} - {response.data.decode('utf-8')}",
+                    response.status,
+                )
+            if response.status < 200 or response.status >= 300:
+                # Raising this exception ensures SQS retries the message!
+                raise Exception(f"AWS Webhook returned error: {response.status} - {response.data.decode('utf-8')}")
             
         logger.info(f"Sent {inc_id} to AWS: {response.status}")
         
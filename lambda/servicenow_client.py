@@ -0,0 +1,241 @@
+import base64
+import codecs
+import json
+import logging
+import os
+import re
+from urllib.parse import urlencode
+
+import urllib3
+
+from secret_cache import CredentialsRejected
+
+logger = logging.getLogger()
+
+INCIDENT_PATH = "/api/now/table/incident"
+BATCH_PATH = "/api/now/v1/batch"
+# Overrides https://<instance>.service-now.com (custom domains, local stand-ins)
+BASE_URL = os.environ.get('SERVICENOW_BASE_URL')
+
+# The only incident fields the handlers read (see ticket_cache.CACHED_FIELDS): wide
+# custom incident tables stay on the server instead of being sent and parsed here
+INCIDENT_FIELDS = ('number', 'sys_id', 'state', 'short_description')
+# Updates return the same fields: the worker caches the updated record in place of
+# the one it had, which is only a number and sys_id when it resolved by cached sys_id
+UPDATE_FIELDS = INCIDENT_FIELDS
+# Records per Table API page
+PAGE_SIZE = int(os.environ.get('SN_PAGE_SIZE', '100'))
+# Read the response body in chunks of this size while parsing it
+STREAM_CHUNK_BYTES = 16 * 1024
+
+_RESULT_START = re.compile(r'\s*\{\s*"result"\s*:\s*\[')
+_SEPARATOR = re.compile(r'[\s,]*')
+
+# Instances where the Batch API answered 400/404/405 (plugin missing or blocked);
+# updates for these go out as individual PATCH calls for the life of the container.
+_BATCH_UNSUPPORTED = set()
+
+
+class ServiceNowError(Exception):
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+
+def base_url(instance):
+    return BASE_URL or f"https://{instance}.service-now.com"
+
+
+def iter_results(chunks):
+    """Records of a Table API response body (`{"result": [...]}`) parsed one at a time as
+    the chunks arrive, so a page is never held as one bytes + str + dict copy."""
+    decode = codecs.getincrementaldecoder('utf-8')().decode
+    decoder = json.JSONDecoder()
+    buffer, pos, in_result = '', 0, False
+    for chunk in chunks:
+        buffer = buffer[pos:] + decode(chunk)
+        pos = 0
+        if not in_result:
+            match = _RESULT_START.match(buffer)
+            if match is None:
+                if len(buffer) < 64:
+                    continue
+                raise ServiceNowError("Unexpected Table API response")
+            in_result, pos = True, match.end()
+        while True:
+            pos = _SEPARATOR.match(buffer, pos).end()
+            if buffer[pos:pos + 1] == ']':
+                return
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                break  # the record continues in the next chunk
+            yield record
+    raise ServiceNowError("Truncated Table API response")
+
+
+class ServiceNowClient:
+    """Minimal ServiceNow Table/Batch API client on a shared http_client.HttpClient."""
+
+    def __init__(self, instance, user, password, http):
+        self.instance = instance
+        self.base_url = base_url(instance)
+        self.http = http
+        # Paginated/batch responses are large JSON: let ServiceNow compress them
+        self.headers = {'Content-Type': 'application/json', 'Accept': 'application/json', 'Accept-Encoding': 'gzip'}
+        self.headers.update(urllib3.make_headers(basic_auth=f"{user}:{password}"))
+
+    def _check(self, response, what):
+        if response.status == 401:
+            raise CredentialsRejected(f"ServiceNow {what} returned {response.status}")
+        if response.status < 200 or response.status >= 300:
+            raise ServiceNowError(f"ServiceNow {what} failed: {response.status}", response.status)
+        return json.loads(response.data.decode('utf-8'))
+
+    def query_incidents(self, numbers, fields=INCIDENT_FIELDS, display_value=True, timeout=None):
+        """Fetch all incidents in `numbers` (one Table API query per PAGE_SIZE); returns {number: record}.
+
+        Only `fields` are returned, as display values (the state label) by default.
+        With `timeout` (seconds) each page is bounded end to end and not retried.
+        """
+        numbers = sorted(set(numbers))
+        if not numbers:
+            return {}
+        logger.info(f"Querying ServiceNow for {len(numbers)} ticket(s)")
+        records = self.iter_incidents("numberIN" + ",".join(numbers), fields, display_value, len(numbers), timeout)
+        return {record['number']: record for record in records}
+
+    def iter_incidents(self, query, fields=INCIDENT_FIELDS, display_value=True, limit=None, timeout=None):
+        """Incidents matching an encoded query, page by page, each page parsed as it streams in."""
+        options = {}
+        if timeout is not None:
+            options = {'timeout': urllib3.Timeout(total=timeout), 'retries': False}
+        offset = 0
+        while limit is None or offset < limit:
+            page_size = PAGE_SIZE if limit is None else min(PAGE_SIZE, limit - offset)
+            received = 0
+            for record in self._page(query, fields, display_value, page_size, offset, options):
+                received += 1
+                yield record
+            if received < page_size:
+                return
+            offset += received
+
+    def scan_incidents(self, query, fields=INCIDENT_FIELDS, after=None, display_value=True, page_size=None):
+        """Every incident matching an encoded query in sys_id order, resuming after sys_id `after`.
+
+        Pages by keyset (`sys_id>last`) instead of offset: each page costs the
+        instance the same however deep the scan is, and incidents created or
+        closed meanwhile do not shift later pages.
+        """
+        page_size = page_size or PAGE_SIZE
+        fields = tuple(fields) if 'sys_id' in fields else ('sys_id',) + tuple(fields)
+        while True:
+            conditions = [c for c in (query, f"sys_id>{after}" if after else "") if c]
+            received = 0
+            for record in self._page("^".join(conditions + ["ORDERBYsys_id"]), fields, display_value, page_size):
+                received += 1
+                after = record['sys_id']
+                yield record
+            if received < page_size:
+                return
+
+    def _page(self, query, fields, display_value, limit, offset=0, options=None):
+        params = urlencode({
+            'sysparm_query': query,
+            'sysparm_fields': ",".join(fields),
+            'sysparm_display_value': str(display_value).lower(),
+            'sysparm_exclude_reference_link': 'true',
+            # No X-Total-Count: the instance skips the extra count query
+            'sysparm_no_count': 'true',
+            'sysparm_limit': limit,
+            'sysparm_offset': offset,
+        })
+        response = self.http.request(
+            'GET', f"{self.base_url}{INCIDENT_PATH}?{params}", headers=self.headers, preload_content=False,
+            **(options or {})
+        )
+        try:
+            if response.status < 200 or response.status >= 300:
+                self._check(response, "query")
+            yield from iter_results(response.stream(STREAM_CHUNK_BYTES))
+        finally:
+            response.release_conn()
+
+    def update_incident(self, sys_id, fields, display_value=True):
+        """PATCH one incident; returns (status, updated record (UPDATE_FIELDS) or None)."""
+        query = self._update_query(display_value)
+        response = self.http.request(
+            'PATCH', f"{self.base_url}{INCIDENT_PATH}/{sys_id}?{query}",
+            headers=self.headers, body=json.dumps(fields), idempotent=True
+        )
+        if response.status == 401:
+            raise CredentialsRejected(f"ServiceNow update returned {response.status}")
+        record = None
+        if response.status == 200:
+            record = json.loads(response.data.decode('utf-8')).get('result')
+        return response.status, record
+
+    @staticmethod
+    def _update_query(display_value):
+        return urlencode({
+            'sysparm_display_value': str(display_value).lower(),
+            'sysparm_fields': ",".join(UPDATE_FIELDS),
+            'sysparm_exclude_reference_link': 'true',
+        })
+
+    def update_incidents(self, updates, display_value=True):
+        """Apply {sys_id: fields} updates, in one Batch API call where the instance supports it.
+
+        Returns {sys_id: (status, updated record or None)}.
+        """
+        if not updates:
+            return {}
+        if len(updates) == 1 or self.instance in _BATCH_UNSUPPORTED:
+            return {sys_id: self.update_incident(sys_id, fields, display_value) for sys_id, fields in updates.items()}
+
+        results = self._batch_update(updates, display_value)
+        if results is None:
+            return {sys_id: self.update_incident(sys_id, fields, display_value) for sys_id, fields in updates.items()}
+        return results
+
+    def _batch_update(self, updates, display_value):
+        query = self._update_query(display_value)
+        sub_headers = [{"name": k, "value": v} for k, v in self.headers.items() if k.lower() != 'authorization']
+        rest_requests = []
+        ids = {}
+        for i, (sys_id, fields) in enumerate(updates.items()):
+            request_id = str(i)
+            ids[request_id] = sys_id
+            rest_requests.append({
+                "id": request_id,
+                "method": "PATCH",
+                "url": f"{INCIDENT_PATH}/{sys_id}?{query}",
+                "headers": sub_headers,
+                "body": base64.b64encode(json.dumps(fields).encode('utf-8')).decode('ascii'),
+            })
+
+        logger.info(f"Updating {len(updates)} incident(s) via Batch API")
+        response = self.http.request(
+            'POST', f"{self.base_url}{BATCH_PATH}", headers=self.headers,
+            body=json.dumps({"batch_request_id": "1", "rest_requests": rest_requests}),
+            # Only PATCHes setting fixed values: safe to send again
+            idempotent=True
+        )
+        if response.status in (400, 404, 405):
+            logger.warning(f"Batch API unavailable on {self.instance} ({response.status}), using single PATCH calls")
+            _BATCH_UNSUPPORTED.add(self.instance)
+            return None
+        data = self._check(response, "batch update")
+
+        results = {sys_id: (None, None) for sys_id in updates}
+        for served in data.get('serviced_requests', []):
+            sys_id = ids.get(served.get('id'))
+            if sys_id is None:
+                continue
+            status = served.get('status_code')
+            record = None
+            if status == 200 and served.get('body'):
+                record = json.loads(base64.b64decode(served['body'])).get('result')
+            results[sys_id] = (status, record)
+        return results
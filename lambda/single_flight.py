@@ -0,0 +1,74 @@
+import logging
+import os
+import time
+
+from state_store import build_store
+
+logger = logging.getLogger()
+
+# How long a caller may hold a lease before others assume it died.
+LEASE_TTL_SECONDS = int(os.environ.get('SINGLE_FLIGHT_LEASE_SECONDS', '15'))
+# How long a completed resolve is remembered, for "already resolved by <user>" replies.
+DONE_TTL_SECONDS = int(os.environ.get('SINGLE_FLIGHT_DONE_SECONDS', '300'))
+# How long followers wait for the leader's result before doing the work themselves.
+WAIT_SECONDS = float(os.environ.get('SINGLE_FLIGHT_WAIT_SECONDS', '2'))
+POLL_INTERVAL_SECONDS = 0.1
+
+
+def wait_for(fn, timeout, interval=POLL_INTERVAL_SECONDS):
+    """Poll fn() until it returns something truthy or timeout expires; returns the last result."""
+    deadline = time.monotonic() + timeout
+    result = fn()
+    while not result and time.monotonic() < deadline:
+        time.sleep(min(interval, max(0.0, deadline - time.monotonic())))
+        result = fn()
+    return result
+
+
+class SingleFlight:
+    """Leases keyed on (command, ticket) so identical concurrent commands do the work once.
+
+    Leases live in the shared state table when configured (across concurrent
+    Lambda invocations), otherwise only in this container.
+    """
+
+    def __init__(self, store=None):
+        # Short local TTL: lease state must mostly come from the shared tier
+        self.store = store if store is not None else build_store(max_items=1000, local_ttl=1)
+
+    @staticmethod
+    def _key(command, ticket_number):
+        return f"lease#{command}#{ticket_number}"
+
+    def acquire(self, command, ticket_number, owner):
+        """Returns None if we are the leader, otherwise the current holder {"owner", "done"}."""
+        stored, holder = self.store.put_if_absent(
+            self._key(command, ticket_number), {"owner": owner, "done": False}, LEASE_TTL_SECONDS
+        )
+        if stored:
+            return None
+        logger.info(f"Single-flight: {command} {ticket_number} already in flight for {(holder or {}).get('owner')}")
+        return holder or {"owner": None, "done": False}
+
+    def holder(self, command, ticket_number):
+        return self.store.get(self._key(command, ticket_number))
+
+    def complete(self, command, ticket_number, owner, ttl=DONE_TTL_SECONDS):
+        self.store.put(self._key(command, ticket_number), {"owner": owner, "done": True}, ttl)
+
+    def release(self, command, ticket_number):
+        self.store.delete(self._key(command, ticket_number))
+
+    def wait_until_done(self, command, ticket_number, timeout=WAIT_SECONDS):
+        """Wait for another holder to finish.
+
+        Returns the holder once it is done, None if the lease was released (the
+        leader failed, so the caller should do the work itself), or the
+        still-pending holder if the wait times out.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            holder = self.holder(command, ticket_number)
+            if holder is None or holder.get("done") or time.monotonic() >= deadline:
+                return holder
+            time.sleep(POLL_INTERVAL_SECONDS)
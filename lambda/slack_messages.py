@@ -0,0 +1,41 @@
+# Slack reply texts shared by the receiver (inline replies) and the worker (response_url posts)
+
+
+def status_report(ticket_number, incident):
+    return (
+        f"📋 *Status Report for {ticket_number}*\n"
+        f"> **State:** {incident['state']}\n"
+        f"> **Summary:** {incident['short_description']}"
+    )
+
+
+def not_found(ticket_number):
+    return f"❌ Ticket {ticket_number} not found."
+
+
+def user_mention(user_id):
+    return f"<@{user_id}>" if user_id else "someone else"
+
+
+def already_resolved(ticket_number, state, resolved_by=None):
+    if resolved_by:
+        return f"⚠️ {ticket_number} was already resolved by {user_mention(resolved_by)} (*{state}*)."
+    return f"⚠️ {ticket_number} is already *{state}*."
+
+
+def resolve_in_progress(ticket_number, resolving_by):
+    return f"⏳ {ticket_number} is already being resolved by {user_mention(resolving_by)}."
+
+
+def resolved(ticket_number):
+    return f"✅ **Success!** {ticket_number} has been resolved."
+
+
+def status_line(ticket_number, incident):
+    return f"*{ticket_number}* ({incident['state']}): {incident['short_description']}"
+
+
+def bulk_report(action, lines):
+    """One reply for a bulk command: a header and one line per ticket."""
+    title = "Status Report" if action == '/ops-status' else "Resolve Results"
+    return f"📋 *{title} for {len(lines)} tickets*\n" + "\n".join(f"> {line}" for line in lines)
@@ -0,0 +1,253 @@
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from aws_clients import get_client
+
+logger = logging.getLogger()
+
+# Optional shared tier. When unset, state lives only in the warm Lambda container.
+STATE_TABLE_NAME = os.environ.get('STATE_TABLE_NAME', '')
+# With a shared tier, local copies are only trusted for this long so other
+# containers' writes become visible quickly.
+LOCAL_TTL_SECONDS = float(os.environ.get('STATE_LOCAL_TTL_SECONDS', '60'))
+
+
+class MemoryStore:
+    """Thread-safe in-process key/value store with per-key TTL and optional LRU bound."""
+
+    def __init__(self, max_items=None, clock=time.time):
+        self.max_items = max_items
+        self._clock = clock
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            value, expires_at = item
+            if expires_at is not None and expires_at <= self._clock():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def put(self, key, value, ttl=None):
+        expires_at = self._clock() + ttl if ttl else None
+        with self._lock:
+            self._items[key] = (value, expires_at)
+            self._items.move_to_end(key)
+            if self.max_items is not None:
+                while len(self._items) > self.max_items:
+                    self._items.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._items.pop(key, None)
+
+    def put_if_absent(self, key, value, ttl=None):
+        """Store value unless a live entry exists; returns (stored, existing value)."""
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None and (item[1] is None or item[1] > self._clock()):
+                return False, item[0]
+            self._items[key] = (value, self._clock() + ttl if ttl else None)
+            self._items.move_to_end(key)
+            return True, None
+
+    def get_many(self, keys):
+        values = {key: self.get(key) for key in keys}
+        return {key: value for key, value in values.items() if value is not None}
+
+    def put_many(self, items, ttl=None):
+        for key, value in items.items():
+            self.put(key, value, ttl)
+
+    def __len__(self):
+        return len(self._items)
+
+
+class DynamoStore:
+    """Key/value store on a DynamoDB table keyed by `pk`, values JSON-encoded in `value`.
+
+    Expiry is written to `expires_at` (the table's TTL attribute). DynamoDB
+    deletes expired items lazily, so reads also check it.
+    """
+
+    def __init__(self, table_name, client=None, clock=time.time):
+        self.table_name = table_name
+        self._client = client
+        self._clock = clock
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = get_client('dynamodb')
+        return self._client
+
+    def _item(self, key, value, ttl):
+        item = {'pk': {'S': key}, 'value': {'S': json.dumps(value)}}
+        if ttl:
+            item['expires_at'] = {'N': str(int(self._clock() + ttl))}
+        return item
+
+    def _value(self, item):
+        if not item:
+            return None
+        if 'expires_at' in item and int(item['expires_at']['N']) <= self._clock():
+            return None
+        return json.loads(item['value']['S'])
+
+    def get(self, key):
+        response = self.client.get_item(TableName=self.table_name, Key={'pk': {'S': key}})
+        return self._value(response.get('Item'))
+
+    def get_many(self, keys):
+        # BatchGetItem takes at most 100 keys per call; unprocessed keys are treated as misses
+        keys = list(dict.fromkeys(keys))
+        values = {}
+        for i in range(0, len(keys), 100):
+            request = {self.table_name: {'Keys': [{'pk': {'S': key}} for key in keys[i:i + 100]]}}
+            response = self.client.batch_get_item(RequestItems=request)
+            for item in response.get('Responses', {}).get(self.table_name, []):
+                value = self._value(item)
+                if value is not None:
+                    values[item['pk']['S']] = value
+        return values
+
+    def put(self, key, value, ttl=None):
+        self.client.put_item(TableName=self.table_name, Item=self._item(key, value, ttl))
+
+    def put_many(self, items, ttl=None):
+        # BatchWriteItem takes at most 25 items per call; unprocessed items are retried once
+        requests = [{'PutRequest': {'Item': self._item(key, value, ttl)}} for key, value in items.items()]
+        for i in range(0, len(requests), 25):
+            response = self.client.batch_write_item(RequestItems={self.table_name: requests[i:i + 25]})
+            unprocessed = response.get('UnprocessedItems') or {}
+            if unprocessed:
+                self.client.batch_write_item(RequestItems=unprocessed)
+
+    def delete(self, key):
+        self.client.delete_item(TableName=self.table_name, Key={'pk': {'S': key}})
+
+    def put_if_absent(self, key, value, ttl=None):
+        # Expired-but-not-yet-deleted items count as absent
+        try:
+            self.client.put_item(
+                TableName=self.table_name,
+                Item=self._item(key, value, ttl),
+                ConditionExpression='attribute_not_exists(pk) OR expires_at < :now',
+                ExpressionAttributeValues={':now': {'N': str(int(self._clock()))}},
+                ReturnValuesOnConditionCheckFailure='ALL_OLD',
+            )
+            return True, None
+        except self.client.exceptions.ConditionalCheckFailedException as e:
+            return False, self._value(e.response.get('Item'))
+
+
+class TieredStore:
+    """Memory first, shared store second. Writes go to both tiers.
+
+    With a shared tier and local_ttl=0 nothing is kept in memory: every read
+    sees other containers' latest writes.
+
+    Errors from the shared tier are logged and treated as misses: this state
+    is an optimization and must never fail the request.
+    """
+
+    def __init__(self, local, remote=None, local_ttl=LOCAL_TTL_SECONDS):
+        self.local = local
+        self.remote = remote
+        self.local_ttl = local_ttl
+
+    def _local_ttl(self, ttl):
+        if self.remote is None:
+            return ttl
+        return min(ttl, self.local_ttl) if ttl else self.local_ttl
+
+    def _put_local(self, key, value, ttl):
+        ttl = self._local_ttl(ttl)
+        if self.remote is None or ttl > 0:
+            self.local.put(key, value, ttl)
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is not None or self.remote is None:
+            return value
+        try:
+            value = self.remote.get(key)
+        except Exception as e:
+            logger.warning(f"Shared state read failed for {key}: {str(e)}")
+            return None
+        if value is not None:
+            self._put_local(key, value, self.local_ttl)
+        return value
+
+    def get_many(self, keys):
+        values = self.local.get_many(keys)
+        missing = [key for key in keys if key not in values]
+        if not missing or self.remote is None:
+            return values
+        try:
+            remote_values = self.remote.get_many(missing)
+        except Exception as e:
+            logger.warning(f"Shared state batch read failed: {str(e)}")
+            return values
+        for key, value in remote_values.items():
+            self._put_local(key, value, self.local_ttl)
+        values.update(remote_values)
+        return values
+
+    def put(self, key, value, ttl=None):
+        self._put_local(key, value, ttl)
+        if self.remote is not None:
+            try:
+                self.remote.put(key, value, ttl)
+            except Exception as e:
+                logger.warning(f"Shared state write failed for {key}: {str(e)}")
+
+    def put_many(self, items, ttl=None):
+        for key, value in items.items():
+            self._put_local(key, value, ttl)
+        if self.remote is not None:
+            try:
+                self.remote.put_many(items, ttl)
+            except Exception as e:
+                logger.warning(f"Shared state batch write failed: {str(e)}")
+
+    def put_if_absent(self, key, value, ttl=None):
+        # The shared tier is authoritative; if it is unreachable, fall back to this container only
+        if self.remote is None:
+            return self.local.put_if_absent(key, value, ttl)
+        try:
+            stored, existing = self.remote.put_if_absent(key, value, ttl)
+        except Exception as e:
+            logger.warning(f"Shared state conditional write failed for {key}: {str(e)}")
+            return self.local.put_if_absent(key, value, ttl)
+        if stored:
+            self._put_local(key, value, ttl)
+        return stored, existing
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.remote is not None:
+            try:
+                self.remote.delete(key)
+            except Exception as e:
+                logger.warning(f"Shared state delete failed for {key}: {str(e)}")
+
+
+def build_store(max_items=10000, table_name=None, local_ttl=LOCAL_TTL_SECONDS):
+    """Tiered store on this container's memory, backed by STATE_TABLE_NAME when configured.
+
+    local_ttl should not exceed the shortest TTL the caller writes with, since
+    values read back from the shared tier are cached locally for that long.
+    """
+    table_name = STATE_TABLE_NAME if table_name is None else table_name
+    remote = DynamoStore(table_name) if table_name else None
+    return TieredStore(MemoryStore(max_items=max_items), remote, local_ttl)
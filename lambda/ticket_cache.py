@@ -0,0 +1,55 @@
+import logging
+import os
+
+from state_store import STATE_TABLE_NAME, build_store
+
+logger = logging.getLogger()
+
+# sys_ids never change, so number -> sys_id can live for a long time.
+SYS_ID_TTL_SECONDS = int(os.environ.get('TICKET_SYS_ID_TTL_SECONDS', str(30 * 24 * 3600)))
+# State and summary do change (outside Slack too), so keep them briefly.
+STATE_TTL_SECONDS = int(os.environ.get('TICKET_STATE_TTL_SECONDS', '30'))
+MAX_ITEMS = int(os.environ.get('TICKET_CACHE_MAX_ITEMS', '5000'))
+# Shared tier. Defaults to the function's own state table; the ServiceNow
+# middleware points this at the Slack stack's table to invalidate entries.
+TICKET_CACHE_TABLE = os.environ.get('TICKET_CACHE_TABLE', STATE_TABLE_NAME)
+
+CACHED_FIELDS = ('number', 'sys_id', 'state', 'short_description')
+
+
+class TicketCache:
+    """Incident metadata by ticket number: LRU in memory, optionally shared through DynamoDB."""
+
+    def __init__(self, store=None, local_ttl=STATE_TTL_SECONDS):
+        self.store = store if store is not None else build_store(
+            max_items=MAX_ITEMS, table_name=TICKET_CACHE_TABLE, local_ttl=local_ttl
+        )
+
+    @property
+    def shared(self):
+        """Whether other functions' writes (the worker's resolves) reach this cache."""
+        return getattr(self.store, 'remote', None) is not None
+
+    def get_many(self, numbers):
+        """Return ({number: fresh incident}, {number: sys_id}) for what the cache knows."""
+        numbers = list(numbers)
+        keys = [f"ticket#{n}" for n in numbers] + [f"sysid#{n}" for n in numbers]
+        values = self.store.get_many(keys)
+        incidents = {n: values[f"ticket#{n}"] for n in numbers if f"ticket#{n}" in values}
+        sys_ids = {n: values[f"sysid#{n}"] for n in numbers if f"sysid#{n}" in values}
+        return incidents, sys_ids
+
+    def get(self, number):
+        return self.store.get(f"ticket#{number}")
+
+    def put(self, incident):
+        number = incident.get('number')
+        if not number or not incident.get('sys_id'):
+            return
+        self.store.put(f"ticket#{number}", {k: incident.get(k) for k in CACHED_FIELDS}, STATE_TTL_SECONDS)
+        self.store.put(f"sysid#{number}", incident['sys_id'], SYS_ID_TTL_SECONDS)
+
+    def invalidate(self, number, forget_sys_id=False):
+        self.store.delete(f"ticket#{number}")
+        if forget_sys_id:
+            self.store.delete(f"sysid#{number}")
@@ -0,0 +1,45 @@
+import os
+import re
+
+# Most tickets one bulk command may touch (one ServiceNow query + one Batch API call)
+MAX_BULK_TICKETS = int(os.environ.get('MAX_BULK_TICKETS', '50'))
+
+INVALID_TICKETS = "❌ Invalid Ticket Number. Use format INC000..."
+
+_TICKET = re.compile(r'^INC(\d+)$')
+# INC0010005-INC0010009, or INC0010005-0010009 / INC0010005-09 (trailing digits of the end)
+_RANGE = re.compile(r'^INC(\d+)-(?:INC)?(\d+)$')
+
+
+def parse_ticket_numbers(text, limit=MAX_BULK_TICKETS):
+    """Ticket numbers in a command's text, in order, without repeats.
+
+    Accepts numbers and ranges separated by commas or spaces, e.g.
+    "INC0010001, INC0010005-INC0010009 INC0010012-15". Raises ValueError
+    with the reply for the user when the text is invalid or too long.
+    """
+    numbers = []
+    for token in re.split(r'[\s,]+', text.strip().upper()):
+        if not token:
+            continue
+        single = _TICKET.match(token)
+        if single:
+            numbers.append(token)
+            continue
+        span = _RANGE.match(token)
+        if not span:
+            raise ValueError(INVALID_TICKETS)
+        start, end = span.groups()
+        width = len(start)
+        if len(end) < width:
+            end = start[:width - len(end)] + end
+        first, last = int(start), int(end)
+        if last < first or last - first >= limit:
+            raise ValueError(f"❌ Invalid range {token}: at most {limit} tickets, in increasing order.")
+        numbers.extend(f"INC{n:0{width}d}" for n in range(first, last + 1))
+    numbers = list(dict.fromkeys(numbers))
+    if not numbers:
+        raise ValueError(INVALID_TICKETS)
+    if len(numbers) > limit:
+        raise ValueError(f"❌ Too many tickets ({len(numbers)}): at most {limit} per command.")
+    return numbers
@@ -0,0 +1,180 @@
+"""Request correlation across the SQS hops, and one trace record per request.
+
+A correlation ID is created where a request enters: the receiver for Slack
+commands, the API Gateway ingest template (its request ID) for ServiceNow
+events. It travels as the `correlation_id` SQS message attribute with the
+entry time (`received_at`, epoch ms); the entry's X-Ray trace header goes
+along as the AWSTraceHeader system attribute.
+
+The consumer adds the queue timings SQS records on every message and writes
+one JSON line per request (`{"trace": ...}`) with these hops, in ms:
+
+    ingress   entry -> SentTimestamp                (receiver / API Gateway)
+    queue     SentTimestamp -> ApproximateFirstReceiveTimestamp (dwell)
+    delivery  first receive -> this invocation      (batching window, retries)
+    batch     invocation start -> record start      (batch lookup, same-key records)
+    process   record start -> done
+
+With TRACE_EXPORT=xray the hops are also sent to the X-Ray daemon as
+subsegments of the entry's trace (tracing is active on both API stages).
+"""
+import json
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+import metrics
+from batch_processing import message_attribute
+
+logger = logging.getLogger()
+
+TRACE_ENABLED = os.environ.get('TRACE_ENABLED', 'true').lower() == 'true'
+TRACE_EXPORT = os.environ.get('TRACE_EXPORT', '')
+HOPS = ('ingress', 'queue', 'delivery', 'batch', 'process')
+
+_XRAY_HEADER = b'{"format":"json","version":1}\n'
+_socket = None
+_socket_lock = threading.Lock()
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def correlation_id(event=None):
+    """The API Gateway request ID when there is one (it is in the access logs too), else a new ID."""
+    request_id = ((event or {}).get('requestContext') or {}).get('requestId')
+    return request_id or uuid.uuid4().hex
+
+
+def message_attributes(correlation, received_at):
+    """SQS send_message kwargs that carry the correlation to the consumer."""
+    kwargs = {'MessageAttributes': {
+        'correlation_id': {'DataType': 'String', 'StringValue': correlation},
+        'received_at': {'DataType': 'Number', 'StringValue': str(received_at)},
+    }}
+    trace_header = os.environ.get('_X_AMZN_TRACE_ID')
+    if trace_header:
+        kwargs['MessageSystemAttributes'] = {'AWSTraceHeader': {'DataType': 'String', 'StringValue': trace_header}}
+    return kwargs
+
+
+def _parse_trace_header(header):
+    parts = dict(part.split('=', 1) for part in (header or '').split(';') if '=' in part)
+    return parts.get('Root'), parts.get('Parent'), parts.get('Sampled') != '0'
+
+
+def _send_to_daemon(documents):
+    global _socket
+    host, port = os.environ.get('AWS_XRAY_DAEMON_ADDRESS', '127.0.0.1:2000').rsplit(':', 1)
+    with _socket_lock:
+        if _socket is None:
+            _socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        for document in documents:
+            payload = _XRAY_HEADER + json.dumps(document, separators=(',', ':')).encode('utf-8')
+            _socket.sendto(payload, (host, int(port)))
+
+
+def export_xray(trace_header, hops, annotations):
+    """Send each (name, start_ms, end_ms) hop as an X-Ray subsegment of the trace in trace_header."""
+    root, parent, sampled = _parse_trace_header(trace_header)
+    if not (root and parent and sampled):
+        return
+    _send_to_daemon([{
+        "name": name,
+        "id": f"{random.getrandbits(64):016x}",
+        "trace_id": root,
+        "parent_id": parent,
+        "type": "subsegment",
+        "start_time": start / 1000,
+        "end_time": end / 1000,
+        "annotations": annotations,
+    } for name, start, end in hops])
+
+
+class RequestTrace:
+    def __init__(self, record, invoked_at, fields):
+        self.record = record
+        self.invoked_at = invoked_at
+        self.fields = fields
+        self.outcome = "ok"
+        self.started_at = now_ms()
+
+    def hops(self, done_at):
+        attributes = self.record.get('attributes', {})
+        sent = int(attributes.get('SentTimestamp') or self.invoked_at)
+        first_receive = int(attributes.get('ApproximateFirstReceiveTimestamp') or sent)
+        received = message_attribute(self.record, 'received_at')
+        entry = min(int(received), sent) if received else sent
+        points = (entry, sent, first_receive, self.invoked_at, self.started_at, done_at)
+        # Clocks of SQS and Lambda differ slightly: a hop is never negative
+        hops, previous = [], entry
+        for name, end in zip(HOPS, points[1:]):
+            end = max(end, previous)
+            hops.append((name, previous, end))
+            previous = end
+        return hops
+
+    def line(self, function, done_at):
+        hops = self.hops(done_at)
+        return {
+            "trace": function,
+            "correlation_id": message_attribute(self.record, 'correlation_id') or self.record.get('messageId'),
+            "message_id": self.record.get('messageId'),
+            "receive_count": int(self.record.get('attributes', {}).get('ApproximateReceiveCount', 1)),
+            "outcome": self.outcome,
+            **self.fields,
+            "total_ms": hops[-1][2] - hops[0][1],
+            "hops": {name: end - start for name, start, end in hops},
+        }
+
+
+class Tracer:
+    """Trace records for one consumer handler; `start()` at the top of every invocation."""
+
+    def __init__(self, function_name, enabled=TRACE_ENABLED, export=TRACE_EXPORT):
+        self.function_name = function_name
+        self.enabled = enabled
+        self.export = export
+        self.invoked_at = now_ms()
+
+    def start(self):
+        self.invoked_at = now_ms()
+
+    @contextmanager
+    def request(self, record, **fields):
+        """Traces processing one record; set `.outcome` on the yielded trace."""
+        trace = RequestTrace(record, self.invoked_at, fields)
+        try:
+            yield trace
+        except BaseException:
+            trace.outcome = "error"
+            raise
+        finally:
+            self._write(trace)
+
+    def skipped(self, records, outcome):
+        """Records acknowledged without processing (duplicates, superseded events)."""
+        for record in records:
+            trace = RequestTrace(record, self.invoked_at, {})
+            trace.outcome = outcome
+            self._write(trace)
+
+    def _write(self, trace):
+        if not self.enabled:
+            return
+        done_at = now_ms()
+        line = trace.line(self.function_name, done_at)
+        metrics.write_line(json.dumps(line, separators=(',', ':'), ensure_ascii=False))
+        if self.export == "xray":
+            try:
+                header = trace.record.get('attributes', {}).get('AWSTraceHeader') or os.environ.get('_X_AMZN_TRACE_ID')
+                annotations = {"correlation_id": line["correlation_id"], "outcome": trace.outcome}
+                export_xray(header, trace.hops(done_at), annotations)
+            except OSError as e:
+                logger.warning(f"X-Ray export failed: {str(e)}")
@@ -0,0 +1,109 @@
+"""Initialization for SnapStart and provisioned concurrency.
+
+On an on-demand cold start everything stays deferred to first use
+(aws_clients, secret_cache). When init runs ahead of traffic instead
+(AWS_LAMBDA_INITIALIZATION_TYPE is snap-start or provisioned-concurrency,
+or EAGER_INIT=true) the handlers do that work during init: import boto3 and
+build their clients, fetch the secret and, with PREWARM_CONNECTIONS=true,
+open pooled TLS connections to ServiceNow and Slack.
+
+A SnapStart snapshot must not carry credentials or sockets: before the
+snapshot the secret is dropped and every connection closed; after restore
+the secret is fetched again and the connections re-opened. Every restored
+environment also starts from the snapshot's `random` state, so it is
+reseeded: backoff and postpone jitter and X-Ray IDs must differ between them.
+"""
+import logging
+import os
+import random
+
+import aws_clients
+from secret_cache import get_secret_cache
+
+try:
+    # Lambda Python runtime (SnapStart); absent locally, where run_* below stand in
+    from snapshot_restore_py import register_after_restore, register_before_snapshot
+except ImportError:
+    register_after_restore = register_before_snapshot = None
+
+logger = logging.getLogger()
+
+INIT_TYPE = os.environ.get('AWS_LAMBDA_INITIALIZATION_TYPE', 'on-demand')
+SNAPSTART = INIT_TYPE == 'snap-start'
+EAGER_INIT = (SNAPSTART or INIT_TYPE == 'provisioned-concurrency'
+              or os.environ.get('EAGER_INIT', 'false').lower() == 'true')
+PREWARM_CONNECTIONS = os.environ.get('PREWARM_CONNECTIONS', 'false').lower() == 'true'
+# Connections opened per host; the worker's batch threads each need one
+PREWARM_CONNECTIONS_PER_HOST = int(os.environ.get('PREWARM_CONNECTIONS_PER_HOST', '1'))
+
+_BEFORE_SNAPSHOT = []
+_AFTER_RESTORE = []
+
+
+def run_before_snapshot():
+    for hook in _BEFORE_SNAPSHOT:
+        hook()
+
+
+def run_after_restore():
+    for hook in _AFTER_RESTORE:
+        hook()
+
+
+class WarmStart:
+    """Init-time work for one handler.
+
+    clients: AWS services the handler calls; http: its HttpClient;
+    prewarm_urls(secrets): the URLs whose hosts the first request will call.
+    """
+
+    def __init__(self, clients, http, prewarm_urls, connections=PREWARM_CONNECTIONS_PER_HOST):
+        self.clients = clients
+        self.http = http
+        self.prewarm_urls = prewarm_urls
+        self.connections = connections
+
+    def warm(self):
+        aws_clients.warm(*self.clients)
+        if PREWARM_CONNECTIONS or not SNAPSTART:
+            self.refresh()
+
+    def refresh(self):
+        secrets = get_secret_cache().get()
+        if PREWARM_CONNECTIONS:
+            self.http.prewarm(self.prewarm_urls(secrets), self.connections)
+
+    def before_snapshot(self):
+        get_secret_cache().invalidate()
+        self.http.close()
+        aws_clients.close_all()
+
+    def after_restore(self):
+        random.seed()
+        self.refresh()
+
+
+def _best_effort(name, fn):
+    # A failed warm-up must not fail init: the first request does the work instead
+    def hook():
+        try:
+            fn()
+        except Exception as e:
+            logger.warning(f"{name} failed: {str(e)}")
+    return hook
+
+
+def init(clients, http, prewarm_urls):
+    """Called at the end of a handler module: warms up now when init runs ahead of traffic and
+    registers the SnapStart hooks."""
+    warm_start = WarmStart(clients, http, prewarm_urls)
+    before = _best_effort("before_snapshot", warm_start.before_snapshot)
+    after = _best_effort("after_restore", warm_start.after_restore)
+    _BEFORE_SNAPSHOT.append(before)
+    _AFTER_RESTORE.append(after)
+    if SNAPSTART and register_before_snapshot is not None:
+        register_before_snapshot(before)
+        register_after_restore(after)
+    if EAGER_INIT:
+        _best_effort("Eager init", warm_start.warm)()
+    return warm_start
@@ -1,97 +1,442 @@
 import json
-import urllib3
-import boto3
-import os
 import logging
+import os
+import time
+from backpressure import Backpressure, get_destination, postpone
+from batch_processing import MAX_WORKERS, process_batch
+from dead_letter import DeadLetterQueue, load_payload
+from http_client import HttpClient
+from idempotency import IdempotencyStore
+from metrics import Metrics
+from rate_limiter import rate_limited
+from secret_cache import get_secret_cache
+from servicenow_client import ServiceNowClient, ServiceNowError, base_url
+from single_flight import WAIT_SECONDS, SingleFlight, wait_for
+from slack_messages import (
+    already_resolved, bulk_report, not_found, resolve_in_progress, resolved, status_line, status_report,
+)
+from ticket_cache import TicketCache
+from tracing import Tracer
+from warm_start import init
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
-http = urllib3.PoolManager()
 
-SECRETS_CLIENT = boto3.client('secretsmanager')
+# number -> sys_id/state/summary (memory LRU, shared through DynamoDB when configured)
+TICKET_CACHE = TicketCache()
+# (command, ticket) leases so identical concurrent commands hit ServiceNow once
+FLIGHTS = SingleFlight()
+# Messages already answered (SQS redelivery, duplicate sends) skip the PATCH and the Slack reply
+IDEMPOTENCY = IdempotencyStore("slack-command")
+# Per-stage timings, emitted as CloudWatch EMF once per invocation
+METRICS = Metrics("worker")
+# One trace record per command: receiver -> queue -> this worker
+TRACES = Tracer("worker")
+# Commands that can never succeed (malformed payloads, deleted tickets) skip the retries
+DEAD_LETTERS = DeadLetterQueue(METRICS)
+# Shared by the batch threads: timeouts, safe retries, one connection per worker per host
+http = HttpClient(maxsize=MAX_WORKERS, metrics=METRICS)
+# Circuit breaker + adaptive concurrency limit in front of ServiceNow, behind the
+# instance/user token bucket shared by every concurrent Lambda
+SERVICENOW = get_destination("servicenow")
+
+CLOSED_STATES = ['Resolved', 'Closed']
+# state '7' = Closed in standard SN instances (check your instance mapping)
+RESOLVE_FIELDS = {"state": "7", "close_code": "Solved (Work Around)", "close_notes": "Closed via Slack"}
+
+# Host of the Slack response_url replies, pre-warmed with PREWARM_CONNECTIONS=true
+SLACK_PREWARM_URL = os.environ.get('SLACK_PREWARM_URL', 'https://hooks.slack.com/')
+# SnapStart / provisioned concurrency: clients, secret and the ServiceNow and Slack
+# connections are ready before the first batch (no-op on on-demand cold starts)
+init(
+    ["secretsmanager"] + (["dynamodb"] if os.environ.get('STATE_TABLE_NAME') else []),
+    http, lambda secrets: [base_url(secrets['sn_instance']) + "/", SLACK_PREWARM_URL],
+)
 
+
+@METRICS.handler
 def lambda_handler(event, context):
+    TRACES.start()
     try:
-        secret_arn = os.environ['SECRET_ARN']
-        response = SECRETS_CLIENT.get_secret_value(SecretId=secret_arn)
-        secrets = json.loads(response['SecretString'])
-        
-        SN_INSTANCE = secrets['sn_instance']
-        SN_USER = secrets['sn_user']
-        SN_PASS = secrets['sn_pass']
+        secret_cache = get_secret_cache()
+        with METRICS.stage("secrets"):
+            secret_cache.get()
     except Exception as e:
         logger.error(f"Failed to retrieve secrets: {str(e)}")
         raise e 
 
-    for record in event['Records']:
+    # 1. One ServiceNow round-trip for the whole batch: look up every ticket in a
+    #    single query, then apply all resolves together (Batch API where supported).
+    #    On a ServiceNow 401 the password may have rotated: refresh and retry once.
+    with METRICS.stage("idempotency"):
+        records, duplicates = IDEMPOTENCY.split(event['Records'])
+    METRICS.increment("duplicates_skipped", len(duplicates))
+    TRACES.skipped(duplicates, "duplicate")
+    payloads = {record['messageId']: parse_body(record) for record in records}
+    groups = ticket_groups(records)
+
+    def load_tickets(group_payloads):
+        return secret_cache.call_with_refresh(
+            lambda secrets: TicketBatch.load(
+                ServiceNowClient(secrets['sn_instance'], secrets['sn_user'], secrets['sn_pass'],
+                                 servicenow_http(secrets)),
+                group_payloads, TICKET_CACHE, FLIGHTS
+            )
+        )
+
+    try:
+        batch = load_tickets([p for p in payloads.values() if p])
+        tickets = {key: batch for key in groups.values()}
+    except Backpressure as e:
+        # ServiceNow is overloaded, rate limited or its circuit is open: hide the whole batch
+        # for a while instead of letting SQS hand it straight back
+        logger.warning(f"ServiceNow backpressure, postponing {len(records)} record(s): {str(e)}")
+        for record in records:
+            postpone(record, e.retry_in)
+        TRACES.skipped(records, "postponed")
+        return {"batchItemFailures": [{"itemIdentifier": r['messageId']} for r in records]}
+    except Exception as e:
+        # One ticket's failing query or update must not fail the whole batch: load each
+        # ticket group on its own, and only the records of groups that fail again are retried
+        logger.error(f"ServiceNow batch lookup failed, loading ticket groups separately: {str(e)}")
+        by_group = {}
+        for record in records:
+            if payloads[record['messageId']]:
+                by_group.setdefault(groups[record['messageId']], []).append(payloads[record['messageId']])
+        tickets = {}
+        for key, group_payloads in by_group.items():
+            try:
+                tickets[key] = load_tickets(group_payloads)
+            except Exception as group_error:
+                logger.error(f"ServiceNow lookup failed for ticket group {key}: {str(group_error)}")
+                tickets[key] = group_error
+
+    def handle_record(record):
+        payload = load_payload(record)
+        group_tickets = tickets[groups[record['messageId']]]
+        if isinstance(group_tickets, Exception):
+            raise group_tickets
+        with TRACES.request(record, action=payload.get('action')) as trace, \
+                METRICS.stage("process_message", action=payload.get('action')) as stage:
+            stage.outcome = trace.outcome = process_message(payload, group_tickets)
+        IDEMPOTENCY.complete(record)
+
+    # 2. Reply per message. Different tickets run in parallel; commands for the same
+    #    ticket keep their order (a status check queued after a resolve must see the resolved state).
+    result = process_batch(records, handle_record, key=lambda record: groups[record['messageId']],
+                           dead_letter=DEAD_LETTERS.isolate)
+    logger.info(f"Secret cache stats: {secret_cache.stats()}")
+    return result
+
+
+def servicenow_http(secrets):
+    return rate_limited(SERVICENOW.wrap(http), secrets['sn_instance'], secrets['sn_user'])
+
+
+def parse_body(record):
+    try:
+        payload = json.loads(record['body'])
+    except ValueError:
+        return None
+    return payload if isinstance(payload, dict) else None
+
+
+def ticket_groups(records):
+    """Group key per messageId: commands sharing a ticket, directly or through bulk commands, share one.
+
+    They run one after another in queue order, so a bulk resolve never races a
+    single resolve of the same ticket for its update result.
+    """
+    parent = {}
+
+    def root(number):
+        while parent.setdefault(number, number) != number:
+            number = parent[number]
+        return number
+
+    tickets = {}
+    for record in records:
+        payload = parse_body(record)
+        numbers = tickets[record['messageId']] = payload_tickets(payload) if payload else []
+        for number in numbers[1:]:
+            parent[root(number)] = root(numbers[0])
+    return {message_id: root(numbers[0]) if numbers else None for message_id, numbers in tickets.items()}
+
+
+def payload_tickets(payload):
+    """Tickets a command refers to: `ticket_numbers` for bulk commands, else `ticket_number`."""
+    numbers = payload.get('ticket_numbers')
+    if isinstance(numbers, list):
+        return [n for n in numbers if isinstance(n, str)]
+    return [payload['ticket_number']] if payload.get('ticket_number') else []
+
+
+class TicketBatch:
+    """ServiceNow view of the tickets in one SQS batch.
+
+    Built from the ticket cache, one query for the tickets it cannot answer,
+    and one (batch) update for every resolve. Resolve messages then replay
+    those results in queue order, so each message sees the ticket state as it
+    was at its position in the queue.
+
+    Identical commands are single-flighted: inside the batch they share the
+    query and the PATCH, and across concurrent invocations a lease per
+    (command, ticket) lets one invocation do the work while the others wait
+    for its result. All of a batch's waits share one WAIT_SECONDS deadline.
+    """
+
+    def __init__(self):
+        self.incidents = {}  # number -> incident record (display values)
+        self.resolve_results = {}  # number -> (status, updated record)
+        self.resolved_by = {}  # number -> user whose resolve closed the ticket
+        self.resolving_by = {}  # number -> user whose resolve is still in flight elsewhere
+
+    @classmethod
+    def load(cls, client, payloads, cache, flights):
+        batch = cls()
+        deadline = time.monotonic() + WAIT_SECONDS
+        batch._lookup(client, payloads, cache, flights, deadline)
+        batch._resolve(client, payloads, cache, flights, deadline)
+        return batch
+
+    def _lookup(self, client, payloads, cache, flights, deadline):
+        numbers = {n for p in payloads for n in payload_tickets(p)}
+        status_numbers = {n for p in payloads if p.get('action') == '/ops-status' for n in payload_tickets(p)}
+
+        # Fresh state answers status checks; a known sys_id is enough to resolve
+        # (the PATCH response tells us the new state), so only the rest is queried.
+        # Without a fresh state the closed check is skipped: a ticket closed outside
+        # Slack since then is PATCHed again (close_code/close_notes rewritten, state
+        # stays Closed) and reported as resolved, not "already Closed".
+        incidents, sys_ids = cache.get_many(numbers)
+        to_query = set()
+        for number in numbers - set(incidents):
+            if number in status_numbers or number not in sys_ids:
+                to_query.add(number)
+            else:
+                incidents[number] = {
+                    'number': number, 'sys_id': sys_ids[number], 'state': None, 'short_description': '',
+                }
+
+        # Tickets another invocation is already querying: wait for its result in the cache
+        leading = {n for n in to_query if flights.acquire('/ops-status', n, owner="worker") is None}
+        following = to_query - leading
+        if following:
+            shared = {}
+
+            def followed_results_cached():
+                shared.update(cache.get_many(following - set(shared))[0])
+                return len(shared) == len(following)
+
+            wait_for(followed_results_cached, max(0.0, deadline - time.monotonic()))
+            incidents.update(shared)
+            to_query -= set(shared)
+
         try:
-            payload = json.loads(record['body'])
-            process_message(payload, SN_INSTANCE, SN_USER, SN_PASS)
-        except Exception as e:
-            logger.error(f"Error processing record: {str(e)}")
-            raise e 
-            
-    return {'statusCode': 200, 'body': "Batch Processed"}
-
-def process_message(payload, sn_instance, sn_user, sn_pass):
+            if to_query:
+                with METRICS.stage("servicenow_query") as stage:
+                    fetched = client.query_incidents(to_query)
+                    stage.status = 200
+                for incident in fetched.values():
+                    cache.put(incident)
+                incidents.update(fetched)
+        finally:
+            for number in leading:
+                flights.release('/ops-status', number)
+        logger.info(f"Ticket cache: {len(numbers) - len(to_query)} hit(s), {len(to_query)} queried")
+        self.incidents = incidents
+
+    def _resolve(self, client, payloads, cache, flights, deadline):
+        # The first resolve per ticket in queue order owns the PATCH
+        first_resolver = {}
+        for p in payloads:
+            if p.get('action') == '/ops-resolve':
+                for number in payload_tickets(p):
+                    first_resolver.setdefault(number, p.get('user_id'))
+
+        updates = {}
+        leased = {}
+        contended = {}  # number -> last seen holder of another invocation's lease
+        for number, user_id in first_resolver.items():
+            incident = self.incidents.get(number)
+            if not incident:
+                continue
+            if incident['state'] in CLOSED_STATES:
+                holder = flights.holder('/ops-resolve', number)
+                if holder and holder.get('done'):
+                    self.resolved_by[number] = holder.get('owner')
+                continue
+            holder = flights.acquire('/ops-resolve', number, user_id)
+            if holder is None:
+                leased[number] = user_id
+            else:
+                contended[number] = holder
+
+        # Wait for all the other invocations' resolves together, not one ticket after another
+        def leases_settled():
+            for number, holder in contended.items():
+                if holder is not None and not holder.get('done'):
+                    contended[number] = flights.holder('/ops-resolve', number)
+            return all(holder is None or holder.get('done') for holder in contended.values())
+
+        if contended:
+            wait_for(leases_settled, max(0.0, deadline - time.monotonic()))
+        for number, holder in contended.items():
+            # A finished resolve caches the closed state before it completes its lease
+            refreshed = (cache.get(number) or {}).get('state')
+            if holder and holder.get('done') and refreshed is not None and refreshed not in CLOSED_STATES:
+                # The ticket was reopened since that resolve: the lease is stale
+                flights.release('/ops-resolve', number)
+                holder = None
+            if holder is None:
+                # The other resolve failed and released its lease, or it is stale: try to take over
+                holder = flights.acquire('/ops-resolve', number, first_resolver[number])
+            if holder is None:
+                leased[number] = first_resolver[number]
+            elif holder.get('done'):
+                # The lease is done, so the ticket is resolved (unknown state counts as closed)
+                state = refreshed if refreshed in CLOSED_STATES else 'Closed'
+                self.incidents[number] = {**self.incidents[number], 'state': state}
+                self.resolved_by[number] = holder.get('owner')
+            else:
+                self.resolving_by[number] = holder.get('owner')
+        for number in leased:
+            updates[self.incidents[number]['sys_id']] = RESOLVE_FIELDS
+
+        try:
+            results = {}
+            if updates:
+                with METRICS.stage("servicenow_update", action='/ops-resolve') as stage:
+                    results = client.update_incidents(updates)
+                    statuses = {status for status, _ in results.values()}
+                    stage.status = statuses.pop() if len(statuses) == 1 else "mixed"
+                    stage.outcome = "ok" if stage.status == 200 else "error"
+        except Exception:
+            for number in leased:
+                flights.release('/ops-resolve', number)
+            raise
+
+        for number, user_id in leased.items():
+            incident = self.incidents[number]
+            status, record = results.get(incident['sys_id'], (None, None))
+            self.resolve_results[number] = (status, record)
+            # Our own PATCH changed the ticket: replace the cached state (or drop a stale sys_id)
+            if status == 200:
+                cache.put({**incident, **(record or {}), 'state': (record or {}).get('state') or 'Closed'})
+                flights.complete('/ops-resolve', number, user_id)
+            else:
+                if status == 404:
+                    # The incident is gone (a cached sys_id outlived it): its commands answer "not found"
+                    self.incidents.pop(number, None)
+                cache.invalidate(number, forget_sys_id=(status == 404))
+                flights.release('/ops-resolve', number)
+
+    def get(self, ticket_number):
+        return self.incidents.get(ticket_number)
+
+    def resolve(self, ticket_number, user_id=None):
+        # The first resolve message for a ticket consumes the update result
+        status, record = self.resolve_results.pop(ticket_number, (None, None))
+        if status != 200:
+            raise ServiceNowError(f"Update failed: {status}", status)
+        incident = dict(self.incidents[ticket_number])
+        incident['state'] = (record or {}).get('state') or 'Closed'
+        self.incidents[ticket_number] = incident
+        self.resolved_by[ticket_number] = user_id
+        return incident
+
+
+# Returns the outcome recorded for the process_message stage
+def process_message(payload, tickets):
+    if 'ticket_numbers' in payload:
+        return process_bulk(payload, tickets)
     action = payload.get('action') # /ops-resolve or /ops-status
     ticket_number = payload.get('ticket_number')
     response_url = payload.get('response_url')
     
     if not ticket_number or not response_url:
-        return
+        return "invalid"
 
-    auth_header = urllib3.make_headers(basic_auth=f"{sn_user}:{sn_pass}")
-    headers = {'Content-Type': 'application/json'}
-    headers.update(auth_header)
-
-    # 1. GET TICKET DETAILS (Common for both actions)
-    sn_url = f"https://{sn_instance}.service-now.com/api/now/table/incident?sysparm_query=number={ticket_number}&sysparm_display_value=true"
-    
-    logger.info(f"Querying ServiceNow for {ticket_number}")
-    find_req = http.request('GET', sn_url, headers=headers)
+    # 1. GET TICKET DETAILS (prefetched for the whole batch)
+    incident = tickets.get(ticket_number)
     
-    if find_req.status != 200:
-        raise Exception(f"ServiceNow query failed: {find_req.status}")
-
-    find_data = json.loads(find_req.data.decode('utf-8'))
-    
-    if not find_data.get('result'):
-        send_slack_response(response_url, f"❌ Ticket {ticket_number} not found.")
-        return
+    if not incident:
+        send_slack_response(response_url, not_found(ticket_number))
+        return "not_found"
         
-    incident = find_data['result'][0]
-    sys_id = incident['sys_id']
     current_state = incident['state'] # e.g., "New", "Resolved"
-    short_desc = incident['short_description']
 
     # --- LOGIC BRANCH ---
     
     # CASE A: STATUS CHECK
     if action == '/ops-status':
-        msg = f"📋 *Status Report for {ticket_number}*\n> **State:** {current_state}\n> **Summary:** {short_desc}"
-        send_slack_response(response_url, msg)
-        return
+        send_slack_response(response_url, status_report(ticket_number, incident))
+        return "ok"
 
     # CASE B: RESOLVE TICKET
     elif action == '/ops-resolve':
-        if current_state in ['Resolved', 'Closed']:
-            send_slack_response(response_url, f"⚠️ {ticket_number} is already *{current_state}*.")
-            return
+        if current_state in CLOSED_STATES:
+            resolved_by = tickets.resolved_by.get(ticket_number)
+            send_slack_response(response_url, already_resolved(ticket_number, current_state, resolved_by))
+            return "already_resolved"
+        if ticket_number in tickets.resolving_by:
+            send_slack_response(response_url, resolve_in_progress(ticket_number, tickets.resolving_by[ticket_number]))
+            return "in_progress"
 
-        update_url = f"https://{sn_instance}.service-now.com/api/now/table/incident/{sys_id}"
-        # state '7' = Closed in standard SN instances (check your instance mapping)
-        update_payload = {"state": "7", "close_code": "Solved (Work Around)", "close_notes": "Closed via Slack"}
-        
-        update_req = http.request('PATCH', update_url, headers=headers, body=json.dumps(update_payload))
-        
-        if update_req.status == 200:
-            send_slack_response(response_url, f"✅ **Success!** {ticket_number} has been resolved.")
+        # The PATCH already went out with the batch update; raises if it failed
+        tickets.resolve(ticket_number, payload.get('user_id'))
+        send_slack_response(response_url, resolved(ticket_number))
+        return "ok"
+    return "unknown_action"
+
+
+def process_bulk(payload, tickets):
+    """/ops-status or /ops-resolve for a list of tickets: one aggregated Slack reply.
+
+    The lookup and the (Batch API) update already happened for the whole SQS
+    batch. Failed updates are reported per ticket; only when every attempted
+    update failed is the message retried.
+    """
+    action = payload.get('action')
+    numbers = payload_tickets(payload)
+    response_url = payload.get('response_url')
+    if not numbers or not response_url:
+        return "invalid"
+    if action not in ('/ops-status', '/ops-resolve'):
+        return "unknown_action"
+
+    lines = []
+    attempted = failed = 0
+    for number in numbers:
+        incident = tickets.get(number)
+        if not incident:
+            lines.append(not_found(number))
+        elif action == '/ops-status':
+            lines.append(status_line(number, incident))
+        elif incident['state'] in CLOSED_STATES:
+            lines.append(already_resolved(number, incident['state'], tickets.resolved_by.get(number)))
+        elif number in tickets.resolving_by:
+            lines.append(resolve_in_progress(number, tickets.resolving_by[number]))
         else:
-            raise Exception(f"Update failed: {update_req.status}")
+            attempted += 1
+            try:
+                tickets.resolve(number, payload.get('user_id'))
+                lines.append(resolved(number))
+            except ServiceNowError as e:
+                failed += 1
+                lines.append(f"❌ {number}: {str(e)}")
+    if attempted and failed == attempted:
+        raise ServiceNowError(f"Bulk update failed for all {attempted} ticket(s)")
+    send_slack_response(response_url, bulk_report(action, lines))
+    return "partial" if failed else "ok"
+
 
 def send_slack_response(response_url, text):
     try:
-        http.request('POST', response_url, body=json.dumps({"text": text, "response_type": "in_channel"}), headers={'Content-Type': 'application/json'})
+        with METRICS.stage("slack_response") as stage:
+            body = json.dumps({"text": text, "response_type": "in_channel"})
+            response = http.request('POST', response_url, body=body, headers={'Content-Type': 'application/json'})
+            stage.status = response.status
+            stage.outcome = "ok" if response.status < 300 else "error"
     except Exception as e:
         logger.error(f"Failed to send Slack response: {str(e)}")
\ No newline at end of file
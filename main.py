@@ -1,6 +1,471 @@
-def main():
-    print("Hello from chatops-servicenow-devops-agent-integration!")
+"""Operator CLI for the ServiceNow -> DevOps Agent integration.
+
+backfill: push existing incidents to the DevOps Agent webhook, e.g. after the
+webhook was down or when onboarding a new agent space. Live Business Rule
+events keep flowing through the middleware meanwhile.
+
+    python main.py backfill --query "active=true" --rate 20 --concurrency 8
+    python main.py backfill --resume            # continue after an interruption
+    python main.py backfill --dry-run           # count what would be sent
+
+Incidents are read from the Table API in sys_id order, one keyset page at a
+time (`--query` is a ServiceNow encoded query), and each becomes the same
+signed agent event the middleware sends (agent_events): resolved or closed
+incidents as "resolved", the rest as "created". Sends run concurrently under
+a token-bucket rate limit and the agent circuit breaker; while the webhook
+is overloaded the backfill waits instead of failing incidents.
+
+The checkpoint file holds the last sys_id up to which every incident was
+sent, written every few seconds and on exit (also on Ctrl-C); --resume
+continues after it. Incidents that still fail after retries are appended to
+the failures file (JSON lines) and skipped. Memory stays bounded: one page
+and at most 4 x concurrency incidents in flight, whatever the incident count.
+
+Credentials come from the stacks' secrets: ServiceNow (sn_instance, sn_user,
+sn_pass) and the agent webhook (webhook_url, secret_string).
+
+redrive: replay dead-lettered messages (lambda/dead_letter.py) to their source
+queue once the fix has shipped.
+
+    python main.py redrive --queue ServiceNow-DevOps-SQSQueue-DLQ --rate 50
+    python main.py redrive --queue <dlq> --attribute dead_letter_error=PermanentError --dry-run
+    python main.py redrive --queue <dlq> --native      # SQS message move task, no filters
+
+Several receivers drain the DLQ in batches of 10 and send the matching
+messages back with SendMessageBatch under a token-bucket rate limit, without
+the dead_letter_* attributes; a message is deleted from the DLQ only once it
+was sent. Messages that do not match the filters (and every message in a dry
+run) are made visible again at the end.
+"""
+import argparse
+import collections
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from chat_ops_service_now_dev_ops_agent_integration.lambda_bundles import LAMBDA_DIR
+
+sys.path.insert(0, LAMBDA_DIR)
+from agent_events import build_agent_payload, sign_agent_payload  # noqa: E402
+from aws_clients import get_client  # noqa: E402
+from backpressure import AIMDLimiter, Backpressure, Destination  # noqa: E402
+from dead_letter import DLQ_SUFFIX, REASON_ATTRIBUTES  # noqa: E402
+from http_client import HttpClient  # noqa: E402
+from rate_limiter import RateLimiter, rate_limited  # noqa: E402
+from secret_cache import CredentialsRejected, get_secret_cache  # noqa: E402
+import servicenow_client  # noqa: E402
+
+logger = logging.getLogger("cli")
+
+# What build_agent_payload reads, plus state for the action
+BACKFILL_FIELDS = ('sys_id', 'number', 'state', 'priority', 'short_description', 'description')
+CLOSED_STATES = ('Resolved', 'Closed')
+CHECKPOINT_INTERVAL_SECONDS = 5
+# Attempts per incident while the webhook is overloaded (circuit open, 429, 5xx)
+SEND_ATTEMPTS = 5
+MAX_BACKOFF_SECONDS = 60
+# Consecutive empty receives (1 s long polls) after which the DLQ counts as drained
+EMPTY_RECEIVES = 3
+
+
+def agent_event(incident):
+    """The Business Rule event body the middleware would have received for this incident."""
+    event_type = "incident_resolved" if incident.get('state') in CLOSED_STATES else "incident_created"
+    return {"event_type": event_type, "incident": incident}
+
+
+class Checkpoint:
+    """Progress of one backfill query, saved atomically as JSON."""
+
+    def __init__(self, path, query, after=None, counts=None, complete=False):
+        self.path = path
+        self.query = query
+        self.after = after
+        self.counts = collections.Counter(counts or {})
+        self.complete = complete
+
+    @classmethod
+    def load(cls, path, query):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data["query"] != query:
+            raise ValueError(f"{path} is for query {data['query']!r}, not {query!r}")
+        return cls(path, query, data.get("after"), data.get("counts"), data.get("complete", False))
+
+    def save(self):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"query": self.query, "after": self.after, "counts": dict(self.counts),
+                       "complete": self.complete}, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+class Backfill:
+    def __init__(self, servicenow_secrets, agent_secrets, args):
+        self.servicenow_secrets = servicenow_secrets
+        self.agent_secrets = agent_secrets
+        self.args = args
+        self.http = HttpClient(maxsize=args.concurrency)
+        self.limiter = RateLimiter("agent-backfill", rate=args.rate, capacity=max(1.0, args.rate),
+                                   read_reserve=0.0, max_wait=MAX_BACKOFF_SECONDS)
+        self.agent = Destination("agent", limiter=AIMDLimiter(maximum=args.concurrency))
+        self.counts = collections.Counter()
+        self._lock = threading.Lock()
+        self._failures = None
+
+    def incidents(self, after):
+        secrets = self.servicenow_secrets.get()
+        http = rate_limited(self.http, secrets['sn_instance'], secrets['sn_user'])
+        client = servicenow_client.ServiceNowClient(
+            secrets['sn_instance'], secrets['sn_user'], secrets['sn_pass'], http
+        )
+        return client.scan_incidents(self.args.query, BACKFILL_FIELDS, after=after, page_size=self.args.page_size)
+
+    def _post(self, agent_payload, secrets):
+        payload_str, headers = sign_agent_payload(agent_payload, secrets['secret_string'])
+        self.limiter.acquire(write=True)
+        response = self.agent.call(
+            lambda: self.http.request('POST', secrets['webhook_url'], body=payload_str, headers=headers)
+        )
+        if response.status in (401, 403):
+            raise CredentialsRejected(f"AWS Webhook returned {response.status}")
+        if response.status < 200 or response.status >= 300:
+            raise Exception(f"AWS Webhook returned error: {response.status} - {response.data.decode('utf-8')}")
+
+    def send(self, incident):
+        """Send one incident; returns its outcome ("sent", "failed" or, in a dry run, the action)."""
+        agent_payload = build_agent_payload(agent_event(incident))
+        if self.args.dry_run:
+            return f"would send {agent_payload['action']} ({agent_payload['priority']})"
+        for attempt in range(1, SEND_ATTEMPTS + 1):
+            try:
+                # A 401/403 usually means the HMAC secret was rotated: refresh it and retry once
+                self.agent_secrets.call_with_refresh(lambda secrets: self._post(agent_payload, secrets))
+                return "sent"
+            except Backpressure as e:
+                if attempt == SEND_ATTEMPTS:
+                    error = e
+                    break
+                logger.warning(f"{incident['number']}: {str(e)}, retrying in {e.retry_in}s")
+                time.sleep(min(e.retry_in, MAX_BACKOFF_SECONDS))
+            except Exception as e:
+                error = e
+                break
+        self._record_failure(incident, error)
+        return "failed"
+
+    def _record_failure(self, incident, error):
+        logger.error(f"{incident['number']}: {str(error)}")
+        with self._lock:
+            if self._failures is None:
+                self._failures = open(self.args.failures, "a", encoding="utf-8")
+            self._failures.write(json.dumps({"number": incident['number'], "sys_id": incident['sys_id'],
+                                             "error": str(error)}) + "\n")
+            self._failures.flush()
+
+    def run(self, checkpoint):
+        """Send every incident after the checkpoint; returns the report."""
+        started = last_report = last_save = time.monotonic()
+        scanned = 0
+        # (sys_id, future) in sys_id order: the checkpoint only moves past incidents that are done
+        pending = collections.deque()
+
+        def settle():
+            while pending and pending[0][1].done():
+                sys_id, future = pending.popleft()
+                self.counts[future.result()] += 1
+                checkpoint.after = sys_id
+
+        # Counts of earlier runs of this query, plus this run's
+        previous = collections.Counter(checkpoint.counts)
+
+        def save():
+            if not self.args.dry_run:
+                checkpoint.counts = previous + self.counts
+                checkpoint.save()
+
+        interrupted = False
+        with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+            try:
+                for incident in self.incidents(checkpoint.after):
+                    if self.args.max_records and scanned >= self.args.max_records:
+                        break
+                    if len(pending) >= 4 * self.args.concurrency:
+                        wait([pending[0][1]])
+                    settle()
+                    pending.append((incident['sys_id'], pool.submit(self.send, incident)))
+                    scanned += 1
+                    now = time.monotonic()
+                    if now - last_save >= CHECKPOINT_INTERVAL_SECONDS:
+                        save()
+                        last_save = now
+                    if now - last_report >= self.args.progress_seconds:
+                        self.report_progress(scanned, now - started)
+                        last_report = now
+                else:
+                    checkpoint.complete = not self.args.dry_run
+            except KeyboardInterrupt:
+                interrupted = True
+                logger.warning("Interrupted: finishing in-flight incidents and saving the checkpoint")
+            finally:
+                wait([future for _, future in pending])
+                settle()
+                save()
+                if self._failures is not None:
+                    self._failures.close()
+        duration = time.monotonic() - started
+        report = {
+            "query": self.args.query,
+            "scanned": scanned,
+            **dict(sorted(self.counts.items())),
+            "duration_s": round(duration, 1),
+            "throughput_per_s": round(scanned / duration, 1) if duration else None,
+            "after": checkpoint.after,
+            "complete": checkpoint.complete,
+            "interrupted": interrupted,
+        }
+        if self.counts.get("failed"):
+            report["failures_file"] = self.args.failures
+        return report
+
+    def report_progress(self, scanned, elapsed):
+        counts = ", ".join(f"{name} {n}" for name, n in sorted(self.counts.items()))
+        print(f"[{elapsed:.0f}s] scanned {scanned} ({scanned / elapsed:.1f}/s): {counts}", file=sys.stderr)
+
+
+def backfill(args, servicenow_secrets=None, agent_secrets=None):
+    checkpoint = Checkpoint(args.checkpoint, args.query)
+    if args.resume and os.path.exists(args.checkpoint):
+        checkpoint = Checkpoint.load(args.checkpoint, args.query)
+        if checkpoint.complete:
+            print(f"{args.checkpoint}: backfill already complete", file=sys.stderr)
+            return {"query": args.query, "scanned": 0, "complete": True}
+        print(f"Resuming after sys_id {checkpoint.after}", file=sys.stderr)
+    runner = Backfill(
+        servicenow_secrets or get_secret_cache(args.servicenow_secret),
+        agent_secrets or get_secret_cache(args.agent_secret),
+        args,
+    )
+    return runner.run(checkpoint)
+
+
+def source_queue_url(dead_letter_queue_url):
+    """The queue a DLQ belongs to, by the <queue>-DLQ naming of the stacks."""
+    url, fifo = (dead_letter_queue_url[:-len(".fifo")], ".fifo") if dead_letter_queue_url.endswith(".fifo") \
+        else (dead_letter_queue_url, "")
+    if not url.endswith(DLQ_SUFFIX):
+        raise ValueError(f"{dead_letter_queue_url} is not named <queue>{DLQ_SUFFIX}: pass --target")
+    return url[:-len(DLQ_SUFFIX)] + fifo
+
+
+class Redrive:
+    def __init__(self, sqs, queue_url, target_url, args):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.target_url = target_url
+        self.args = args
+        self.filters = dict(f.split("=", 1) for f in args.attribute)
+        self.limiter = RateLimiter("redrive", rate=args.rate, capacity=max(1.0, args.rate),
+                                   read_reserve=0.0, max_wait=MAX_BACKOFF_SECONDS)
+        self.counts = collections.Counter()
+        self.seen = set()
+        # Receipt handles of messages left in the DLQ, made visible again at the end
+        self.held = []
+        self.empty_receives = 0
+        self._lock = threading.Lock()
+
+    def matches(self, message):
+        attributes = message.get('MessageAttributes') or {}
+        if any((attributes.get(name) or {}).get('StringValue') != value for name, value in self.filters.items()):
+            return False
+        return not self.args.body_contains or self.args.body_contains in message['Body']
+
+    def _entry(self, i, message):
+        entry = {
+            'Id': str(i),
+            'MessageBody': message['Body'],
+            'MessageAttributes': {
+                name: {'DataType': value['DataType'], 'StringValue': value['StringValue']}
+                for name, value in (message.get('MessageAttributes') or {}).items()
+                if name not in REASON_ATTRIBUTES and 'StringValue' in value
+            },
+        }
+        group = (message.get('Attributes') or {}).get('MessageGroupId')
+        if group:
+            # A new deduplication ID: the source queue may have seen this body within 5 minutes
+            entry.update(MessageGroupId=group, MessageDeduplicationId=f"redrive-{message['MessageId']}")
+        return entry
+
+    def _done(self):
+        with self._lock:
+            return self.empty_receives >= EMPTY_RECEIVES or (
+                self.args.max_messages and self.counts["received"] >= self.args.max_messages)
+
+    def receive_batch(self):
+        """Receive, filter and replay one batch of up to 10 messages."""
+        messages = self.sqs.receive_message(
+            QueueUrl=self.queue_url, MaxNumberOfMessages=10, WaitTimeSeconds=1,
+            VisibilityTimeout=self.args.visibility_timeout,
+            AttributeNames=['All'], MessageAttributeNames=['All'],
+        ).get('Messages', [])
+        with self._lock:
+            new = [m for m in messages if m['MessageId'] not in self.seen]
+            self.empty_receives = 0 if new else self.empty_receives + 1
+            self.seen.update(m['MessageId'] for m in new)
+            self.counts["received"] += len(new)
+        replay = []
+        for message in new:
+            if self.matches(message) and not self.args.dry_run:
+                replay.append(message)
+            else:
+                with self._lock:
+                    self.counts["would replay" if self.args.dry_run and self.matches(message) else "skipped"] += 1
+                    self.held.append(message['ReceiptHandle'])
+        if not replay:
+            return
+        for _ in replay:
+            self.limiter.acquire(write=True)
+        response = self.sqs.send_message_batch(
+            QueueUrl=self.target_url, Entries=[self._entry(i, m) for i, m in enumerate(replay)]
+        )
+        sent = [replay[int(r['Id'])] for r in response.get('Successful', [])]
+        for failure in response.get('Failed', []):
+            logger.error(f"Could not replay {replay[int(failure['Id'])]['MessageId']}: {failure.get('Message')}")
+        if sent:
+            self.sqs.delete_message_batch(QueueUrl=self.queue_url, Entries=[
+                {'Id': str(i), 'ReceiptHandle': m['ReceiptHandle']} for i, m in enumerate(sent)
+            ])
+        with self._lock:
+            self.counts["replayed"] += len(sent)
+            self.counts["failed"] += len(replay) - len(sent)
+
+    def release(self):
+        for i in range(0, len(self.held), 10):
+            self.sqs.change_message_visibility_batch(QueueUrl=self.queue_url, Entries=[
+                {'Id': str(n), 'ReceiptHandle': handle, 'VisibilityTimeout': 0}
+                for n, handle in enumerate(self.held[i:i + 10])
+            ])
+
+    def run(self):
+        started = last_report = time.monotonic()
+
+        def drain():
+            while not self._done():
+                self.receive_batch()
+
+        interrupted = False
+        try:
+            with ThreadPoolExecutor(max_workers=self.args.concurrency) as pool:
+                futures = [pool.submit(drain) for _ in range(self.args.concurrency)]
+                try:
+                    while not all(f.done() for f in futures):
+                        wait(futures, timeout=1)
+                        if time.monotonic() - last_report >= self.args.progress_seconds:
+                            last_report = time.monotonic()
+                            counts = ", ".join(f"{name} {n}" for name, n in sorted(self.counts.items()))
+                            print(f"[{last_report - started:.0f}s] {counts}", file=sys.stderr)
+                except KeyboardInterrupt:
+                    # Receivers finish the batch in hand, then stop
+                    interrupted = True
+                    with self._lock:
+                        self.empty_receives = EMPTY_RECEIVES
+                for future in futures:
+                    future.result()
+        finally:
+            self.release()
+        duration = time.monotonic() - started
+        return {
+            "queue": self.queue_url,
+            "target": self.target_url,
+            **dict(sorted(self.counts.items())),
+            "duration_s": round(duration, 1),
+            "throughput_per_s": round(self.counts["replayed"] / duration, 1) if duration else None,
+            "interrupted": interrupted,
+        }
+
+
+def redrive(args, sqs=None):
+    sqs = sqs or get_client('sqs')
+    queue_url = args.queue if args.queue.startswith("https://") else sqs.get_queue_url(QueueName=args.queue)['QueueUrl']
+    if args.native:
+        # SQS moves the messages itself, each back to the queue it came from
+        arn = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['QueueArn'])['Attributes']['QueueArn']
+        task = sqs.start_message_move_task(SourceArn=arn, MaxNumberOfMessagesPerSecond=int(args.rate))
+        return {"queue": queue_url, "message_move_task": task['TaskHandle']}
+    return Redrive(sqs, queue_url, args.target or source_queue_url(queue_url), args).run()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-v", "--verbose", action="store_true")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    fill = commands.add_parser("backfill", help="send existing incidents to the DevOps Agent webhook")
+    fill.add_argument("--query", default="active=true", help="ServiceNow encoded query (default: open incidents)")
+    fill.add_argument("--rate", type=float, default=10.0, help="webhook requests per second")
+    fill.add_argument("--concurrency", type=int, default=8, help="webhook requests in flight")
+    fill.add_argument("--page-size", type=int, default=500, help="incidents per Table API page")
+    fill.add_argument("--checkpoint", default="backfill.checkpoint.json")
+    fill.add_argument("--failures", help="JSON lines of incidents that failed (default: CHECKPOINT.failed.jsonl)")
+    fill.add_argument("--resume", action="store_true", help="continue after the checkpoint of the same query")
+    fill.add_argument("--dry-run", action="store_true", help="read and build the events, send nothing")
+    fill.add_argument("--max-records", type=int, help="stop after this many incidents (resume later)")
+    fill.add_argument("--progress-seconds", type=float, default=10.0)
+    fill.add_argument("--servicenow-secret", default=os.environ.get("SERVICENOW_SECRET_ID", "SlackToSnowBotSecret"))
+    fill.add_argument("--agent-secret", default=os.environ.get("AGENT_SECRET_ID", "ServiceNowDevOpsAgentSecret"))
+
+    drive = commands.add_parser("redrive", help="replay dead-lettered messages to their source queue")
+    drive.add_argument("--queue", required=True, help="DLQ name or URL")
+    drive.add_argument("--target", help="queue URL to replay to (default: the DLQ's source queue)")
+    drive.add_argument("--rate", type=float, default=50.0, help="messages replayed per second")
+    drive.add_argument("--concurrency", type=int, default=4, help="concurrent receivers")
+    drive.add_argument("--attribute", action="append", default=[], metavar="NAME=VALUE",
+                       help="only replay messages with this message attribute value (repeatable)")
+    drive.add_argument("--body-contains", metavar="TEXT", help="only replay messages whose body contains TEXT")
+    drive.add_argument("--max-messages", type=int, help="stop after receiving this many messages")
+    drive.add_argument("--visibility-timeout", type=int, default=300,
+                       help="seconds a received message stays hidden while the redrive runs")
+    drive.add_argument("--dry-run", action="store_true", help="count what would be replayed, change nothing")
+    drive.add_argument("--native", action="store_true",
+                       help="start an SQS message move task instead (no filters, no dry run)")
+    drive.add_argument("--progress-seconds", type=float, default=10.0)
+
+    args = parser.parse_args(argv)
+    if args.command == "redrive":
+        if any("=" not in f for f in args.attribute):
+            parser.error("--attribute takes NAME=VALUE")
+        if args.native and (args.attribute or args.body_contains or args.dry_run or args.target):
+            parser.error("--native replays everything to the source queues: no filters, --target or --dry-run")
+        if args.rate <= 0 or args.concurrency < 1:
+            parser.error("--rate must be > 0 and --concurrency >= 1")
+    if args.command == "backfill":
+        args.failures = args.failures or f"{os.path.splitext(args.checkpoint)[0]}.failed.jsonl"
+        if args.rate <= 0 or args.concurrency < 1:
+            parser.error("--rate must be > 0 and --concurrency >= 1")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING, format="%(levelname)s %(message)s")
+    if args.command == "redrive":
+        report = redrive(args)
+        print(json.dumps(report, indent=2))
+        return 130 if report.get("interrupted") else 1 if report.get("failed") else 0
+    try:
+        report = backfill(args)
+    except Exception as e:
+        logger.error(f"Backfill stopped: {str(e)} (checkpoint saved, continue with --resume)")
+        return 1
+    print(json.dumps(report, indent=2))
+    if report.get("interrupted"):
+        return 130
+    return 1 if report.get("failed") else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Lambda handlers are deployed from the flat `lambda/` asset directory,
+# which is not an importable package name, so put it on the path directly.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "lambda"))
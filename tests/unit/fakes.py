@@ -0,0 +1,39 @@
+import json
+from urllib.parse import parse_qs, urlsplit
+
+
+class FakeClock:
+    """A clock for the clock= hooks that only moves when a test sets `now`."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeResponse:
+    def __init__(self, status, payload=None):
+        self.status = status
+        self.data = json.dumps(payload).encode('utf-8') if payload is not None else b''
+
+    def stream(self, amt):
+        for i in range(0, len(self.data), amt):
+            yield self.data[i:i + amt]
+
+    def release_conn(self):
+        pass
+
+
+class FakeHttp:
+    """Stands in for http_client.HttpClient: handler(method, path, query, body) -> (status, payload)."""
+
+    def __init__(self, handler):
+        self.handler = handler
+        self.requests = []
+
+    def request(self, method, url, body=None, **kwargs):
+        parts = urlsplit(url)
+        self.requests.append((method, parts.path))
+        status, payload = self.handler(method, parts.path, parse_qs(parts.query), json.loads(body) if body else None)
+        return FakeResponse(status, payload)
@@ -0,0 +1,49 @@
+import json
+
+import main
+from benchmarks.standins import AgentStandIn, SecretsManagerStub, ServiceNowStandIn
+from secret_cache import SecretCache
+
+
+def secrets(values):
+    return SecretCache("bench", client=SecretsManagerStub(values))
+
+
+def run_backfill(monkeypatch, servicenow, agent, tmp_path, *extra):
+    monkeypatch.setattr(main.servicenow_client, "BASE_URL", servicenow.url)
+    args = main.parse_args([
+        "backfill", "--checkpoint", str(tmp_path / "checkpoint.json"), "--page-size", "7", "--rate", "1000",
+        *extra,
+    ])
+    return main.backfill(
+        args,
+        secrets({"sn_instance": "bench", "sn_user": "u", "sn_pass": "p"}),
+        secrets({"webhook_url": f"{agent.url}/webhook", "secret_string": "s"}),
+    )
+
+
+def test_resume_sends_every_open_incident_once(monkeypatch, tmp_path):
+    with ServiceNowStandIn() as servicenow, AgentStandIn() as agent:
+        for n in range(30):
+            servicenow.add(f"INC{n:07d}", state="Closed" if n % 10 == 0 else "New", description=f"incident {n}")
+
+        first = run_backfill(monkeypatch, servicenow, agent, tmp_path, "--max-records", "12")
+        assert first["sent"] == 12 and not first["complete"]
+        second = run_backfill(monkeypatch, servicenow, agent, tmp_path, "--resume")
+
+        assert second["sent"] == 15 and second["complete"]
+        assert agent.outbound()["POST webhook"] == 27
+        assert len(agent.arrivals) == 27
+        checkpoint = json.loads((tmp_path / "checkpoint.json").read_text())
+        assert checkpoint["counts"] == {"sent": 27} and checkpoint["complete"]
+
+
+def test_dry_run_sends_nothing(monkeypatch, tmp_path):
+    with ServiceNowStandIn() as servicenow, AgentStandIn() as agent:
+        for n in range(5):
+            servicenow.add(f"INC{n:07d}", priority="1 - Critical")
+
+        report = run_backfill(monkeypatch, servicenow, agent, tmp_path, "--dry-run", "--query", "")
+
+        assert report["would send created (CRITICAL)"] == 5
+        assert agent.outbound() == {} and not (tmp_path / "checkpoint.json").exists()
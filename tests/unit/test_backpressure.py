@@ -0,0 +1,78 @@
+import pytest
+
+from backpressure import AIMDLimiter, CircuitBreaker, CircuitOpen, Destination, Overloaded, queue_url_from_arn
+from tests.unit.fakes import FakeClock
+
+
+class Response:
+    def __init__(self, status, headers=None):
+        self.status = status
+        self.headers = headers or {}
+
+
+def test_breaker_opens_after_threshold_and_probes_once():
+    clock = FakeClock()
+    breaker = CircuitBreaker(threshold=2, open_seconds=10, clock=clock)
+    breaker.record_failure()
+    assert breaker.allow()
+    breaker.record_failure()
+    assert not breaker.allow()
+    assert breaker.retry_in() == 10
+
+    clock.now += 10
+    assert breaker.allow()  # the half-open probe
+    assert not breaker.allow()
+    breaker.record_failure()
+    assert breaker.state == "open" and breaker.open_seconds == 20
+
+    clock.now += 20
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.open_seconds == 10
+
+
+def test_limiter_halves_on_overload_and_grows_back_additively():
+    limiter = AIMDLimiter(initial=8, minimum=1, maximum=8)
+    limiter.acquire()
+    limiter.release(overloaded=True)
+    assert limiter.limit == 4
+    for _ in range(4):
+        limiter.acquire()
+        limiter.release()
+    assert 4.9 < limiter.limit < 5.1
+
+
+def test_destination_stops_calling_while_open():
+    clock = FakeClock()
+    destination = Destination("agent", breaker=CircuitBreaker(threshold=2, clock=clock))
+    calls = []
+
+    def overloaded():
+        calls.append(1)
+        return Response(503)
+
+    for _ in range(2):
+        with pytest.raises(Overloaded):
+            destination.call(overloaded)
+    with pytest.raises(CircuitOpen) as raised:
+        destination.call(overloaded)
+
+    assert len(calls) == 2
+    assert raised.value.retry_in >= 10
+
+    # After the open period a probe goes through; a non-overload answer closes the circuit
+    clock.now += 10
+    assert destination.call(lambda: Response(404)).status == 404
+    assert destination.breaker.state == "closed"
+
+
+def test_retry_after_sets_the_minimum_postponement():
+    destination = Destination("servicenow")
+    with pytest.raises(Overloaded) as raised:
+        destination.call(lambda: Response(429, {'Retry-After': '120'}))
+    assert raised.value.retry_in >= 120 and raised.value.status == 429
+
+
+def test_queue_url_from_arn():
+    assert queue_url_from_arn("arn:aws:sqs:eu-west-1:123456789012:my-queue") == \
+        "https://sqs.eu-west-1.amazonaws.com/123456789012/my-queue"
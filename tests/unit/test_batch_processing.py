@@ -0,0 +1,77 @@
+import threading
+import time
+
+from batch_processing import process_batch
+
+
+def record(message_id, ticket):
+    return {"messageId": message_id, "ticket": ticket}
+
+
+def test_failed_records_are_reported_individually():
+    records = [record("m1", "A"), record("m2", "B"), record("m3", "C")]
+
+    def handler(r):
+        if r["messageId"] == "m2":
+            raise ValueError("boom")
+
+    assert process_batch(records, handler) == {"batchItemFailures": [{"itemIdentifier": "m2"}]}
+
+
+def test_same_key_runs_in_order_and_other_keys_run_concurrently():
+    records = [record("m1", "A"), record("m2", "B"), record("m3", "A"), record("m4", "A")]
+    seen = []
+    lock = threading.Lock()
+
+    def handler(r):
+        time.sleep(0.05)
+        with lock:
+            seen.append(r["messageId"])
+
+    started = time.monotonic()
+    result = process_batch(records, handler, key=lambda r: r["ticket"])
+
+    assert result == {"batchItemFailures": []}
+    assert [m for m in seen if m != "m2"] == ["m1", "m3", "m4"]
+    # A's three records run back to back while B runs alongside them
+    assert time.monotonic() - started < 0.19
+
+
+def test_failure_defers_later_records_for_the_same_key():
+    records = [record("m1", "A"), record("m2", "A"), record("m3", "B"), record("m4", "A")]
+    handled = []
+
+    def handler(r):
+        handled.append(r["messageId"])
+        if r["messageId"] == "m2":
+            raise ValueError("boom")
+
+    result = process_batch(records, handler, key=lambda r: r["ticket"])
+
+    assert sorted(f["itemIdentifier"] for f in result["batchItemFailures"]) == ["m2", "m4"]
+    assert "m4" not in handled
+
+
+def test_on_error_sees_the_failed_record_and_the_ones_deferred_behind_it():
+    records = [record("m1", "A"), record("m2", "A"), record("m3", "B")]
+    errors = []
+
+    def handler(r):
+        if r["messageId"] == "m1":
+            raise ValueError("boom")
+
+    process_batch(records, handler, key=lambda r: r["ticket"], on_error=lambda r, e: errors.append(r["messageId"]))
+
+    assert sorted(errors) == ["m1", "m2"]
+
+
+def test_most_urgent_groups_start_first_without_reordering_a_group():
+    records = [record("m1", "A"), record("m2", "B"), record("m3", "C"), record("m4", "B")]
+    urgency = {"m1": 3, "m2": 4, "m3": 2, "m4": 1}
+    handled = []
+
+    process_batch(records, lambda r: handled.append(r["messageId"]), max_workers=1,
+                  key=lambda r: r["ticket"], priority=lambda r: urgency[r["messageId"]])
+
+    # B holds the most urgent record (m4) but keeps its arrival order
+    assert handled == ["m2", "m4", "m3", "m1"]
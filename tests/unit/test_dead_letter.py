@@ -0,0 +1,141 @@
+import backpressure
+import dead_letter
+import main
+from backpressure import Backpressure, CircuitBreaker, Destination
+from batch_processing import process_batch
+from chat_ops_service_now_dev_ops_agent_integration.tuning_profile import MAX_RECEIVE_COUNT
+
+
+class FakeSQS:
+    """The boto3 SQS calls the dead-letter queue and the redrive make."""
+
+    def __init__(self, messages=()):
+        self.sent = []
+        self.batches = []
+        self.deleted = []
+        self.released = []
+        self.messages = list(messages)
+
+    def send_message(self, **kwargs):
+        self.sent.append(kwargs)
+        return {"MessageId": "dlq-1"}
+
+    def receive_message(self, QueueUrl, MaxNumberOfMessages, **kwargs):
+        batch, self.messages = self.messages[:MaxNumberOfMessages], self.messages[MaxNumberOfMessages:]
+        return {"Messages": batch}
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.batches.append((QueueUrl, Entries))
+        return {"Successful": [{"Id": e["Id"]} for e in Entries], "Failed": []}
+
+    def delete_message_batch(self, QueueUrl, Entries):
+        self.deleted += [e["ReceiptHandle"] for e in Entries]
+
+    def change_message_visibility_batch(self, QueueUrl, Entries):
+        self.released += [e["ReceiptHandle"] for e in Entries]
+
+
+def sqs_record(message_id, body):
+    return {
+        "messageId": message_id,
+        "body": body,
+        "eventSourceARN": "arn:aws:sqs:us-east-1:123456789012:ServiceNow-DevOps-SQSQueue",
+        "messageAttributes": {"correlation_id": {"stringValue": "c-1", "dataType": "String"}},
+        "attributes": {},
+    }
+
+
+def test_permanent_failures_are_dead_lettered_and_the_rest_of_the_group_continues(monkeypatch):
+    sqs = FakeSQS()
+    monkeypatch.setattr(dead_letter, "get_client", lambda service: sqs)
+    handled = []
+
+    def handler(record):
+        if record["messageId"] == "m3":
+            raise Backpressure("agent overloaded", "agent", 5, 503)
+        handled.append(dead_letter.load_payload(record)["n"])
+
+    records = [sqs_record("m1", "{\"n\": 1"), sqs_record("m2", "{\"n\": 2}"), sqs_record("m3", "{\"n\": 3}")]
+    result = process_batch(records, handler, key=lambda r: "ticket", dead_letter=dead_letter.DeadLetterQueue().isolate)
+
+    # The malformed m1 no longer holds back m2; an overloaded webhook is retried, not isolated
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m3"}]}
+    assert handled == [2]
+    [sent] = sqs.sent
+    assert sent["QueueUrl"] == "https://sqs.us-east-1.amazonaws.com/123456789012/ServiceNow-DevOps-SQSQueue-DLQ"
+    assert sent["MessageBody"] == "{\"n\": 1"
+    assert sent["MessageAttributes"]["correlation_id"]["StringValue"] == "c-1"
+    assert sent["MessageAttributes"]["dead_letter_error"]["StringValue"] == "PermanentError"
+
+
+def test_errors_from_handler_code_are_retried_not_dead_lettered(monkeypatch):
+    sqs = FakeSQS()
+    monkeypatch.setattr(dead_letter, "get_client", lambda service: sqs)
+
+    def handler(record):
+        payload = dead_letter.load_payload(record, required=lambda body: "n" in body)
+        return payload["missing"]  # a bug, not a bad message
+
+    records = [sqs_record("m1", "{\"n\": 1}"), sqs_record("m2", "[1]"), sqs_record("m3", "{}")]
+    result = process_batch(records, handler, dead_letter=dead_letter.DeadLetterQueue().isolate)
+
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+    assert [sent["MessageBody"] for sent in sqs.sent] == ["[1]", "{}"]
+
+
+def test_default_receive_count_outlasts_a_four_hour_outage_of_postponed_retries(monkeypatch):
+    now = [0.0]
+
+    class Clock:
+        """SQS hides the message for VisibilityTimeout seconds: let that much time pass."""
+
+        def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+            now[0] += VisibilityTimeout
+
+    class Unavailable:
+        status = 503
+        headers = {}
+
+    monkeypatch.setattr(backpressure, "get_client", lambda service: Clock())
+    monkeypatch.setattr(backpressure.random, "uniform", lambda low, high: low)
+    agent = Destination("agent", breaker=CircuitBreaker(clock=lambda: now[0]))
+    record = sqs_record("m1", "{\"n\": 1}") | {"receiptHandle": "r1"}
+
+    # Every receive of the postponed message counts towards maxReceiveCount
+    for _ in range(MAX_RECEIVE_COUNT):
+        try:
+            agent.call(Unavailable)
+        except Backpressure as e:
+            backpressure.postpone_on_backpressure(record, e)
+
+    assert agent.breaker.state == "open"
+    assert now[0] >= 4 * 3600
+
+
+def test_redrive_replays_matching_messages_without_the_dead_letter_attributes():
+    def message(n, error):
+        return {
+            "MessageId": f"m{n}", "ReceiptHandle": f"r{n}", "Body": f"{{\"n\": {n}}}", "Attributes": {},
+            "MessageAttributes": {
+                "correlation_id": {"DataType": "String", "StringValue": f"c-{n}"},
+                "dead_letter_error": {"DataType": "String", "StringValue": error},
+                "dead_letter_reason": {"DataType": "String", "StringValue": "-"},
+            },
+        }
+
+    dlq = "https://sqs.us-east-1.amazonaws.com/123456789012/ServiceNow-DevOps-SQSQueue-DLQ"
+    sqs = FakeSQS([message(n, "PermanentError" if n % 3 else "JSONDecodeError") for n in range(12)])
+    args = main.parse_args([
+        "redrive", "--queue", dlq, "--attribute", "dead_letter_error=PermanentError", "--rate", "1000",
+        "--concurrency", "1",
+    ])
+
+    report = main.redrive(args, sqs)
+
+    assert report["target"] == dlq.removesuffix("-DLQ")
+    assert (report["received"], report["replayed"], report["skipped"]) == (12, 8, 4)
+    entries = [entry for _, batch in sqs.batches for entry in batch]
+    assert {e["MessageBody"] for e in entries} == {f"{{\"n\": {n}}}" for n in range(12) if n % 3}
+    assert all(set(e["MessageAttributes"]) == {"correlation_id"} for e in entries)
+    assert sorted(sqs.deleted) == sorted(f"r{n}" for n in range(12) if n % 3)
+    assert sorted(sqs.released) == ["r0", "r3", "r6", "r9"]
@@ -0,0 +1,48 @@
+from benchmarks import e2e
+
+
+def run_small(monkeypatch, *extra):
+    # The harness points the handlers at its stand-ins through the environment
+    for name in ("SECRET_ARN", "SQS_QUEUE_URL", "SERVICENOW_BASE_URL"):
+        monkeypatch.setenv(name, "")
+    args = e2e.parse_args([
+        "--commands", "40", "--tickets", "5", "--events", "40", "--incidents", "5", "--event-rate", "0",
+        "--fault", "servicenow:latency_ms=0", "--fault", "slack:latency_ms=0", "--fault", "agent:latency_ms=0",
+        *extra,
+    ])
+    return e2e.run(args)
+
+
+def test_every_command_and_event_reaches_its_stand_in(monkeypatch):
+    results = run_small(monkeypatch)
+
+    slack = results["slack"]
+    assert slack["results"]["inline"] + slack["results"]["queued"] == 40
+    assert slack["results"].get("unanswered", 0) == 0
+    assert slack["stages"]["end to end"]["count"] == 40
+    assert slack["outbound"]["slack"]["POST response_url"] == slack["results"]["queued"]
+
+    events = results["events"]
+    assert events["outbound"]["sqs send_message"] == 40
+    assert events["stages"]["end to end"]["count"] + events["results"].get("not_forwarded", 0) <= 40
+    assert events["results"]["failed_records"] == 0
+
+
+def test_injected_errors_are_redelivered(monkeypatch):
+    results = run_small(
+        monkeypatch, "--scenario", "events", "--fault", "agent:error_rate=0.3", "--visibility-timeout-ms", "0"
+    )
+
+    events = results["events"]
+    assert events["outbound"]["agent"]["injected 503"] > 0
+    assert events["results"]["failed_records"] == events["results"]["redelivered"] + events["results"]["dead_lettered"]
+
+
+def test_bulk_commands_get_one_reply_each(monkeypatch):
+    results = run_small(monkeypatch, "--scenario", "slack", "--bulk-ratio", "1", "--bulk-size", "4")
+
+    slack = results["slack"]
+    assert slack["results"]["queued"] == 40 and slack["results"].get("unanswered", 0) == 0
+    assert slack["outbound"]["slack"]["POST response_url"] == 40
+    # Looked up and updated per SQS batch, not per ticket
+    assert slack["outbound"]["servicenow"]["GET incident"] < 40
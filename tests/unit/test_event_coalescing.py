@@ -0,0 +1,64 @@
+import json
+
+from event_coalescing import FingerprintStore, coalesce_records
+from state_store import MemoryStore
+
+
+def record(message_id, sys_id, event_type, sent, **fields):
+    incident = {"number": "INC1", "sys_id": sys_id, "short_description": "db down", "priority": "1"}
+    incident.update(fields)
+    return {
+        "messageId": message_id,
+        "body": json.dumps({"event_type": event_type, "incident": incident}),
+        "attributes": {"SentTimestamp": str(sent)},
+    }
+
+
+def ids(records):
+    return [r["messageId"] for r in records]
+
+
+def test_keeps_latest_event_per_incident_and_action():
+    records = [
+        record("m3", "a", "incident_updated", 3, short_description="db down hard"),
+        record("m1", "a", "incident_created", 1),
+        record("m2", "b", "incident_created", 2),
+        record("m4", "a", "incident_resolved", 4),
+        record("m5", "b", "incident_updated", 5),
+    ]
+
+    kept, superseded = coalesce_records(records)
+
+    assert ids(kept) == ["m3", "m4", "m5"]
+    assert sorted(ids(superseded)) == ["m1", "m2"]
+
+
+def test_fifo_sequence_numbers_order_sends_within_the_same_millisecond():
+    created = record("m1", "a", "incident_created", 1)
+    resolved = record("m2", "a", "incident_resolved", 1)
+    created["attributes"]["SequenceNumber"] = "18"
+    resolved["attributes"]["SequenceNumber"] = "19"
+
+    kept, _ = coalesce_records([resolved, created])
+
+    assert ids(kept) == ["m1", "m2"]
+
+
+def test_unparseable_records_are_kept_for_the_handler_to_fail():
+    bad = {"messageId": "bad", "body": "{not json"}
+    kept, superseded = coalesce_records([bad, record("m1", "a", "incident_created", 1)])
+
+    assert sorted(ids(kept)) == ["bad", "m1"]
+    assert superseded == []
+
+
+def test_fingerprint_ignores_fields_the_agent_does_not_see():
+    store = FingerprintStore(MemoryStore())
+    created = json.loads(record("m1", "a", "incident_created", 1)["body"])
+    store.remember(created)
+
+    work_note_edit = json.loads(record("m2", "a", "incident_updated", 2, work_notes="checked logs")["body"])
+    reprioritised = json.loads(record("m3", "a", "incident_updated", 3, priority="2")["body"])
+
+    assert store.is_unchanged(work_note_edit)
+    assert not store.is_unchanged(reprioritised)
@@ -0,0 +1,64 @@
+import pytest
+
+import http_client
+from benchmarks.standins import StandIn
+from http_client import HttpClient
+
+
+class Flaky(StandIn):
+    """Answers `failures` requests with `status`, then 200."""
+
+    def __init__(self, failures, status):
+        super().__init__()
+        self.failures = failures
+        self.status = status
+
+    def handle(self, method, path, query, body, headers):
+        if self.failures:
+            self.failures -= 1
+            return self.status, {}
+        return 200, {"ok": True}
+
+    def _send(self, request, status, payload, headers=None):
+        headers = dict(headers or {}, **({'Retry-After': '0'} if status == 429 else {}))
+        super()._send(request, status, payload, headers)
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(http_client, "BACKOFF_MAX_SECONDS", 0)
+
+
+def test_get_is_retried_on_5xx_and_reuses_the_connection():
+    with Flaky(failures=2, status=503) as server:
+        client = HttpClient()
+        response = client.request('GET', f"{server.url}/x")
+
+    assert response.status == 200
+    assert client.stats() == {"requests": 1, "retries": 2, "errors": 0, "new_connections": 1}
+
+
+def test_post_is_retried_on_429_but_on_5xx_only_when_idempotent():
+    client = HttpClient()
+    with Flaky(failures=1, status=429) as server:
+        assert client.request('POST', f"{server.url}/x", body="{}").status == 200
+    with Flaky(failures=1, status=503) as server:
+        assert client.request('POST', f"{server.url}/x", body="{}").status == 503
+    with Flaky(failures=1, status=503) as server:
+        assert client.request('PATCH', f"{server.url}/x", body="{}", idempotent=True).status == 200
+
+    assert client.stats()["retries"] == 2
+
+
+def test_prewarmed_connections_are_reused_until_closed():
+    with Flaky(failures=0, status=200) as server:
+        client = HttpClient(maxsize=2)
+        client.prewarm([f"{server.url}/"], connections=2)
+        assert client.stats()["new_connections"] == 2
+        client.request('GET', f"{server.url}/x")
+        assert client.stats()["new_connections"] == 2
+
+        client.close()
+        client.request('GET', f"{server.url}/x")
+        assert client.stats()["new_connections"] == 3
+    assert server.counts["HEAD prewarm"] == 2
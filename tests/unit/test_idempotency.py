@@ -0,0 +1,62 @@
+import json
+
+from agent_events import event_content_key
+from idempotency import IdempotencyStore
+from state_store import MemoryStore, TieredStore
+
+
+def record(message_id, body):
+    return {"messageId": message_id, "body": body}
+
+
+def store(**kwargs):
+    return IdempotencyStore("test", store=TieredStore(MemoryStore()), ttl=60, **kwargs)
+
+
+def event(event_type, state, **version):
+    return json.dumps({"event_type": event_type, "incident": {"number": "INC1", "state": state, **version}})
+
+
+def test_completed_records_are_skipped_on_redelivery_and_resend():
+    idempotency = store()
+    first = record("m1", '{"ticket_number": "INC0000001"}')
+    pending, duplicates = idempotency.split([first, record("m2", '{"ticket_number": "INC0000002"}')])
+    assert len(pending) == 2 and not duplicates
+
+    idempotency.complete(first)
+    redelivered = record("m1", first["body"])
+    resent = record("m3", first["body"])
+    pending, duplicates = idempotency.split([redelivered, resent, record("m2", '{"ticket_number": "INC0000002"}')])
+    assert [r["messageId"] for r in pending] == ["m2"]
+    assert [r["messageId"] for r in duplicates] == ["m1", "m3"]
+
+
+def test_identical_bodies_in_one_batch_are_processed_once():
+    pending, duplicates = store().split([record("m1", "{}"), record("m2", "{}"), record("m3", "[]")])
+    assert [r["messageId"] for r in pending] == ["m1", "m3"]
+    assert [r["messageId"] for r in duplicates] == ["m2"]
+
+
+def test_claim_admits_the_first_caller_until_released():
+    idempotency = store()
+    assert idempotency.claim("trigger-1")
+    assert not idempotency.claim("trigger-1")
+    idempotency.release("trigger-1")
+    assert idempotency.claim("trigger-1")
+
+
+def test_a_repeated_transition_is_not_a_duplicate_of_the_earlier_one():
+    idempotency = store(content_key=event_content_key)
+    # Resolve -> reopen -> resolve again: the second resolve has the same body as the first
+    transitions = [event("incident_resolved", "6"), event("incident_updated", "2"), event("incident_resolved", "6")]
+    for n, body in enumerate(transitions):
+        pending, duplicates = idempotency.split([record(f"m{n}", body)])
+        assert pending and not duplicates
+        idempotency.complete(pending[0])
+    assert idempotency.split([record("m2", transitions[2])]) == ([], [record("m2", transitions[2])])
+
+    # With sys_mod_count from the Business Rule, a second send of the same update is still caught
+    versioned = event("incident_resolved", "6", sys_mod_count="7")
+    idempotency.complete(record("m3", versioned))
+    assert idempotency.split([record("m4", versioned)])[1] == [record("m4", versioned)]
+    assert idempotency.split([record("m5", event("incident_resolved", "6", sys_mod_count="9"))])[0]
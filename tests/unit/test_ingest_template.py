@@ -0,0 +1,48 @@
+import pytest
+
+from batch_processing import message_attribute
+from chat_ops_service_now_dev_ops_agent_integration.ingest_template import EdgeFilter, request_template, route
+
+
+def event(event_type="incident_updated", state="2", priority="3 - Moderate"):
+    return {"event_type": event_type, "incident": {"sys_id": "abc", "state": state, "priority": priority}}
+
+
+def test_edge_filter_drops_configured_types_states_and_priorities():
+    edge_filter = EdgeFilter.from_context(
+        '{"drop_event_types": ["incident_viewed"], "drop_states": ["8"], "drop_priorities": ["5"]}'
+    )
+    assert edge_filter.drops(event(event_type="incident_viewed"))
+    assert edge_filter.drops(event(state="8"))
+    assert edge_filter.drops(event(priority="5 - Planning"))
+    assert not edge_filter.drops(event(priority="50"))
+    assert not edge_filter.drops(event())
+    assert not EdgeFilter.from_context(None)
+
+
+def test_template_drops_only_when_filtering_and_routes_high_priorities():
+    plain = request_template(["1"], "High")
+    assert "GetQueueAttributes" not in plain
+    assert '$context.requestOverride.path.queue = "High"' in plain
+    assert "MessageAttribute.${n}.Name=sys_id" in plain
+    assert "MessageAttribute.1.Value.StringValue=$context.requestId" in plain
+    assert "MessageAttribute.2.Value.StringValue=$context.requestTimeEpoch" in plain
+
+    filtered = request_template(["1"], "High", EdgeFilter(drop_priorities=["4", "5"]))
+    assert "#if($priority.matches('^(4|5)(\\D.*)?$'))" in filtered
+    assert filtered.index("GetQueueAttributes") < filtered.index("Action=SendMessage")
+
+    assert route(event(priority="1 - Critical"), ["1"]) == "high"
+    assert route(event(priority="10"), ["1"]) == "normal"
+
+
+def test_values_that_could_break_the_template_are_rejected():
+    with pytest.raises(ValueError):
+        EdgeFilter(drop_states=['8") #set($x = "'])
+
+
+def test_message_attribute_reads_the_lambda_event_shape():
+    record = {"messageAttributes": {"priority": {"stringValue": "1 - Critical", "dataType": "String"}}}
+    assert message_attribute(record, "priority") == "1 - Critical"
+    assert message_attribute(record, "sys_id") is None
+    assert message_attribute({}, "priority") is None
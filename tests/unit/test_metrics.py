@@ -0,0 +1,57 @@
+import json
+
+import pytest
+
+import metrics
+from metrics import Metrics
+
+
+@pytest.fixture
+def lines(monkeypatch):
+    written = []
+    monkeypatch.setattr(metrics, "write_line", lambda line: written.append(json.loads(line)))
+    return written
+
+
+def test_same_stage_and_outcome_share_one_line(lines):
+    m = Metrics("worker", enabled=True)
+    m.start(batch_size=3)
+    for _ in range(3):
+        with m.stage("slack_response") as stage:
+            stage.status = 200
+    with m.stage("servicenow_query", action="/ops-status"):
+        pass
+    m.flush()
+
+    assert len(lines) == 2
+    slack = next(line for line in lines if line["Stage"] == "slack_response")
+    assert len(slack["Duration"]) == 3
+    assert (slack["Status"], slack["Outcome"], slack["BatchSize"]) == ("200", "ok", "3")
+    assert slack["_aws"]["CloudWatchMetrics"][0]["Metrics"] == [{"Name": "Duration", "Unit": "Milliseconds"}]
+
+
+def test_exception_marks_error_with_status(lines):
+    class Rejected(Exception):
+        status = 503
+
+    m = Metrics("middleware", enabled=True)
+    m.start()
+    with pytest.raises(Rejected):
+        with m.stage("agent_webhook", action="created"):
+            raise Rejected()
+    m.flush()
+
+    assert [(line["Outcome"], line["Status"]) for line in lines] == [("error", "503")]
+
+
+def test_unsampled_invocations_only_emit_errors(lines):
+    m = Metrics("receiver", sample_rate=0.0, enabled=True)
+    m.start()
+    with m.stage("verify"):
+        pass
+    with pytest.raises(ValueError):
+        with m.stage("enqueue"):
+            raise ValueError()
+    m.flush()
+
+    assert [line["Stage"] for line in lines] == ["enqueue"]
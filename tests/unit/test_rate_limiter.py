@@ -0,0 +1,117 @@
+import threading
+
+import pytest
+
+from rate_limiter import DynamoBucketBackend, MemoryBucketBackend, RateLimited, RateLimiter
+from tests.unit.fakes import FakeClock
+
+
+class FakeDynamo:
+    """get_item/put_item with the conditions DynamoBucketBackend uses; `interleave` simulates a racing writer."""
+
+    class exceptions:
+        class ConditionalCheckFailedException(Exception):
+            pass
+
+    def __init__(self):
+        self.items = {}
+        self.interleave = None
+        self.puts = 0
+
+    def get_item(self, TableName, Key, ConsistentRead):
+        item = self.items.get(Key['pk']['S'])
+        if self.interleave:
+            self.interleave, race = None, self.interleave
+            race(self)
+        return {'Item': dict(item)} if item else {}
+
+    def put_item(self, TableName, Item, ConditionExpression, ExpressionAttributeValues=None):
+        current = self.items.get(Item['pk']['S'])
+        if ConditionExpression == 'attribute_not_exists(pk)':
+            ok = current is None
+        else:
+            ok = current is not None and current['updated_at'] == ExpressionAttributeValues[':previous']
+        if not ok:
+            raise self.exceptions.ConditionalCheckFailedException()
+        self.puts += 1
+        self.items[Item['pk']['S']] = Item
+
+
+def test_containers_share_one_bucket():
+    clock = FakeClock()
+    shared = MemoryBucketBackend(clock=clock)
+    containers = [RateLimiter("dev1#bot", rate=10, capacity=4, backend=shared, lease_size=1,
+                              read_reserve=0, max_wait=0, clock=clock) for _ in range(2)]
+
+    for limiter in containers * 2:
+        limiter.acquire()
+    with pytest.raises(RateLimited) as raised:
+        containers[1].acquire()
+    assert raised.value.status == 429 and raised.value.retry_in >= 1
+
+    clock.now += 0.1  # one token refilled
+    containers[1].acquire()
+
+
+def test_writes_cannot_spend_the_read_reserve():
+    clock = FakeClock()
+    limiter = RateLimiter("dev1#bot", rate=10, capacity=4, read_reserve=0.5, max_wait=0, clock=clock)
+    limiter.backend._clock = clock
+
+    limiter.acquire(write=True)
+    limiter.acquire(write=True)
+    with pytest.raises(RateLimited):
+        limiter.acquire(write=True)
+    limiter.acquire()
+    limiter.acquire()
+    with pytest.raises(RateLimited):
+        limiter.acquire()
+
+
+def test_waiting_read_goes_before_waiting_write():
+    limiter = RateLimiter("dev1#bot", rate=20, capacity=1, read_reserve=0, max_wait=2)
+    limiter.acquire()  # empty: the next token comes in 50ms
+    order = []
+
+    def call(write):
+        limiter.acquire(write=write)
+        order.append("write" if write else "read")
+
+    writer = threading.Thread(target=call, args=(True,))
+    reader = threading.Thread(target=call, args=(False,))
+    reader.start()
+    writer.start()
+    reader.join()
+    writer.join()
+    assert order == ["read", "write"]
+
+
+def test_dynamo_backend_leases_tokens_and_retries_lost_races():
+    clock = FakeClock()
+    dynamo = FakeDynamo()
+    backend = DynamoBucketBackend("state", client=dynamo, clock=clock)
+
+    assert backend.take("dev1#bot", 5, rate=10, capacity=8) == (5, 0.0)
+    assert float(dynamo.items["rate#dev1#bot"]['tokens']['N']) == 3
+
+    # Another container takes the last tokens between our read and write
+    def racer(client):
+        item = client.items["rate#dev1#bot"]
+        client.items["rate#dev1#bot"] = dict(item, tokens={'N': '0'}, updated_at={'N': '999.5'})
+
+    dynamo.interleave = racer
+    granted, wait = backend.take("dev1#bot", 5, rate=10, capacity=8)
+    assert dynamo.puts == 2  # the first write lost the race, the retry saw the real bucket
+    assert granted == 5 and wait == 0.0  # 0 + 0.5s * 10/s = 5 tokens after refill
+
+
+def test_backend_errors_fall_back_to_a_local_bucket():
+    class Broken:
+        def take(self, *args):
+            raise RuntimeError("throttled")
+
+    limiter = RateLimiter("dev1#bot", rate=10, capacity=2, backend=Broken(), read_reserve=0, max_wait=0)
+    limiter.acquire()
+    limiter.acquire()
+    with pytest.raises(RateLimited):
+        limiter.acquire()
@@ -0,0 +1,27 @@
+import time
+
+import rate_limiter
+import receiver_middleware_lambda as receiver
+from rate_limiter import RateLimiter
+from single_flight import SingleFlight
+from state_store import MemoryStore
+from tests.unit.fakes import FakeHttp
+from ticket_cache import TicketCache
+
+
+def test_status_fast_path_falls_back_to_the_worker_instead_of_waiting_for_a_token(monkeypatch):
+    servicenow = FakeHttp(lambda method, path, query, body: (200, {"result": []}))
+    monkeypatch.setattr(receiver, "http", servicenow)
+    monkeypatch.setattr(receiver, "TICKET_CACHE", TicketCache(MemoryStore()))
+    monkeypatch.setattr(receiver, "FLIGHTS", SingleFlight(MemoryStore()))
+    limiter = RateLimiter("dev#u", rate=0.1, capacity=1, max_wait=5)
+    limiter.acquire()
+    monkeypatch.setitem(rate_limiter._LIMITERS, "dev#u", limiter)
+    secrets = {"sn_instance": "dev", "sn_user": "u", "sn_pass": "p"}
+
+    started = time.monotonic()
+    assert receiver.status_fast_path("INC1", secrets, started) is None
+
+    assert time.monotonic() - started < 0.5
+    assert servicenow.requests == []
+    assert receiver.FLIGHTS.holder("/ops-status", "INC1") is None
@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+import secret_cache
+from secret_cache import CredentialsRejected, SecretCache
+from tests.unit.fakes import FakeClock
+
+
+class FakeSecretsClient:
+    def __init__(self, *values):
+        self.values = list(values)
+        self.calls = 0
+
+    def get_secret_value(self, SecretId):
+        value = self.values[min(self.calls, len(self.values) - 1)]
+        self.calls += 1
+        return {"SecretString": json.dumps(value)}
+
+
+def test_serves_from_memory_until_ttl():
+    client, clock = FakeSecretsClient({"k": "v1"}, {"k": "v2"}), FakeClock()
+    cache = SecretCache("arn", ttl=300, refresh_ahead=0, client=client, clock=clock)
+
+    assert cache.get() == {"k": "v1"}
+    clock.now += 100
+    assert cache.get() == {"k": "v1"}
+    assert client.calls == 1
+
+    clock.now += 250
+    assert cache.get() == {"k": "v2"}
+    assert cache.stats() == {"hits": 1, "misses": 2, "refreshes": 0, "forced_refreshes": 0}
+
+
+def test_forced_refresh_is_throttled(monkeypatch):
+    monkeypatch.setattr(secret_cache, "MIN_FORCED_REFRESH_INTERVAL_SECONDS", 30)
+    client, clock = FakeSecretsClient({"k": "v1"}, {"k": "v2"}), FakeClock()
+    cache = SecretCache("arn", ttl=300, refresh_ahead=0, client=client, clock=clock)
+
+    cache.get()
+    assert cache.get(force_refresh=True) == {"k": "v1"}
+    clock.now += 31
+    assert cache.get(force_refresh=True) == {"k": "v2"}
+    assert cache.forced_refreshes == 1
+
+
+def test_call_with_refresh_retries_once_on_rejected_credentials(monkeypatch):
+    monkeypatch.setattr(secret_cache, "MIN_FORCED_REFRESH_INTERVAL_SECONDS", 0)
+    client = FakeSecretsClient({"pass": "old"}, {"pass": "new"})
+    cache = SecretCache("arn", client=client, clock=FakeClock())
+
+    def call(secrets):
+        if secrets["pass"] != "new":
+            raise CredentialsRejected("401")
+        return "ok"
+
+    assert cache.call_with_refresh(call) == "ok"
+    assert client.calls == 2
+
+
+def test_call_with_refresh_gives_up_after_one_retry(monkeypatch):
+    monkeypatch.setattr(secret_cache, "MIN_FORCED_REFRESH_INTERVAL_SECONDS", 0)
+    cache = SecretCache("arn", client=FakeSecretsClient({"pass": "old"}), clock=FakeClock())
+
+    def always_rejected(secrets):
+        raise CredentialsRejected("401")
+
+    with pytest.raises(CredentialsRejected):
+        cache.call_with_refresh(always_rejected)
@@ -0,0 +1,88 @@
+import base64
+import json
+
+import pytest
+
+import servicenow_client
+from benchmarks.standins import ServiceNowStandIn
+from http_client import HttpClient
+from secret_cache import CredentialsRejected
+from servicenow_client import INCIDENT_FIELDS, ServiceNowClient, ServiceNowError, iter_results
+from tests.unit.fakes import FakeHttp
+
+
+def served(request_id, status, record=None):
+    body = base64.b64encode(json.dumps({"result": record}).encode('utf-8')).decode('ascii') if record else ""
+    return {"id": request_id, "status_code": status, "body": body}
+
+
+def test_records_are_parsed_across_arbitrary_chunk_boundaries():
+    records = [{"number": f"INC{n:07d}", "short_description": "Écran bleu, \"quoted\" ]"} for n in range(5)]
+    body = json.dumps({"result": records}, ensure_ascii=False).encode('utf-8')
+    for size in (1, 3, 7, 64, len(body)):
+        chunks = [body[i:i + size] for i in range(0, len(body), size)]
+        assert list(iter_results(chunks)) == records
+
+    with pytest.raises(ServiceNowError):
+        list(iter_results([body[:-10]]))
+
+
+def test_queries_are_projected_and_paginated(monkeypatch):
+    monkeypatch.setattr(servicenow_client, "PAGE_SIZE", 2)
+    with ServiceNowStandIn() as servicenow:
+        monkeypatch.setattr(servicenow_client, "BASE_URL", servicenow.url)
+        numbers = [servicenow.add(f"INC{n:07d}", short_description="Bench")["number"] for n in range(1, 6)]
+        client = ServiceNowClient("bench", "user", "pass", HttpClient())
+
+        incidents = client.query_incidents(numbers + ["INC9999999"])
+        assert sorted(incidents) == numbers
+        assert all(set(record) == set(INCIDENT_FIELDS) for record in incidents.values())
+        assert servicenow.counts["GET incident"] == 3
+
+        sys_id = incidents[numbers[0]]["sys_id"]
+        status, record = client.update_incident(sys_id, {"state": "7"})
+        assert status == 200
+        assert record == {"number": numbers[0], "sys_id": sys_id, "state": "Closed", "short_description": "Bench"}
+
+
+def test_batch_update_maps_each_serviced_request_to_its_sys_id(monkeypatch):
+    monkeypatch.setattr(servicenow_client, "_BATCH_UNSUPPORTED", set())
+
+    def handler(method, path, query, body):
+        ids = [r["id"] for r in body["rest_requests"]]
+        # Sub-requests come back out of order, one of them not at all
+        return 200, {"serviced_requests": [served(ids[1], 404), served(ids[0], 200, {"state": "Closed"})]}
+
+    http = FakeHttp(handler)
+    results = ServiceNowClient("dev", "u", "p", http).update_incidents({"a": {"state": "7"}, "b": {}, "c": {}})
+
+    assert results == {"a": (200, {"state": "Closed"}), "b": (404, None), "c": (None, None)}
+    assert http.requests == [("POST", "/api/now/v1/batch")]
+
+
+def test_instances_without_the_batch_api_fall_back_to_single_patches(monkeypatch):
+    monkeypatch.setattr(servicenow_client, "_BATCH_UNSUPPORTED", set())
+
+    def handler(method, path, query, body):
+        if method == "POST":
+            return 400, {"error": {"message": "Requested URI does not represent any resource"}}
+        return 200, {"result": {"sys_id": path.rsplit("/", 1)[1], "state": "Closed"}}
+
+    http = FakeHttp(handler)
+    client = ServiceNowClient("dev", "u", "p", http)
+    assert client.update_incidents({"a": {"state": "7"}, "b": {"state": "7"}}) == {
+        "a": (200, {"sys_id": "a", "state": "Closed"}), "b": (200, {"sys_id": "b", "state": "Closed"}),
+    }
+    # Later batches skip the Batch API on this instance
+    client.update_incidents({"c": {"state": "7"}, "d": {"state": "7"}})
+    assert [method for method, _ in http.requests] == ["POST", "PATCH", "PATCH", "PATCH", "PATCH"]
+
+
+def test_rejected_credentials_raise_for_batch_and_single_updates(monkeypatch):
+    monkeypatch.setattr(servicenow_client, "_BATCH_UNSUPPORTED", set())
+    client = ServiceNowClient("dev", "u", "p", FakeHttp(lambda *request: (401, {})))
+
+    with pytest.raises(CredentialsRejected):
+        client.update_incidents({"a": {"state": "7"}, "b": {"state": "7"}})
+    with pytest.raises(CredentialsRejected):
+        client.update_incidents({"a": {"state": "7"}})
@@ -0,0 +1,33 @@
+from single_flight import SingleFlight
+from state_store import MemoryStore
+from tests.unit.fakes import FakeClock
+
+
+def test_only_first_caller_leads_until_lease_expires():
+    clock = FakeClock()
+    flights = SingleFlight(MemoryStore(clock=clock))
+
+    assert flights.acquire("/ops-resolve", "INC1", "UA") is None
+    assert flights.acquire("/ops-resolve", "INC1", "UB") == {"owner": "UA", "done": False}
+    assert flights.acquire("/ops-resolve", "INC2", "UB") is None
+
+    clock.now += 60
+    assert flights.acquire("/ops-resolve", "INC1", "UB") is None
+
+
+def test_completed_lease_reports_who_did_the_work():
+    flights = SingleFlight(MemoryStore())
+    flights.acquire("/ops-resolve", "INC1", "UA")
+    flights.complete("/ops-resolve", "INC1", "UA")
+
+    assert flights.acquire("/ops-resolve", "INC1", "UB") == {"owner": "UA", "done": True}
+    assert flights.wait_until_done("/ops-resolve", "INC1", timeout=0) == {"owner": "UA", "done": True}
+
+
+def test_released_lease_lets_a_follower_take_over():
+    flights = SingleFlight(MemoryStore())
+    flights.acquire("/ops-status", "INC1", "worker")
+    flights.release("/ops-status", "INC1")
+
+    assert flights.wait_until_done("/ops-status", "INC1", timeout=0) is None
+    assert flights.acquire("/ops-status", "INC1", "receiver") is None
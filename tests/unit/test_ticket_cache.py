@@ -0,0 +1,76 @@
+import time
+
+import receiver_middleware_lambda as receiver
+from state_store import MemoryStore, TieredStore
+from tests.unit.fakes import FakeClock
+from ticket_cache import STATE_TTL_SECONDS, TicketCache
+
+
+class BrokenStore:
+    def get(self, key):
+        raise ConnectionError("dynamodb unreachable")
+
+    get_many = put = delete = get
+
+
+INCIDENT = {"number": "INC1", "sys_id": "s1", "state": "New", "short_description": "Disk full", "priority": "1"}
+
+
+def test_state_expires_before_the_sys_id_and_invalidate_keeps_the_sys_id():
+    clock = FakeClock()
+    cache = TicketCache(MemoryStore(clock=clock))
+    cache.put(INCIDENT)
+
+    incidents, sys_ids = cache.get_many(["INC1", "INC2"])
+    assert incidents == {"INC1": {"number": "INC1", "sys_id": "s1", "state": "New", "short_description": "Disk full"}}
+    assert sys_ids == {"INC1": "s1"}
+
+    clock.now += STATE_TTL_SECONDS
+    assert cache.get_many(["INC1"]) == ({}, {"INC1": "s1"})
+
+    cache.put(INCIDENT)
+    cache.invalidate("INC1")
+    assert cache.get_many(["INC1"]) == ({}, {"INC1": "s1"})
+    cache.invalidate("INC1", forget_sys_id=True)
+    assert cache.get_many(["INC1"]) == ({}, {})
+
+
+def test_tiered_store_reads_through_and_keeps_local_copies_briefly():
+    clock = FakeClock()
+    remote = MemoryStore(clock=clock)
+    store = TieredStore(MemoryStore(clock=clock), remote, local_ttl=5)
+    remote.put("ticket#INC1", "Closed", 30)
+
+    assert store.get_many(["ticket#INC1", "ticket#INC2"]) == {"ticket#INC1": "Closed"}
+    remote.put("ticket#INC1", "New", 30)
+    assert store.get("ticket#INC1") == "Closed"
+    clock.now += 5
+    assert store.get("ticket#INC1") == "New"
+
+    store.put("ticket#INC2", "New", 30)
+    assert remote.get("ticket#INC2") == "New"
+
+
+def test_tiered_store_treats_shared_tier_errors_as_misses():
+    store = TieredStore(MemoryStore(), BrokenStore())
+    store.put("ticket#INC1", "New")
+
+    assert store.get("ticket#INC1") == "New"
+    assert store.get("ticket#INC2") is None
+    assert store.get_many(["ticket#INC1", "ticket#INC2"]) == {"ticket#INC1": "New"}
+    store.delete("ticket#INC1")
+    assert store.get("ticket#INC1") is None
+
+
+def test_receiver_status_sees_the_workers_resolve_at_once(monkeypatch):
+    shared = MemoryStore()
+    receiver_cache = TicketCache(TieredStore(MemoryStore(), shared, local_ttl=0))
+    worker_cache = TicketCache(TieredStore(MemoryStore(), shared, local_ttl=STATE_TTL_SECONDS))
+    monkeypatch.setattr(receiver, "TICKET_CACHE", receiver_cache)
+
+    receiver_cache.put({**INCIDENT, "state": "In Progress"})
+    assert "In Progress" in receiver.status_fast_path("INC1", {}, time.monotonic())
+    worker_cache.put({**INCIDENT, "state": "Closed"})
+
+    assert receiver_cache.get("INC1")["state"] == "Closed"
+    assert "Closed" in receiver.status_fast_path("INC1", {}, time.monotonic())
@@ -0,0 +1,15 @@
+import pytest
+
+from ticket_numbers import parse_ticket_numbers
+
+
+def test_lists_and_ranges_expand_in_order_without_repeats():
+    assert parse_ticket_numbers("inc0010001, INC0010004-INC0010006 INC0010009-10,INC0010001") == [
+        "INC0010001", "INC0010004", "INC0010005", "INC0010006", "INC0010009", "INC0010010",
+    ]
+
+
+@pytest.mark.parametrize("text", ["", "hello", "INC0010005-INC0010001", "INC0010001-INC0010100"])
+def test_invalid_or_oversized_input_is_rejected(text):
+    with pytest.raises(ValueError):
+        parse_ticket_numbers(text, limit=50)
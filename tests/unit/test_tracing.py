@@ -0,0 +1,44 @@
+import json
+
+import metrics
+import tracing
+
+
+def record(**attributes):
+    return {
+        "messageId": "m-1",
+        "attributes": {"ApproximateReceiveCount": "2", **attributes},
+        "messageAttributes": {
+            "correlation_id": {"stringValue": "req-1", "dataType": "String"},
+            "received_at": {"stringValue": "1000", "dataType": "Number"},
+        },
+    }
+
+
+def test_trace_record_splits_the_time_into_hops(monkeypatch):
+    lines = []
+    monkeypatch.setattr(metrics, "write_line", lines.append)
+    clock = iter([0, 5000, 5100, 5400])
+    monkeypatch.setattr(tracing, "now_ms", lambda: next(clock))
+    tracer = tracing.Tracer("worker", enabled=True, export="")
+    tracer.start()
+    with tracer.request(record(SentTimestamp="1200", ApproximateFirstReceiveTimestamp="4000"), action="/ops-resolve"):
+        pass
+
+    trace = json.loads(lines[0])
+    assert trace["trace"] == "worker" and trace["correlation_id"] == "req-1" and trace["receive_count"] == 2
+    assert trace["hops"] == {"ingress": 200, "queue": 2800, "delivery": 1000, "batch": 100, "process": 300}
+    assert trace["total_ms"] == 4400 and trace["outcome"] == "ok" and trace["action"] == "/ops-resolve"
+
+
+def test_xray_export_uses_the_record_trace_header(monkeypatch):
+    sent = []
+    monkeypatch.setattr(tracing, "_send_to_daemon", sent.extend)
+    header = "Root=1-5759e988-bd862e3fe1be46a994272793;Parent=53995c3f42cd8ad8;Sampled=1"
+    tracing.export_xray(header, [("queue", 1000, 1500)], {"correlation_id": "req-1"})
+    assert sent[0]["trace_id"] == "1-5759e988-bd862e3fe1be46a994272793"
+    assert sent[0]["parent_id"] == "53995c3f42cd8ad8" and sent[0]["type"] == "subsegment"
+    assert (sent[0]["start_time"], sent[0]["end_time"]) == (1.0, 1.5)
+
+    tracing.export_xray(header.replace("Sampled=1", "Sampled=0"), [("queue", 1000, 1500)], {})
+    assert len(sent) == 1
@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from benchmarks import tune
+from chat_ops_service_now_dev_ops_agent_integration.tuning_profile import DEFAULTS, load_profile
+
+
+def test_no_profile_keeps_the_shipped_settings():
+    assert load_profile(None) == DEFAULTS
+
+
+def test_profile_overrides_defaults_and_is_validated(tmp_path):
+    path = tmp_path / "prod.json"
+    worker = {"memory_size": 512, "batch_size": 25, "max_batching_window_s": 1}
+    path.write_text(json.dumps({"functions": {"worker": worker}}))
+    profile = load_profile(str(path))
+    assert profile["worker"] == dict(worker, max_concurrency=None)
+    assert profile["middleware"] == DEFAULTS["middleware"]
+
+    path.write_text(json.dumps({"functions": {"worker": {"batch_size": 25}}}))
+    with pytest.raises(ValueError, match="needs max_batching_window_s"):
+        load_profile(str(path))
+    with pytest.raises(ValueError, match="not found"):
+        load_profile(str(tmp_path / "missing.json"))
+
+
+def test_cost_model_trades_memory_price_for_cpu_time():
+    result = {
+        "requests": 100,
+        "stages": {"end to end": {"p95": 500.0}},
+        "outbound": {"sqs send_message": 100},
+        # 10 invocations of 200ms, 50ms of it CPU
+        "invocations": {"worker": {"count": 10, "wall_ms": 2000.0, "cpu_ms": 500.0}},
+    }
+    small, large = tune.estimate(result, "worker", 128), tune.estimate(result, "worker", 1769)
+    assert small[0] > large[0] == 500  # measured CPU time is full-vCPU time
+    assert small[1] < large[1]
+
+    candidates = [
+        {"memory_size": 128, "p95_ms": small[0], "cost_per_million_usd": small[1]},
+        {"memory_size": 1769, "p95_ms": large[0], "cost_per_million_usd": large[1]},
+    ]
+    assert tune.pick(candidates, "latency", 0.1, None)["memory_size"] == 1769
+    assert tune.pick(candidates, "cost", 0.1, None)["memory_size"] == 128
@@ -0,0 +1,64 @@
+import random
+
+import warm_start
+
+
+class FakeSecretCache:
+    def __init__(self):
+        self.fetches = 0
+        self.value = None
+
+    def get(self):
+        self.fetches += 1
+        self.value = {"sn_instance": f"dev{self.fetches}"}
+        return self.value
+
+    def invalidate(self):
+        self.value = None
+
+
+class FakeHttp:
+    def __init__(self):
+        self.prewarmed = []
+        self.closed = 0
+
+    def prewarm(self, urls, connections=1):
+        self.prewarmed.append(urls)
+
+    def close(self):
+        self.closed += 1
+
+
+def test_snapshot_drops_secret_and_sockets_and_restore_rebuilds_them(monkeypatch):
+    secrets, http = FakeSecretCache(), FakeHttp()
+    monkeypatch.setattr(warm_start, "get_secret_cache", lambda: secrets)
+    monkeypatch.setattr(warm_start, "SNAPSTART", True)
+    monkeypatch.setattr(warm_start, "EAGER_INIT", True)
+    monkeypatch.setattr(warm_start, "PREWARM_CONNECTIONS", True)
+    monkeypatch.setattr(warm_start, "_BEFORE_SNAPSHOT", [])
+    monkeypatch.setattr(warm_start, "_AFTER_RESTORE", [])
+
+    warm_start.init([], http, lambda s: [f"https://{s['sn_instance']}.service-now.com/"])
+    assert http.prewarmed == [["https://dev1.service-now.com/"]]
+
+    warm_start.run_before_snapshot()
+    assert secrets.value is None and http.closed == 1
+
+    random.seed(1)
+    snapshot_state = random.getstate()
+    warm_start.run_after_restore()
+    assert http.prewarmed[-1] == ["https://dev2.service-now.com/"]  # fresh secret after restore
+    assert random.getstate() != snapshot_state  # jitter and trace IDs differ per restored environment
+
+
+def test_failed_warm_up_does_not_fail_init(monkeypatch):
+    class Unreachable(FakeSecretCache):
+        def get(self):
+            raise RuntimeError("no network")
+
+    monkeypatch.setattr(warm_start, "get_secret_cache", Unreachable)
+    monkeypatch.setattr(warm_start, "EAGER_INIT", True)
+    monkeypatch.setattr(warm_start, "_BEFORE_SNAPSHOT", [])
+    monkeypatch.setattr(warm_start, "_AFTER_RESTORE", [])
+    warm_start.init([], FakeHttp(), lambda s: [])
+    warm_start.run_after_restore()
@@ -0,0 +1,185 @@
+import json
+import time
+
+import pytest
+
+import servicenow_client
+import worker_middleware_lambda as worker
+from benchmarks.standins import SecretsManagerStub
+from idempotency import IdempotencyStore
+from secret_cache import SecretCache
+from servicenow_client import ServiceNowClient
+from single_flight import SingleFlight
+from state_store import MemoryStore
+from tests.unit.fakes import FakeHttp
+from ticket_cache import TicketCache
+
+
+class FakeServiceNow:
+    """Incident table behind a FakeHttp: numberIN queries and PATCH by sys_id.
+
+    Queries naming one of `rejected` fail with a 400.
+    """
+
+    def __init__(self, *incidents, rejected=()):
+        self.incidents = {i["sys_id"]: dict(i) for i in incidents}
+        self.rejected = set(rejected)
+        self.http = FakeHttp(self.handle)
+
+    def handle(self, method, path, query, body):
+        if method == "GET":
+            numbers = query["sysparm_query"][0][len("numberIN"):].split(",")
+            if self.rejected & set(numbers):
+                return 400, {"error": {"message": "Invalid query"}}
+            return 200, {"result": [i for i in self.incidents.values() if i["number"] in numbers]}
+        incident = self.incidents.get(path.rsplit("/", 1)[1])
+        if incident is None:
+            return 404, {"error": {"message": "No Record found"}}
+        incident["state"] = {"7": "Closed"}.get(body.get("state"), incident["state"])
+        return 200, {"result": {k: incident[k] for k in query["sysparm_fields"][0].split(",")}}
+
+    def client(self):
+        return ServiceNowClient("dev", "u", "p", self.http)
+
+
+@pytest.fixture
+def replies(monkeypatch):
+    monkeypatch.setattr(servicenow_client, "_BATCH_UNSUPPORTED", set())
+    sent = []
+    monkeypatch.setattr(worker, "send_slack_response", lambda url, text: sent.append(text))
+    return sent
+
+
+def fresh_state():
+    return TicketCache(MemoryStore()), SingleFlight(MemoryStore())
+
+
+def command(action, user_id, **tickets):
+    return {"action": action, "user_id": user_id, "response_url": "https://hooks.slack.com/x", **tickets}
+
+
+def handle(monkeypatch, servicenow, payloads):
+    """Run the worker's lambda_handler on one SQS batch of `payloads` against `servicenow`."""
+    cache, flights = fresh_state()
+    secrets = SecretCache("worker", client=SecretsManagerStub({"sn_instance": "dev", "sn_user": "u", "sn_pass": "p"}))
+    monkeypatch.setattr(worker, "get_secret_cache", lambda: secrets)
+    monkeypatch.setattr(worker, "servicenow_http", lambda secrets: servicenow.http)
+    monkeypatch.setattr(worker, "TICKET_CACHE", cache)
+    monkeypatch.setattr(worker, "FLIGHTS", flights)
+    monkeypatch.setattr(worker, "IDEMPOTENCY", IdempotencyStore("test", store=MemoryStore()))
+    records = [{"messageId": f"m{n}", "body": json.dumps(p), "attributes": {}} for n, p in enumerate(payloads)]
+    return worker.lambda_handler({"Records": records}, None)
+
+
+def test_resolves_for_the_same_ticket_replay_the_update_in_queue_order(replies):
+    servicenow = FakeServiceNow({"number": "INC1", "sys_id": "s1", "state": "New", "short_description": ""})
+    payloads = [
+        command("/ops-resolve", "UA", ticket_number="INC1"),
+        command("/ops-resolve", "UB", ticket_number="INC1"),
+        command("/ops-status", "UC", ticket_number="INC1"),
+    ]
+
+    tickets = worker.TicketBatch.load(servicenow.client(), payloads, *fresh_state())
+
+    assert [worker.process_message(p, tickets) for p in payloads] == ["ok", "already_resolved", "ok"]
+    assert [method for method, _ in servicenow.http.requests] == ["GET", "PATCH"]
+    assert "UA" in replies[1] and "Closed" in replies[2]
+
+
+def test_a_stale_cached_sys_id_answers_not_found(replies):
+    servicenow = FakeServiceNow()
+    cache, flights = fresh_state()
+    cache.put({"number": "INC2", "sys_id": "deleted", "state": "New", "short_description": ""})
+    cache.invalidate("INC2")
+    payload = command("/ops-resolve", "UA", ticket_number="INC2")
+
+    tickets = worker.TicketBatch.load(servicenow.client(), [payload], cache, flights)
+
+    assert servicenow.http.requests == [("PATCH", "/api/now/table/incident/deleted")]
+    assert worker.process_message(payload, tickets) == "not_found"
+    assert "INC2" in replies[0]
+    assert cache.get_many(["INC2"]) == ({}, {})
+
+
+def test_a_resolve_by_cached_sys_id_keeps_the_summary_for_later_status_checks(replies):
+    servicenow = FakeServiceNow({"number": "INC1", "sys_id": "s1", "state": "New", "short_description": "Disk full"})
+    cache, flights = fresh_state()
+    cache.put(servicenow.incidents["s1"])
+    cache.invalidate("INC1")
+    resolve = command("/ops-resolve", "UA", ticket_number="INC1")
+    status = command("/ops-status", "UB", ticket_number="INC1")
+
+    tickets = worker.TicketBatch.load(servicenow.client(), [resolve], cache, flights)
+    worker.process_message(resolve, tickets)
+    tickets = worker.TicketBatch.load(servicenow.client(), [status], cache, flights)
+    worker.process_message(status, tickets)
+
+    assert [method for method, _ in servicenow.http.requests] == ["PATCH"]
+    assert cache.get("INC1")["short_description"] == "Disk full"
+    assert "Disk full" in replies[1]
+
+
+def test_contended_resolves_wait_under_one_deadline(monkeypatch, replies):
+    monkeypatch.setattr(worker, "WAIT_SECONDS", 0.3)
+    servicenow = FakeServiceNow(*({"number": n, "sys_id": n.lower(), "state": "New", "short_description": ""}
+                                  for n in ("INC1", "INC2", "INC3")))
+    cache, flights = fresh_state()
+    # Another invocation holds INC1 and INC2 and does not finish in time
+    flights.acquire("/ops-resolve", "INC1", "UX")
+    flights.acquire("/ops-resolve", "INC2", "UX")
+    payload = command("/ops-resolve", "UA", ticket_numbers=["INC1", "INC2", "INC3"])
+
+    started = time.monotonic()
+    tickets = worker.TicketBatch.load(servicenow.client(), [payload], cache, flights)
+
+    assert time.monotonic() - started < 0.55
+    assert tickets.resolving_by == {"INC1": "UX", "INC2": "UX"}
+    assert worker.process_message(payload, tickets) == "ok"
+    assert [method for method, _ in servicenow.http.requests] == ["GET", "PATCH"]
+
+
+def test_a_bulk_resolve_and_a_single_resolve_of_the_same_ticket_run_in_queue_order(monkeypatch, replies):
+    servicenow = FakeServiceNow(*({"number": n, "sys_id": n.lower(), "state": "New", "short_description": ""}
+                                  for n in ("INC1", "INC2", "INC3")))
+    payloads = [
+        command("/ops-resolve", "UA", ticket_numbers=["INC1", "INC2"]),
+        command("/ops-resolve", "UB", ticket_number="INC1"),
+        command("/ops-status", "UC", ticket_number="INC3"),
+    ]
+    records = [{"messageId": f"m{n}", "body": json.dumps(p)} for n, p in enumerate(payloads)]
+    groups = worker.ticket_groups(records)
+    assert groups["m0"] == groups["m1"] != groups["m2"]
+
+    assert handle(monkeypatch, servicenow, payloads) == {"batchItemFailures": []}
+
+    bulk = next(text for text in replies if "INC2" in text)
+    assert "❌" not in bulk
+    assert any(text.startswith("⚠️ INC1 was already resolved by") and "UA" in text for text in replies)
+
+
+def test_a_ticket_reopened_after_a_slack_resolve_can_be_resolved_again(replies):
+    servicenow = FakeServiceNow({"number": "INC1", "sys_id": "s1", "state": "New", "short_description": ""})
+    cache, flights = fresh_state()
+    first = command("/ops-resolve", "UA", ticket_number="INC1")
+    tickets = worker.TicketBatch.load(servicenow.client(), [first], cache, flights)
+    assert worker.process_message(first, tickets) == "ok"
+
+    # Reopened in ServiceNow while UA's done lease is still remembered; the worker looks it up again
+    servicenow.incidents["s1"]["state"] = "In Progress"
+    cache.invalidate("INC1", forget_sys_id=True)
+    second = command("/ops-resolve", "UB", ticket_number="INC1")
+    tickets = worker.TicketBatch.load(servicenow.client(), [second], cache, flights)
+
+    assert worker.process_message(second, tickets) == "ok"
+    assert [method for method, _ in servicenow.http.requests] == ["GET", "PATCH", "GET", "PATCH"]
+    assert "already" not in replies[1]
+    assert flights.holder("/ops-resolve", "INC1") == {"owner": "UB", "done": True}
+
+
+def test_a_failing_lookup_only_fails_the_records_of_its_ticket(monkeypatch, replies):
+    servicenow = FakeServiceNow({"number": "INC1", "sys_id": "s1", "state": "New", "short_description": "Disk full"},
+                                rejected=["INC9"])
+    payloads = [command("/ops-status", "UA", ticket_number="INC1"), command("/ops-status", "UB", ticket_number="INC9")]
+
+    assert handle(monkeypatch, servicenow, payloads) == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+    assert len(replies) == 1 and "Disk full" in replies[0]